@@ -0,0 +1,107 @@
+// MolMod is a collection of molecular modelling tools for python.
+// Copyright (C) 2007 - 2019 Toon Verstraelen <Toon.Verstraelen@UGent.be>, Center
+// for Molecular Modeling (CMM), Ghent University, Ghent, Belgium; all rights
+// reserved unless otherwise stated.
+//
+// This file is part of MolMod.
+//
+// MolMod is free software; you can redistribute it and/or
+// modify it under the terms of the GNU General Public License
+// as published by the Free Software Foundation; either version 3
+// of the License, or (at your option) any later version.
+//
+// MolMod is distributed in the hope that it will be useful,
+// but WITHOUT ANY WARRANTY; without even the implied warranty of
+// MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+// GNU General Public License for more details.
+//
+// You should have received a copy of the GNU General Public License
+// along with this program; if not, see <http://www.gnu.org/licenses/>
+//
+// --
+
+
+
+#include "binning.h"
+
+#include "common.h"
+
+
+static long binning_find_cell(size_t ncell, long *ids, long id) {
+  /* Binary search for a linear cell index in a sorted array. Returns -1 if the
+     cell is not occupied. */
+  size_t low, high, mid;
+  low = 0;
+  high = ncell;
+  while (low < high) {
+    mid = (low + high)/2;
+    if (ids[mid] < id) {
+      low = mid + 1;
+    } else {
+      high = mid;
+    }
+  }
+  if ((low < ncell) && (ids[low] == id)) return low;
+  return -1;
+}
+
+
+size_t binning_pair_search(double *cor0, long *order0, size_t ncell0, long *keys0,
+                           long *start0, long *count0, double *cor1, long *order1,
+                           size_t ncell1, long *ids1, long *start1, long *count1,
+                           long *origin1, long *shape1, long *periodic, size_t nshift,
+                           long *shifts, double cutoff, int intra, double *matrix,
+                           double *reciprocal, size_t capacity, long *pairs,
+                           double *deltas, double *distances) {
+  size_t c0, s, k, counter;
+  long c1, key[3], id, i0, i1, j0, j1;
+  double delta[3], d;
+
+  counter = 0;
+  for (c0 = 0; c0 < ncell0; c0++) {
+    for (s = 0; s < nshift; s++) {
+      /* Locate the neighboring cell in the grid of the second set of points.
+         Periodic directions are wrapped, cells that fall outside the grid in
+         the other directions are empty. */
+      for (k = 0; k < 3; k++) {
+        key[k] = keys0[3*c0 + k] + shifts[3*s + k] - origin1[k];
+        if (periodic[k]) {
+          key[k] %= shape1[k];
+          if (key[k] < 0) key[k] += shape1[k];
+        } else if ((key[k] < 0) || (key[k] >= shape1[k])) {
+          break;
+        }
+      }
+      if (k < 3) continue;
+      id = (key[0]*shape1[1] + key[1])*shape1[2] + key[2];
+      c1 = binning_find_cell(ncell1, ids1, id);
+      if (c1 < 0) continue;
+      /* Loop over all pairs of points in both cells. */
+      for (j0 = start0[c0]; j0 < start0[c0] + count0[c0]; j0++) {
+        i0 = order0[j0];
+        for (j1 = start1[c1]; j1 < start1[c1] + count1[c1]; j1++) {
+          i1 = order1[j1];
+          if (intra && (i1 >= i0)) continue;
+          if (matrix == NULL) {
+            d = distance_delta(cor1 + 3*i1, cor0 + 3*i0, delta);
+          } else {
+            d = distance_delta_periodic(cor1 + 3*i1, cor0 + 3*i0, delta, matrix, reciprocal);
+          }
+          if (d > cutoff) continue;
+          /* Only store the result when it fits in the output arrays. The
+             caller can retry with a larger capacity if needed. */
+          if (counter < capacity) {
+            pairs[2*counter] = i0;
+            pairs[2*counter + 1] = i1;
+            deltas[3*counter] = delta[0];
+            deltas[3*counter + 1] = delta[1];
+            deltas[3*counter + 2] = delta[2];
+            distances[counter] = d;
+          }
+          counter++;
+        }
+      }
+    }
+  }
+  return counter;
+}
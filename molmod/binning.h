@@ -0,0 +1,39 @@
+// MolMod is a collection of molecular modelling tools for python.
+// Copyright (C) 2007 - 2019 Toon Verstraelen <Toon.Verstraelen@UGent.be>, Center
+// for Molecular Modeling (CMM), Ghent University, Ghent, Belgium; all rights
+// reserved unless otherwise stated.
+//
+// This file is part of MolMod.
+//
+// MolMod is free software; you can redistribute it and/or
+// modify it under the terms of the GNU General Public License
+// as published by the Free Software Foundation; either version 3
+// of the License, or (at your option) any later version.
+//
+// MolMod is distributed in the hope that it will be useful,
+// but WITHOUT ANY WARRANTY; without even the implied warranty of
+// MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+// GNU General Public License for more details.
+//
+// You should have received a copy of the GNU General Public License
+// along with this program; if not, see <http://www.gnu.org/licenses/>
+//
+// --
+
+
+
+#ifndef MOLMOD_BINNING_H_
+#define MOLMOD_BINNING_H_
+
+
+#include <stddef.h>
+
+size_t binning_pair_search(double *cor0, long *order0, size_t ncell0, long *keys0,
+                           long *start0, long *count0, double *cor1, long *order1,
+                           size_t ncell1, long *ids1, long *start1, long *count1,
+                           long *origin1, long *shape1, long *periodic, size_t nshift,
+                           long *shifts, double cutoff, int intra, double *matrix,
+                           double *reciprocal, size_t capacity, long *pairs,
+                           double *deltas, double *distances);
+
+#endif  // MOLMOD_BINNING_H_
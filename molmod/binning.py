@@ -40,11 +40,28 @@ import numpy as np
 from molmod.unit_cells import UnitCell
 
 
-__all__ = ["PairSearchIntra", "PairSearchInter"]
+__all__ = ["PairSearchIntra", "PairSearchInter", "VerletList"]
 
 
 class Binning(object):
-    """Division of coordinates in regular bins"""
+    """Division of coordinates in regular bins
+
+       The bins are stored as a few integer arrays. The coordinates are sorted
+       by the linear index of the bin they belong to, which results in the
+       following attributes:
+
+       * ``order``  --  the permutation that sorts the coordinates by bin
+       * ``cell_ids``  --  the sorted linear indexes of the occupied bins
+       * ``cell_keys``  --  the integer grid coordinates of the occupied bins
+       * ``cell_start``  --  the position of the first coordinate of each
+         occupied bin in ``order``
+       * ``cell_count``  --  the number of coordinates in each occupied bin
+
+       The linear index of a bin with integer grid coordinates ``key`` is
+       computed from ``key - origin`` in a grid with the given ``shape``. In
+       periodic directions, the keys are wrapped into the range
+       ``[0, shape[k])`` and the origin is zero.
+    """
     def __init__(self, coordinates, cutoff, grid_cell, integer_cell=None):
         """Initialize a Binning object
 
@@ -52,9 +69,10 @@ class Binning(object):
             | ``coordinates``  --  a Nx3 numpy array with coordinates to be
                                    triaged into bins
             | ``cutoff``  --  The maximum distance between coordinates pairs.
-                              This affects the variable self.neighbor_bins,
-                              which is a set of relative integer bin coordinates
-                              that lie within the cuttof of the central bin.
+                              This affects the variable self.neighbor_indexes,
+                              which is an array of relative integer bin
+                              coordinates that lie within the cuttof of the
+                              central bin.
             | ``grid_cell``  --  A unit cell  object specifying the size and
                                  shape of the bins
 
@@ -65,19 +83,30 @@ class Binning(object):
         self.grid_cell = grid_cell
         self.integer_cell = integer_cell
 
-        # setup the bins
-        self._bins = {}
-
-        fractional = grid_cell.to_fractional(coordinates)
-        for i in range(len(coordinates)):
-            key = tuple(fractional[i].astype(int))
-            if integer_cell is not None:
-                key = self.wrap_key(key)
-            bin = self._bins.get(key)
-            if bin is None:
-                bin = []
-                self._bins[key] = bin
-            bin.append((i, coordinates[i]))
+        # assign the coordinates to bins
+        keys = np.floor(grid_cell.to_fractional(coordinates)).astype(int).reshape(-1, 3)
+        self.periodic = np.zeros(3, int)
+        self.origin = np.zeros(3, int)
+        self.shape = np.ones(3, int)
+        for k in range(3):
+            if integer_cell is not None and integer_cell.active[k]:
+                matrix = integer_cell.matrix
+                if abs(matrix[:, k]).sum() != abs(matrix[k, k]):
+                    raise ValueError("The unit cell vectors must be parallel to "
+                                     "the grid cell vectors.")
+                self.periodic[k] = True
+                self.shape[k] = abs(int(matrix[k, k]))
+                keys[:, k] %= self.shape[k]
+            elif len(keys) > 0:
+                self.origin[k] = keys[:, k].min()
+                self.shape[k] = keys[:, k].max() - self.origin[k] + 1
+
+        # sort the coordinates by bin
+        ids = self.get_ids(keys)
+        self.order = ids.argsort(kind='mergesort')
+        self.cell_ids, self.cell_start, self.cell_count = np.unique(
+            ids[self.order], return_index=True, return_counts=True)
+        self.cell_keys = np.ascontiguousarray(keys[self.order[self.cell_start]])
 
         # compute the neigbouring bins within the cutoff
         if self.integer_cell is None:
@@ -87,28 +116,38 @@ class Binning(object):
             max_ranges[True^self.integer_cell.active] = -1
             self.neighbor_indexes = grid_cell.get_radius_indexes(cutoff, max_ranges)
 
+    def get_ids(self, keys):
+        """Compute linear bin indexes for an array of integer bin coordinates
+
+           Keys outside the grid (after wrapping in the periodic directions)
+           get the index -1.
+        """
+        keys = np.array(keys, int).reshape(-1, 3)
+        keys -= self.origin
+        mask = self.periodic.astype(bool)
+        keys[:, mask] %= self.shape[mask]
+        ids = (keys[:, 0]*self.shape[1] + keys[:, 1])*self.shape[2] + keys[:, 2]
+        ids[((keys < 0) | (keys >= self.shape)).any(axis=1)] = -1
+        return ids
+
     def __iter__(self):
-        """Iterate over (key,bin) pairs"""
-        return iter(self._bins.items())
+        """Iterate over (key, indexes) pairs
+
+           The key is a tuple with the integer grid coordinates of a bin and
+           indexes is an array with the indexes of the coordinates in that bin.
+        """
+        for key, start, count in zip(self.cell_keys, self.cell_start, self.cell_count):
+            yield tuple(key), self.order[start:start+count]
 
     def iter_surrounding(self, center_key):
         """Iterate over all bins surrounding the given bin"""
-        for shift in self.neighbor_indexes:
-            key = tuple(np.add(center_key, shift).astype(int))
-            if self.integer_cell is not None:
-                key = self.wrap_key(key)
-            bin = self._bins.get(key)
-            if bin is not None:
-                yield key, bin
-
-    def wrap_key(self, key):
-        """Translate the key into the central cell
-
-           This method is only applicable in case of a periodic system.
-        """
-        return tuple(np.round(
-            self.integer_cell.shortest_vector(key)
-        ).astype(int))
+        ids = self.get_ids(np.add(center_key, self.neighbor_indexes))
+        cells = self.cell_ids.searchsorted(ids)
+        cells[cells == len(self.cell_ids)] = 0
+        for id, cell in zip(ids, cells):
+            if id >= 0 and self.cell_ids[cell] == id:
+                start = self.cell_start[cell]
+                yield tuple(self.cell_keys[cell]), self.order[start:start+self.cell_count[cell]]
 
 
 class PairSearchBase(object):
@@ -151,6 +190,26 @@ class PairSearchBase(object):
 
         return grid_cell, integer_cell
 
+    def _pair_search(self, coordinates0, bins0, coordinates1, bins1, intra):
+        """Compute all pairs within the cutoff with the compiled kernel"""
+        from molmod.ext import binning_pair_search
+        if len(coordinates0) == 0 or len(coordinates1) == 0:
+            return np.zeros((0, 2), int), np.zeros((0, 3), float), np.zeros(0, float)
+        if self.unit_cell is None:
+            matrix = None
+            reciprocal = None
+        else:
+            matrix = np.ascontiguousarray(self.unit_cell.matrix, float)
+            reciprocal = np.ascontiguousarray(self.unit_cell.reciprocal, float)
+        return binning_pair_search(
+            np.ascontiguousarray(coordinates0, float), bins0.order, bins0.cell_keys,
+            bins0.cell_start, bins0.cell_count,
+            np.ascontiguousarray(coordinates1, float), bins1.order, bins1.cell_ids,
+            bins1.cell_start, bins1.cell_count, bins1.origin, bins1.shape,
+            bins1.periodic, np.ascontiguousarray(bins0.neighbor_indexes),
+            self.cutoff, intra, matrix, reciprocal
+        )
+
 
 class PairSearchIntra(PairSearchBase):
     """Iterator over all pairs of coordinates with a distance below a cutoff.
@@ -191,25 +250,30 @@ class PairSearchIntra(PairSearchBase):
                 as possible, with spacings below cutoff/2 that are integer
                 divisions of the unit cell spacings
         """
+        self.coordinates = coordinates
         self.cutoff = cutoff
         self.unit_cell = unit_cell
-        grid_cell, integer_cell = self._setup_grid(cutoff, unit_cell, grid)
-        self.bins = Binning(coordinates, cutoff, grid_cell, integer_cell)
+        self.grid_cell, self.integer_cell = self._setup_grid(cutoff, unit_cell, grid)
+        self.bins = Binning(coordinates, cutoff, self.grid_cell, self.integer_cell)
+
+    def arrays(self):
+        """Compute all pairs with a distance below the cutoff in one call
+
+           Returns: ``pairs``, ``deltas``, ``distances``
+
+           ``pairs`` is an integer array with shape (npair, 2). Each row
+           contains two indexes, i0 and i1, with i0 > i1. ``deltas`` is an array
+           with shape (npair, 3) with the relative vectors from i0 to i1 and
+           ``distances`` contains the corresponding norms.
+        """
+        return self._pair_search(
+            self.coordinates, self.bins, self.coordinates, self.bins, True)
 
     def __iter__(self):
         """Iterate over all pairs with a distance below the cutoff"""
-        for key0, bin0 in self.bins:
-            for key1, bin1 in self.bins.iter_surrounding(key0):
-                for i0, c0 in bin0:
-                    for i1, c1 in bin1:
-                        if i1 >= i0:
-                            continue
-                        delta = c1 - c0
-                        if self.unit_cell is not None:
-                            delta = self.unit_cell.shortest_vector(delta)
-                        distance = np.linalg.norm(delta)
-                        if distance <= self.cutoff:
-                            yield i0, i1, delta, distance
+        pairs, deltas, distances = self.arrays()
+        for (i0, i1), delta, distance in zip(pairs, deltas, distances):
+            yield i0, i1, delta, distance
 
 class PairSearchInter(PairSearchBase):
     """Iterator over all pairs of coordinates with a distance below a cutoff.
@@ -251,21 +315,110 @@ class PairSearchInter(PairSearchBase):
                 as possible, with spacings below cutoff/2 that are integer
                 divisions of the unit cell spacings
         """
+        self.coordinates0 = coordinates0
+        self.coordinates1 = coordinates1
         self.cutoff = cutoff
         self.unit_cell = unit_cell
-        grid_cell, integer_cell = self._setup_grid(cutoff, unit_cell, grid)
-        self.bins0 = Binning(coordinates0, cutoff, grid_cell, integer_cell)
-        self.bins1 = Binning(coordinates1, cutoff, grid_cell, integer_cell)
+        self.grid_cell, self.integer_cell = self._setup_grid(cutoff, unit_cell, grid)
+        self.bins0 = Binning(coordinates0, cutoff, self.grid_cell, self.integer_cell)
+        self.bins1 = Binning(coordinates1, cutoff, self.grid_cell, self.integer_cell)
+
+    def arrays(self):
+        """Compute all pairs with a distance below the cutoff in one call
+
+           Returns: ``pairs``, ``deltas``, ``distances``
+
+           ``pairs`` is an integer array with shape (npair, 2). Each row
+           contains an index i0 in coordinates0 and an index i1 in
+           coordinates1. ``deltas`` is an array with shape (npair, 3) with the
+           relative vectors from i0 to i1 and ``distances`` contains the
+           corresponding norms.
+        """
+        return self._pair_search(
+            self.coordinates0, self.bins0, self.coordinates1, self.bins1, False)
 
     def __iter__(self):
         """Iterate over all pairs with a distance below the cutoff"""
-        for key0, bin0 in self.bins0:
-            for key1, bin1 in self.bins1.iter_surrounding(key0):
-                for i0, c0 in bin0:
-                    for i1, c1 in bin1:
-                        delta = c1 - c0
-                        if self.unit_cell is not None:
-                            delta = self.unit_cell.shortest_vector(delta)
-                        distance = np.linalg.norm(delta)
-                        if distance <= self.cutoff:
-                            yield i0, i1, delta, distance
+        pairs, deltas, distances = self.arrays()
+        for (i0, i1), delta, distance in zip(pairs, deltas, distances):
+            yield i0, i1, delta, distance
+
+
+class VerletList(object):
+    """Neighbor list with a skin that is only rebuilt when needed.
+
+       Example usage::
+
+           verlet_list = VerletList(2.5, 0.5)
+           for coordinates in trajectory:
+               pairs, deltas, distances = verlet_list.update(coordinates)
+
+       The candidate pairs are searched with :class:`PairSearchIntra` using a
+       cutoff of ``cutoff + skin``. As long as no atom moved more than half of
+       the skin since the last search, all pairs within the cutoff are among
+       the candidates and only their relative vectors have to be recomputed.
+       Note that for periodic systems the minimum image convention is applied.
+    """
+
+    def __init__(self, cutoff, skin, unit_cell=None, grid=None):
+        """
+           Arguments:
+            | ``cutoff``  --  The cutoff radius for the pair distances.
+            | ``skin``  --  The additional margin used for the candidate pairs.
+
+           Optional arguments:
+            | ``unit_cell``  --  Specifies the periodic boundary conditions
+            | ``grid``  --  Specification of the grid, see
+                            :class:`PairSearchIntra`.
+        """
+        if skin < 0:
+            raise ValueError("The skin must not be negative.")
+        self.cutoff = cutoff
+        self.skin = skin
+        self.unit_cell = unit_cell
+        self.grid = grid
+        self.num_builds = 0
+        self._reference = None
+        self._pairs = None
+
+    def _build(self, coordinates):
+        """Search all candidate pairs from scratch"""
+        pair_search = PairSearchIntra(
+            coordinates, self.cutoff + self.skin, self.unit_cell, self.grid)
+        self._pairs = pair_search.arrays()[0]
+        self._reference = coordinates.copy()
+        self.num_builds += 1
+
+    def needs_rebuild(self, coordinates):
+        """Check if the candidate pairs must be searched again
+
+           This is the case when the number of atoms changed or when an atom
+           moved more than half of the skin since the last build.
+        """
+        if self._reference is None or self._reference.shape != coordinates.shape:
+            return True
+        displacements = coordinates - self._reference
+        if self.unit_cell is not None:
+            displacements = self.unit_cell.shortest_vector(displacements)
+        return (displacements**2).sum(axis=1).max() > (0.5*self.skin)**2
+
+    def update(self, coordinates):
+        """Compute all pairs with a distance below the cutoff
+
+           Argument:
+            | ``coordinates``  --  A Nx3 numpy array with Cartesian coordinates
+
+           Returns: ``pairs``, ``deltas``, ``distances``, with the same
+           conventions as :meth:`PairSearchIntra.arrays`.
+        """
+        coordinates = np.asarray(coordinates, float)
+        if len(coordinates) == 0:
+            return np.zeros((0, 2), int), np.zeros((0, 3), float), np.zeros(0, float)
+        if self.needs_rebuild(coordinates):
+            self._build(coordinates)
+        deltas = coordinates[self._pairs[:, 1]] - coordinates[self._pairs[:, 0]]
+        if self.unit_cell is not None:
+            deltas = self.unit_cell.shortest_vector(deltas)
+        distances = np.sqrt((deltas**2).sum(axis=1))
+        mask = distances <= self.cutoff
+        return self._pairs[mask], deltas[mask], distances[mask]
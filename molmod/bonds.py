@@ -46,6 +46,8 @@ from __future__ import division
 from builtins import range
 import pkg_resources
 
+import numpy as np
+
 from molmod.periodic import periodic
 import molmod.units as units
 
@@ -85,6 +87,7 @@ class BondData(object):
             in self.lengths.values()
             if len(lengths) > 0
         )
+        self._build_length_table()
 
     def _load_bond_data(self):
         """Load the bond data from the given file
@@ -139,6 +142,61 @@ class BondData(object):
                         dataset[pair] = (atom1.covalent_radius + atom2.covalent_radius)
                     #print "%3i  %3i  %s %30s %30s" % (n1, n2, dataset.get(pair), atom1, atom2)
 
+    def _build_length_table(self):
+        """Store all bond lengths in an array for vectorized lookups
+
+           The array ``self.length_table`` has shape (len(bond_types), N, N),
+           where N-1 is the highest atom number in the database. Element
+           ``[i, n1, n2]`` is the length of a bond of type ``bond_types[i]``
+           between atoms with numbers n1 and n2, or NaN if it is not known.
+           The array ``self.threshold_table`` has shape (N, N) and contains the
+           longest distance at which two atoms can still be bonded, or zero if
+           no bond length is known.
+        """
+        size = max(
+            max(pair) for lengths in self.lengths.values() for pair in lengths
+        ) + 1
+        self.length_table = np.zeros((len(bond_types), size, size), float)
+        self.length_table[:] = np.nan
+        for i, bond_type in enumerate(bond_types):
+            for pair, length in self.lengths[bond_type].items():
+                if len(pair) == 1:
+                    n1, = pair
+                    n2 = n1
+                else:
+                    n1, n2 = pair
+                self.length_table[i, n1, n2] = length
+                self.length_table[i, n2, n1] = length
+        self.threshold_table = np.nan_to_num(self.length_table).max(axis=0)*self.bond_tolerance
+
+    def bonded_array(self, numbers1, numbers2, distances):
+        """Return the estimated bond types for arrays of atom pairs
+
+           Arguments:
+            | ``numbers1``  --  the atom numbers of the first atoms in the bonds
+            | ``numbers2``  --  the atom numbers of the second atoms in the bonds
+            | ``distances``  --  the distances between the two atoms
+
+           This is a vectorized version of :meth:`bonded`. It returns an integer
+           array with the best matching bond types. Pairs that are not bonded
+           get a zero.
+        """
+        numbers1 = np.asarray(numbers1)
+        numbers2 = np.asarray(numbers2)
+        distances = np.asarray(distances, float)
+        size = self.length_table.shape[1]
+        known = (numbers1 > 0) & (numbers1 < size) & (numbers2 > 0) & (numbers2 < size)
+        lengths = np.zeros((len(bond_types),) + distances.shape, float)
+        lengths[:] = np.nan
+        lengths[:, known] = self.length_table[:, numbers1[known], numbers2[known]]
+        with np.errstate(invalid='ignore'):
+            deviations = abs(lengths - distances)
+            deviations[~(distances < lengths*self.bond_tolerance)] = np.inf
+        best = deviations.argmin(axis=0)
+        result = np.array(bond_types)[best]
+        result[np.isinf(deviations.min(axis=0))] = 0
+        return result
+
     def bonded(self, n1, n2, distance):
         """Return the estimated bond type
 
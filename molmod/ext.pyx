@@ -29,13 +29,84 @@ from __future__ import division
 import numpy as np
 cimport numpy as np
 
+cimport binning
 cimport ff
 cimport graphs
+cimport ic
 cimport molecules
+cimport parsing
 cimport similarity
 cimport unit_cells
 
 
+#
+#  binning.c
+#
+
+def binning_pair_search(double[:, ::1] cor0 not None, long[::1] order0 not None,
+                        long[:, ::1] keys0 not None, long[::1] start0 not None,
+                        long[::1] count0 not None, double[:, ::1] cor1 not None,
+                        long[::1] order1 not None, long[::1] ids1 not None,
+                        long[::1] start1 not None, long[::1] count1 not None,
+                        long[::1] origin1 not None, long[::1] shape1 not None,
+                        long[::1] periodic not None,
+                        long[:, ::1] shifts not None, double cutoff, bint intra,
+                        double[:, ::1] matrix=None, double[:, ::1] reciprocal=None):
+    cdef size_t ncell0 = keys0.shape[0]
+    cdef size_t ncell1 = ids1.shape[0]
+    cdef size_t nshift = shifts.shape[0]
+    if cor0.shape[1] != 3 or cor1.shape[1] != 3:
+        raise TypeError('cor0 and cor1 arguments must have three columns.')
+    if order0.shape[0] != cor0.shape[0] or order1.shape[0] != cor1.shape[0]:
+        raise TypeError('order0 and order1 must have the same length as cor0 and cor1.')
+    if keys0.shape[1] != 3:
+        raise TypeError('keys0 must have three columns.')
+    if start0.shape[0] != ncell0 or count0.shape[0] != ncell0:
+        raise TypeError('start0 and count0 must have shape (ncell0,).')
+    if start1.shape[0] != ncell1 or count1.shape[0] != ncell1:
+        raise TypeError('start1 and count1 must have shape (ncell1,).')
+    if origin1.shape[0] != 3 or shape1.shape[0] != 3 or periodic.shape[0] != 3:
+        raise TypeError('origin1, shape1 and periodic must have shape (3,).')
+    if nshift == 0 or shifts.shape[1] != 3:
+        raise TypeError('shifts must be a non-empty array with three columns.')
+    if (matrix is None) ^ (reciprocal is None):
+        raise TypeError('Either both matrix and reciprocal or given, or both are not given.')
+    if matrix is not None and matrix.shape[0] != 3 and matrix.shape[1] != 3:
+        raise TypeError('matrix must be an array with shape (3, 3)')
+    if reciprocal is not None and reciprocal.shape[0] != 3 and reciprocal.shape[1] != 3:
+        raise TypeError('reciprocal must be an array with shape (3, 3)')
+
+    # Empty sets of points do not have any pairs.
+    if ncell0 == 0 or ncell1 == 0:
+        return np.zeros((0, 2), int), np.zeros((0, 3), float), np.zeros(0, float)
+
+    # Make a first guess of the number of pairs. When it is too small, the
+    # search is repeated with the exact size returned by the first attempt.
+    cdef size_t capacity = 16*max(cor0.shape[0], cor1.shape[0])
+    cdef size_t npair
+    cdef np.ndarray[long, ndim=2] pairs
+    cdef np.ndarray[double, ndim=2] deltas
+    cdef np.ndarray[double, ndim=1] distances
+    cdef double* matrix_ptr = NULL
+    cdef double* reciprocal_ptr = NULL
+    if matrix is not None:
+        matrix_ptr = &matrix[0, 0]
+        reciprocal_ptr = &reciprocal[0, 0]
+    while True:
+        pairs = np.zeros((capacity, 2), int)
+        deltas = np.zeros((capacity, 3), float)
+        distances = np.zeros(capacity, float)
+        npair = binning.binning_pair_search(
+            &cor0[0, 0], &order0[0], ncell0, &keys0[0, 0], &start0[0], &count0[0],
+            &cor1[0, 0], &order1[0], ncell1, &ids1[0], &start1[0], &count1[0],
+            &origin1[0], &shape1[0], &periodic[0], nshift, &shifts[0, 0], cutoff, intra,
+            matrix_ptr, reciprocal_ptr, capacity, &pairs[0, 0], &deltas[0, 0],
+            &distances[0])
+        if npair <= capacity:
+            return pairs[:npair], deltas[:npair], distances[:npair]
+        capacity = npair
+
+
 #
 #  ff.c
 #
@@ -170,6 +241,150 @@ def graphs_floyd_warshall(long[:, ::1] dm):
     graphs.graphs_floyd_warshall(nvertex, &dm[0, 0])
 
 
+def graphs_distances_within(long[::1] indptr not None, long[::1] indices not None,
+                            long max_depth):
+    cdef size_t nvertex = indptr.shape[0] - 1
+    if indptr.shape[0] == 0:
+        raise TypeError('indptr must contain at least one element.')
+    if indices.shape[0] != indptr[nvertex]:
+        raise TypeError('indices must have length indptr[-1].')
+
+    # Make a first guess of the number of pairs. When it is too small, the
+    # search is repeated with the exact size returned by the first attempt.
+    cdef size_t capacity = 4*indices.shape[0]
+    cdef size_t npair
+    cdef np.ndarray[long, ndim=2] pairs
+    cdef np.ndarray[long, ndim=1] distances
+    cdef np.ndarray[long, ndim=1] queue = np.zeros(nvertex+1, int)
+    cdef np.ndarray[long, ndim=1] depth = np.zeros(nvertex+1, int)
+    if indices.shape[0] == 0:
+        return np.zeros((0, 2), int), np.zeros(0, int)
+    while True:
+        pairs = np.zeros((capacity, 2), int)
+        distances = np.zeros(capacity, int)
+        npair = graphs.graphs_distances_within(
+            nvertex, &indptr[0], &indices[0], max_depth, capacity, &pairs[0, 0],
+            &distances[0], &queue[0], &depth[0])
+        if npair <= capacity:
+            return pairs[:npair], distances[:npair]
+        capacity = npair
+
+
+def graphs_eccentricities(long[::1] indptr not None, long[::1] indices not None):
+    cdef size_t nvertex = indptr.shape[0] - 1
+    if indptr.shape[0] == 0:
+        raise TypeError('indptr must contain at least one element.')
+    if indices.shape[0] != indptr[nvertex]:
+        raise TypeError('indices must have length indptr[-1].')
+    cdef np.ndarray[long, ndim=1] eccentricities = np.zeros(nvertex, int)
+    cdef np.ndarray[long, ndim=1] queue = np.zeros(nvertex+1, int)
+    cdef np.ndarray[long, ndim=1] depth = np.zeros(nvertex+1, int)
+    if indices.shape[0] > 0:
+        graphs.graphs_eccentricities(
+            nvertex, &indptr[0], &indices[0], &eccentricities[0], &queue[0],
+            &depth[0])
+    return eccentricities
+
+
+def graphs_components(long[::1] indptr not None, long[::1] indices not None):
+    cdef size_t nvertex = indptr.shape[0] - 1
+    if indptr.shape[0] == 0:
+        raise TypeError('indptr must contain at least one element.')
+    if indices.shape[0] != indptr[nvertex]:
+        raise TypeError('indices must have length indptr[-1].')
+    cdef np.ndarray[long, ndim=1] labels = np.arange(nvertex)
+    cdef np.ndarray[long, ndim=1] queue = np.zeros(nvertex+1, int)
+    if indices.shape[0] > 0:
+        graphs.graphs_components(
+            nvertex, &indptr[0], &indices[0], &labels[0], &queue[0])
+    return labels
+
+
+def graphs_refine_hashes(long[::1] indptr not None, long[::1] indices not None,
+                         np.uint64_t[:, ::1] edge_hashes not None,
+                         np.uint64_t[:, ::1] hashes not None):
+    cdef size_t nvertex = indptr.shape[0] - 1
+    if indptr.shape[0] == 0:
+        raise TypeError('indptr must contain at least one element.')
+    if indices.shape[0] != indptr[nvertex]:
+        raise TypeError('indices must have length indptr[-1].')
+    if edge_hashes.shape[0] != indices.shape[0] or edge_hashes.shape[1] != 2:
+        raise TypeError('edge_hashes must have shape (len(indices), 2).')
+    if hashes.shape[0] != nvertex or hashes.shape[1] != 2:
+        raise TypeError('hashes must have shape (len(indptr)-1, 2).')
+    cdef np.ndarray[np.uint64_t, ndim=2] result = np.zeros((nvertex, 2), np.uint64)
+    if nvertex > 0:
+        graphs.graphs_refine_hashes(
+            nvertex, &indptr[0],
+            &indices[0] if indices.shape[0] > 0 else NULL,
+            &edge_hashes[0, 0] if indices.shape[0] > 0 else NULL,
+            &hashes[0, 0], &result[0, 0])
+    return result
+
+
+#
+# ic.c
+#
+
+
+ic_kinds = {
+    'bond_length': ic.IC_BOND_LENGTH,
+    'bend_cos': ic.IC_BEND_COS,
+    'bend_angle': ic.IC_BEND_ANGLE,
+    'dihed_cos': ic.IC_DIHED_COS,
+    'dihed_angle': ic.IC_DIHED_ANGLE,
+    'opbend_dist': ic.IC_OPBEND_DIST,
+    'opbend_cos': ic.IC_OPBEND_COS,
+    'opbend_angle': ic.IC_OPBEND_ANGLE,
+    'opbend_mcos': ic.IC_OPBEND_MCOS,
+    'opbend_mangle': ic.IC_OPBEND_MANGLE,
+}
+
+
+def ic_npoint(name):
+    return ic.ic_npoint(ic_kinds[name])
+
+
+def ic_ndet(name):
+    return ic.ic_ndet(ic_kinds[name])
+
+
+def ic_compute(name, const double[:, :, ::1] rs not None, long deriv,
+               const double[:, ::1] dets=None):
+    cdef long kind = ic_kinds[name]
+    cdef size_t nset = rs.shape[0]
+    cdef long npoint = ic.ic_npoint(kind)
+    cdef long ndet = ic.ic_ndet(kind)
+    cdef double[::1] values
+    cdef double[:, :, ::1] gradients = None
+    cdef double[:, :, :, :, ::1] hessians = None
+    cdef int error = 0
+    if deriv < 0 or deriv > 2:
+        raise ValueError('deriv must be 0, 1 or 2.')
+    if rs.shape[1] != npoint or rs.shape[2] != 3:
+        raise TypeError('rs must have shape (nset, %i, 3).' % npoint)
+    if ndet > 0 and (dets is None or dets.shape[0] != nset or dets.shape[1] != ndet):
+        raise TypeError('dets must have shape (nset, %i).' % ndet)
+    values = np.zeros(nset, float)
+    if deriv > 0:
+        gradients = np.zeros((nset, npoint, 3), float)
+    if deriv > 1:
+        hessians = np.zeros((nset, npoint, 3, npoint, 3), float)
+    if nset > 0:
+        error = ic.ic_compute(
+            kind, nset, &rs[0, 0, 0], &dets[0, 0] if ndet > 0 else NULL, deriv,
+            &values[0], &gradients[0, 0, 0] if deriv > 0 else NULL,
+            &hessians[0, 0, 0, 0, 0] if deriv > 1 else NULL)
+    if error < 0:
+        raise ValueError('Invalid arguments for ic_compute.')
+    elif error > 0:
+        raise FloatingPointError('The internal coordinate %s or its derivatives are not finite, '
+                                 'e.g. due to a degenerate geometry.' % name)
+    result = (values.base, None if gradients is None else gradients.base,
+              None if hessians is None else hessians.base)
+    return result[:deriv+1]
+
+
 #
 # molecules.c
 #
@@ -196,6 +411,81 @@ def molecules_distance_matrix(double[:, ::1] cor not None, double[:, ::1] matrix
     return dm
 
 
+#
+# parsing.c
+#
+
+
+def parsing_table(const unsigned char[::1] data not None, long nrow, long[::1] columns not None,
+                  long nskip=0, double[:, ::1] out=None, long[:, ::1] first_words=None):
+    cdef size_t nsel = columns.shape[0]
+    cdef size_t isel
+    cdef long consumed
+    if nrow < 0 or nskip < 0:
+        raise ValueError('nrow and nskip must be positive.')
+    if nsel == 0:
+        raise TypeError('At least one column must be selected.')
+    for isel in range(nsel):
+        if columns[isel] < 0 or (isel > 0 and columns[isel] <= columns[isel-1]):
+            raise ValueError('columns must be positive and strictly increasing.')
+    if out is None:
+        out = np.zeros((nrow, nsel), float)
+    elif out.shape[0] != nrow or out.shape[1] != nsel:
+        raise TypeError('out must have shape (nrow, len(columns)).')
+    if first_words is not None and (first_words.shape[0] != nrow or first_words.shape[1] != 2):
+        raise TypeError('first_words must have shape (nrow, 2).')
+    if nrow == 0:
+        return out.base, 0
+    if data.shape[0] == 0:
+        raise ValueError('Could not parse %i lines.' % nrow)
+    consumed = parsing.parsing_table(<const char*>&data[0], data.shape[0], nrow, nskip, nsel,
+                                     &columns[0], &out[0, 0],
+                                     NULL if first_words is None else &first_words[0, 0])
+    if consumed < 0:
+        raise ValueError('Could not parse %i lines.' % nrow)
+    return out.base, consumed
+
+
+def parsing_fixed(const unsigned char[::1] data not None, long nrecord, long nline, long nfield,
+                  long width, long nskip=0, double[:, ::1] out=None):
+    cdef long consumed
+    if nrecord < 0 or nline < 0 or nskip < 0:
+        raise ValueError('nrecord, nline and nskip must be positive.')
+    if nfield <= 0 or width <= 0:
+        raise ValueError('nfield and width must be strictly positive.')
+    if out is None:
+        out = np.zeros((nrecord*nline, nfield), float)
+    elif out.shape[0] != nrecord*nline or out.shape[1] != nfield:
+        raise TypeError('out must have shape (nrecord*nline, nfield).')
+    if nrecord == 0 or nline == 0:
+        return out.base, 0
+    if data.shape[0] == 0:
+        raise ValueError('Could not parse %i records.' % nrecord)
+    consumed = parsing.parsing_fixed(<const char*>&data[0], data.shape[0], nrecord, nline, nskip,
+                                     nfield, width, &out[0, 0])
+    if consumed < 0:
+        raise ValueError('Could not parse %i records.' % nrecord)
+    return out.base, consumed
+
+
+def parsing_numbers(const unsigned char[::1] data not None, long count, double[::1] out=None):
+    cdef long consumed
+    if count < 0:
+        raise ValueError('count must be positive.')
+    if out is None:
+        out = np.zeros(count, float)
+    elif out.shape[0] != count:
+        raise TypeError('out must have shape (count,).')
+    if count == 0:
+        return out.base, 0
+    if data.shape[0] == 0:
+        raise ValueError('Could not parse %i numbers.' % count)
+    consumed = parsing.parsing_numbers(<const char*>&data[0], data.shape[0], count, &out[0])
+    if consumed < 0:
+        raise ValueError('Could not parse %i numbers.' % count)
+    return out.base, consumed
+
+
 #
 # similarity.c
 #
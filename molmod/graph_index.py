@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+# MolMod is a collection of molecular modelling tools for python.
+# Copyright (C) 2007 - 2019 Toon Verstraelen <Toon.Verstraelen@UGent.be>, Center
+# for Molecular Modeling (CMM), Ghent University, Ghent, Belgium; all rights
+# reserved unless otherwise stated.
+#
+# This file is part of MolMod.
+#
+# MolMod is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# MolMod is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""On-disk index of molecular graphs for fast duplicate detection
+
+   The :class:`GraphIndex` stores the blob representation of molecular graphs
+   in an SQLite database, keyed by their fingerprint. Looking up a graph is a
+   single query on an indexed column. Only when stored graphs have the same
+   fingerprint, the (expensive) isomorphism test ``full_match`` is carried out
+   to rule out hash collisions. Example::
+
+       index = GraphIndex("screening.db")
+       for molecule in molecules:
+           row, added = index.add(molecule.graph)
+           if not added:
+               print("duplicate of", row)
+       index.close()
+"""
+
+
+import sqlite3
+
+from molmod.molecular_graphs import MolecularGraph
+
+
+__all__ = ["GraphIndex"]
+
+
+class GraphIndex(object):
+    """An on-disk map from graph fingerprints to molecular graphs"""
+
+    # Stored in the database to detect files with an incompatible fingerprint.
+    fingerprint_format = "wl128"
+
+    def __init__(self, filename=":memory:"):
+        """
+           Optional argument:
+            | ``filename`` -- The SQLite database file. When not given, the
+                              index is kept in memory.
+        """
+        self._connection = sqlite3.connect(filename)
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS graphs (
+                id INTEGER PRIMARY KEY, fingerprint BLOB NOT NULL, blob TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS graphs_fingerprint ON graphs (fingerprint);
+        """)
+        row = self._connection.execute(
+            "SELECT value FROM meta WHERE key='fingerprint'").fetchone()
+        if row is None:
+            with self._connection:
+                self._connection.execute(
+                    "INSERT INTO meta VALUES ('fingerprint', ?)",
+                    (self.fingerprint_format,))
+        elif row[0] != self.fingerprint_format:
+            raise ValueError("The graph index %s uses fingerprint format %s, "
+                             "expected %s." % (filename, row[0], self.fingerprint_format))
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM graphs").fetchone()[0]
+
+    def __getitem__(self, row):
+        """Return the stored molecular graph with the given row id"""
+        result = self._connection.execute(
+            "SELECT blob FROM graphs WHERE id=?", (row,)).fetchone()
+        if result is None:
+            raise KeyError(row)
+        return MolecularGraph.from_blob(result[0])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Close the database connection"""
+        self._connection.close()
+
+    def _iter_isomorphs(self, graph, fingerprint):
+        """Iterate over the (row, graph) pairs isomorphic to the given graph"""
+        candidates = self._connection.execute(
+            "SELECT id, blob FROM graphs WHERE fingerprint=?", (fingerprint,)
+        ).fetchall()
+        for row, blob in candidates:
+            other = MolecularGraph.from_blob(blob)
+            if other.num_vertices == graph.num_vertices and \
+               other.num_edges == graph.num_edges and \
+               graph.full_match(other) is not None:
+                yield row, other
+
+    def find_isomorphs(self, graph):
+        """Return a list of (row, graph) pairs isomorphic to the given graph
+
+           Argument:
+            | ``graph`` -- A MolecularGraph instance.
+
+           When graphs are only added with :meth:`add`, the list contains at
+           most one element.
+        """
+        return list(self._iter_isomorphs(graph, graph.fingerprint.tobytes()))
+
+    def contains(self, graph):
+        """Return True when an isomorphic graph is present in the index"""
+        for row, other in self._iter_isomorphs(graph, graph.fingerprint.tobytes()):
+            return True
+        return False
+
+    def contains_many(self, graphs):
+        """Return a list of booleans, see :meth:`contains`"""
+        return [self.contains(graph) for graph in graphs]
+
+    def _add(self, graph):
+        """Add a graph without committing, see :meth:`add`"""
+        fingerprint = graph.fingerprint.tobytes()
+        for row, other in self._iter_isomorphs(graph, fingerprint):
+            return row, False
+        cursor = self._connection.execute(
+            "INSERT INTO graphs (fingerprint, blob) VALUES (?, ?)",
+            (fingerprint, graph.blob))
+        return cursor.lastrowid, True
+
+    def add(self, graph):
+        """Add a molecular graph, unless an isomorphic graph is already present
+
+           Argument:
+            | ``graph`` -- A MolecularGraph instance.
+
+           Returns a tuple (row, added), where row is the id of the new or the
+           already present isomorphic graph, and added is False in the latter
+           case.
+        """
+        with self._connection:
+            return self._add(graph)
+
+    def add_many(self, graphs):
+        """Add molecular graphs in a single transaction
+
+           Argument:
+            | ``graphs`` -- An iterable over MolecularGraph instances.
+
+           Returns a list of (row, added) tuples, see :meth:`add`. Duplicates
+           within the given graphs are also detected.
+        """
+        with self._connection:
+            return [self._add(graph) for graph in graphs]
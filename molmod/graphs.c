@@ -48,3 +48,127 @@ void graphs_floyd_warshall(size_t n, long* dm) {
     }
   }
 }
+
+
+static size_t graphs_bfs(long source, long* indptr, long* indices, long max_depth,
+                         long* queue, long* depth) {
+  // Breadth-first search from source up to max_depth (unlimited when
+  // negative). The visited vertices are stored in queue, in the order of
+  // increasing depth, and their depth is stored in the depth array. All
+  // other elements of depth must be -1 on input.
+  size_t head, tail;
+  long i, j, k;
+
+  queue[0] = source;
+  depth[source] = 0;
+  head = 0;
+  tail = 1;
+  while (head < tail) {
+    i = queue[head];
+    head++;
+    if (depth[i] == max_depth) continue;
+    for (k=indptr[i]; k<indptr[i+1]; k++) {
+      j = indices[k];
+      if (depth[j] < 0) {
+        depth[j] = depth[i] + 1;
+        queue[tail] = j;
+        tail++;
+      }
+    }
+  }
+  return tail;
+}
+
+static void graphs_bfs_reset(size_t nvisit, long* queue, long* depth) {
+  size_t k;
+  for (k=0; k<nvisit; k++) depth[queue[k]] = -1;
+}
+
+size_t graphs_distances_within(size_t nvertex, long* indptr, long* indices,
+                               long max_depth, size_t capacity, long* pairs,
+                               long* distances, long* queue, long* depth) {
+  size_t counter, nvisit, k;
+  long i, j;
+
+  for (k=0; k<nvertex; k++) depth[k] = -1;
+  counter = 0;
+  for (i=0; i<(long)nvertex; i++) {
+    nvisit = graphs_bfs(i, indptr, indices, max_depth, queue, depth);
+    for (k=1; k<nvisit; k++) {
+      j = queue[k];
+      if (j < i) continue;
+      if (counter < capacity) {
+        pairs[2*counter] = i;
+        pairs[2*counter+1] = j;
+        distances[counter] = depth[j];
+      }
+      counter++;
+    }
+    graphs_bfs_reset(nvisit, queue, depth);
+  }
+  return counter;
+}
+
+void graphs_eccentricities(size_t nvertex, long* indptr, long* indices,
+                           long* eccentricities, long* queue, long* depth) {
+  size_t k, nvisit;
+  long i;
+
+  for (k=0; k<nvertex; k++) depth[k] = -1;
+  for (i=0; i<(long)nvertex; i++) {
+    nvisit = graphs_bfs(i, indptr, indices, -1, queue, depth);
+    // the last vertex in the queue is one of the most distant ones.
+    eccentricities[i] = depth[queue[nvisit-1]];
+    graphs_bfs_reset(nvisit, queue, depth);
+  }
+}
+
+void graphs_components(size_t nvertex, long* indptr, long* indices, long* labels,
+                       long* queue) {
+  size_t k, nvisit, nlabel;
+  long i;
+
+  for (k=0; k<nvertex; k++) labels[k] = -1;
+  nlabel = 0;
+  for (i=0; i<(long)nvertex; i++) {
+    if (labels[i] >= 0) continue;
+    // labels serves as the depth array of the BFS.
+    nvisit = graphs_bfs(i, indptr, indices, -1, queue, labels);
+    for (k=0; k<nvisit; k++) labels[queue[k]] = nlabel;
+    nlabel++;
+  }
+}
+
+
+static uint64_t graphs_mix(uint64_t x) {
+  // The finalizer of splitmix64, a cheap bijective mixing function.
+  x ^= x >> 30;
+  x *= 0xbf58476d1ce4e5b9ULL;
+  x ^= x >> 27;
+  x *= 0x94d049bb133111ebULL;
+  x ^= x >> 31;
+  return x;
+}
+
+void graphs_refine_hashes(size_t nvertex, long* indptr, long* indices,
+                          uint64_t* edge_hashes, uint64_t* hashes_in,
+                          uint64_t* hashes_out) {
+  // One Weisfeiler-Lehman refinement step on 128-bit vertex hashes, stored as
+  // two independent 64-bit lanes. The contributions of the neighbors are
+  // summed, such that the result does not depend on their order. The edge
+  // hashes are given for each element of indices.
+  size_t i, l;
+  long j, k;
+  uint64_t acc;
+
+  for (i=0; i<nvertex; i++) {
+    for (l=0; l<2; l++) {
+      acc = 0;
+      for (k=indptr[i]; k<indptr[i+1]; k++) {
+        j = indices[k];
+        acc += graphs_mix(hashes_in[2*j+l] + edge_hashes[2*k+l]);
+      }
+      hashes_out[2*i+l] = graphs_mix(hashes_in[2*i+l] ^ graphs_mix(acc + l + 1));
+    }
+  }
+}
@@ -25,8 +25,19 @@
 #define MOLMOD_GRAPHS_H_
 
 #include <stddef.h>
+#include <stdint.h>
 
 void graphs_floyd_warshall(size_t n, long* dm);
+size_t graphs_distances_within(size_t nvertex, long* indptr, long* indices,
+                               long max_depth, size_t capacity, long* pairs,
+                               long* distances, long* queue, long* depth);
+void graphs_eccentricities(size_t nvertex, long* indptr, long* indices,
+                           long* eccentricities, long* queue, long* depth);
+void graphs_components(size_t nvertex, long* indptr, long* indices, long* labels,
+                       long* queue);
+void graphs_refine_hashes(size_t nvertex, long* indptr, long* indices,
+                          uint64_t* edge_hashes, uint64_t* hashes_in,
+                          uint64_t* hashes_out);
 
 
 #endif  // MOLMOD_GRAPHS_H_
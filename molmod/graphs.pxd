@@ -22,5 +22,18 @@
 # --
 
 
+from libc.stdint cimport uint64_t
+
+
 cdef extern from "graphs.h":
     void graphs_floyd_warshall(size_t n, long* dm)
+    size_t graphs_distances_within(size_t nvertex, long* indptr, long* indices,
+                                   long max_depth, size_t capacity, long* pairs,
+                                   long* distances, long* queue, long* depth)
+    void graphs_eccentricities(size_t nvertex, long* indptr, long* indices,
+                               long* eccentricities, long* queue, long* depth)
+    void graphs_components(size_t nvertex, long* indptr, long* indices, long* labels,
+                           long* queue)
+    void graphs_refine_hashes(size_t nvertex, long* indptr, long* indices,
+                              uint64_t* edge_hashes, uint64_t* hashes_in,
+                              uint64_t* hashes_out)
@@ -29,8 +29,9 @@
      http://en.wikipedia.org/wiki/Dijkstra's_algorithm for more info.
    * Iterating over vertices or edges using the Breadth First convention. See
      http://en.wikipedia.org/wiki/Breadth-first_search for more info.
-   * The all pairs shortest path matrix (Floyd-Warshall). See
-     http://en.wikipedia.org/wiki/Floyd-Warshall_algorithm for more info.
+   * The all pairs shortest path matrix and the shortest path lengths up to a
+     given maximum, both computed with a breadth first search from each
+     vertex.
    * Symmetry analysis of graphs (automorphisms). The Graph class can generate a
      list of permutations between vertices that map the graph onto itself. This
      can be used to generate (and test) all possible geometric symmetries in a
@@ -192,9 +193,50 @@ class Graph(ReadOnly):
 
     # cached attributes:
 
+    @cached
+    def edge_array(self):
+        """The edges as an integer array with shape (num_edges, 2)
+
+           The first vertex of each edge is always the smallest.
+        """
+        if self.num_edges == 0:
+            return np.zeros((0, 2), int)
+        result = np.array([tuple(edge) for edge in self.edges], int)
+        result.sort(axis=1)
+        return result
+
+    @cached
+    def indptr(self):
+        """Offsets of the neighbors of each vertex in the indices array
+
+           The neighbors of vertex i are ``indices[indptr[i]:indptr[i+1]]``.
+        """
+        sources = self.edge_array.ravel()
+        indptr = np.zeros(self.num_vertices+1, int)
+        indptr[1:] = np.bincount(sources, minlength=self.num_vertices).cumsum()
+        return indptr
+
+    @cached
+    def indices(self):
+        """The neighbors of all vertices, sorted per vertex, see indptr"""
+        sources = self.edge_array.ravel()
+        targets = self.edge_array[:, ::-1].ravel()
+        return targets[np.lexsort([targets, sources])]
+
+    @cached
+    def _edge_keys(self):
+        """Sorted integer keys of the edges and the corresponding edge indexes"""
+        keys = self.edge_array[:, 0]*self.num_vertices + self.edge_array[:, 1]
+        order = keys.argsort()
+        return keys[order], order
+
     @cached
     def edge_index(self):
-        """A map to look up the index of a edge"""
+        """A map to look up the index of a edge
+
+           This dictionary is only kept for compatibility. The method
+           :meth:`get_edge_index` does not need to build it.
+        """
         return dict((edge, index) for index, edge in enumerate(self.edges))
 
     @cached
@@ -206,46 +248,122 @@ class Graph(ReadOnly):
            This means that vertexX and vertexY1 are connected etc. This also
            implies that the following elements are part of the dictionary:
            ``{vertexY1: (vertexX, ...), vertexY2: (vertexX, ...), ...}``.
+
+           This dictionary is only kept for compatibility. It is built from the
+           arrays indptr and indices, see :meth:`get_neighbors`.
         """
-        neighbors = dict(
-            (vertex, []) for vertex
-            in range(self.num_vertices)
+        indptr = self.indptr.tolist()
+        indices = self.indices.tolist()
+        return dict(
+            (vertex, frozenset(indices[indptr[vertex]:indptr[vertex+1]]))
+            for vertex in range(self.num_vertices)
         )
-        for a, b in self.edges:
-            neighbors[a].append(b)
-            neighbors[b].append(a)
-        # turn lists into frozensets
-        neighbors = dict((key, frozenset(val)) for key, val in neighbors.items())
-        return neighbors
 
     @cached
     def distances(self):
-        """The matrix with the all-pairs shortest path lenghts"""
-        from molmod.ext import graphs_floyd_warshall
+        """The matrix with the all-pairs shortest path lenghts
+
+           Vertices that are not connected by a path get a zero distance. Use
+           :meth:`distances_within` when only short distances are needed.
+        """
         distances = np.zeros((self.num_vertices,)*2, dtype=int)
-        #distances[:] = -1 # set all -1, which is just a very big integer
-        #distances.ravel()[::len(distances)+1] = 0 # set diagonal to zero
-        for i, j in self.edges: # set edges to one
-            distances[i, j] = 1
-            distances[j, i] = 1
-        graphs_floyd_warshall(distances)
+        pairs, lengths = self.distances_within()
+        distances[pairs[:, 0], pairs[:, 1]] = lengths
+        distances[pairs[:, 1], pairs[:, 0]] = lengths
         return distances
 
+    @cached
+    def eccentricities(self):
+        """The maximum distance of each vertex to any other connected vertex"""
+        from molmod.ext import graphs_eccentricities
+        return graphs_eccentricities(self.indptr, self.indices)
+
     @cached
     def max_distance(self):
         """The maximum value in the distances matrix."""
-        if self.distances.shape[0] == 0:
+        if self.num_vertices == 0:
             return 0
         else:
-            return self.distances.max()
+            return self.eccentricities.max()
 
     @cached
     def central_vertices(self):
         """Vertices that have the lowest maximum distance to any other vertex"""
-        max_distances = self.distances.max(0)
+        max_distances = self.eccentricities
+        if (max_distances == 0).all():
+            # without edges, all vertices are equally central
+            return np.arange(self.num_vertices)
         max_distances_min = max_distances[max_distances > 0].min()
         return (max_distances == max_distances_min).nonzero()[0]
 
+    def distances_within(self, max_depth=None):
+        """Return the shortest path lengths between vertices up to a maximum
+
+           Optional argument:
+            | ``max_depth`` -- The maximum path length. When not given, all
+                               pairs of connected vertices are returned.
+
+           Returns: ``pairs, distances``. The array ``pairs`` has shape (N, 2)
+           and contains all pairs of different vertices (i, j) with i < j that
+           are at most max_depth edges apart, sorted by i and then j. The array
+           ``distances`` contains the corresponding path lengths. Unlike the
+           :attr:`distances` matrix, the memory usage does not grow
+           quadratically with the number of vertices when max_depth is small.
+        """
+        from molmod.ext import graphs_distances_within
+        if max_depth is None:
+            max_depth = -1
+        elif max_depth < 0:
+            raise ValueError("max_depth must be a positive integer.")
+        pairs, distances = graphs_distances_within(self.indptr, self.indices, max_depth)
+        order = np.lexsort([pairs[:, 1], pairs[:, 0]])
+        return pairs[order], distances[order]
+
+    def get_neighbors(self, vertex):
+        """Return a (sorted) array with the neighbors of a vertex
+
+           Argument:
+            | ``vertex`` -- The vertex of interest.
+        """
+        return self.indices[self.indptr[vertex]:self.indptr[vertex+1]]
+
+    def get_edge_index(self, vertex1, vertex2):
+        """Return the index of the edge between two vertices
+
+           Arguments:
+            | ``vertex1``, ``vertex2`` -- The vertices of the edge.
+
+           Returns None when the two vertices are not connected. This is a
+           binary search in the sorted edges, which does not require the
+           dictionary :attr:`edge_index`.
+        """
+        if vertex1 > vertex2:
+            vertex1, vertex2 = vertex2, vertex1
+        keys, order = self._edge_keys
+        key = vertex1*self.num_vertices + vertex2
+        pos = keys.searchsorted(key)
+        if pos < len(keys) and keys[pos] == key:
+            return int(order[pos])
+
+    def get_edge_indexes(self, pairs):
+        """Return the indexes of the edges between pairs of vertices
+
+           Argument:
+            | ``pairs`` -- An integer array with shape (N, 2).
+
+           Returns an integer array with N edge indexes. When the vertices of a
+           pair are not connected, the corresponding index is -1.
+        """
+        pairs = np.sort(np.asarray(pairs, int).reshape(-1, 2), axis=1)
+        keys, order = self._edge_keys
+        queries = pairs[:, 0]*self.num_vertices + pairs[:, 1]
+        pos = keys.searchsorted(queries)
+        result = np.zeros(len(queries), int) - 1
+        if len(keys) > 0:
+            found = keys[np.minimum(pos, len(keys)-1)] == queries
+            result[found] = order[pos[found]]
+        return result
+
     @cached
     def central_vertex(self):
         """The vertex that has the lowest maximum distance to any other vertex
@@ -263,21 +381,23 @@ class Graph(ReadOnly):
            vertex in another list. In case of a molecular graph, this would
            yield the atoms that belong to individual molecules.
         """
-        candidates = set(range(self.num_vertices))
+        if self.num_vertices == 0:
+            return []
+        labels = self._component_labels
+        order = labels.argsort(kind='mergesort')
+        counts = np.bincount(labels)
+        # the labels are assigned in the order of the lowest vertex in each
+        # group and the stable sort keeps the vertices in each group ordered.
+        return [group.tolist() for group in np.split(order, counts.cumsum()[:-1])]
 
-        result = []
-        while len(candidates) > 0:
-            pivot = candidates.pop()
-            group = [
-                vertex for vertex, distance
-                in self.iter_breadth_first(pivot)
-            ]
-            candidates.difference_update(group)
-
-            # this sort makes sure that the order of the vertices is respected
-            group.sort()
-            result.append(group)
-        return result
+    @cached
+    def _component_labels(self):
+        """The index of the connected component of each vertex
+
+           The components are numbered in the order of their lowest vertex.
+        """
+        from molmod.ext import graphs_components
+        return graphs_components(self.indptr, self.indices)
 
     @cached
     def fingerprint(self):
@@ -287,7 +407,7 @@ class Graph(ReadOnly):
            chance that two different (molecular) graphs yield the same
            fingerprint is small but not zero. (See unit tests.)"""
         if self.num_vertices == 0:
-            return np.zeros(20, np.ubyte)
+            return np.zeros(16, np.ubyte)
         else:
             return sum(self.vertex_fingerprints)
 
@@ -329,7 +449,7 @@ class Graph(ReadOnly):
 
         symmetry_cycles = set([])
         symmetries = set([])
-        for match in GraphSearch(EqualPattern(self))(self):
+        for match in GraphSearch(EqualPattern(self), backend="pruned")(self):
             match.cycles = match.get_closed_cycles()
             if match.cycles in symmetry_cycles:
                 raise RuntimeError("Duplicates in EqualMatch")
@@ -396,7 +516,7 @@ class Graph(ReadOnly):
                 self.vertex_fingerprints[vertex].tobytes(),
                 vertex
             ] for vertex, distance in self.iter_breadth_first(starting_vertex)
-            if len(self.neighbors[vertex]) > 0
+            if self.indptr[vertex+1] > self.indptr[vertex]
         ]
         l.sort(reverse=True)
 
@@ -452,6 +572,7 @@ class Graph(ReadOnly):
                 raise ValueError("start must be in the range [0, %i[" %
                                  self.num_vertices)
         from collections import deque
+        indptr = self.indptr
         work = np.zeros(self.num_vertices, int)
         work[:] = -1
         work[start] = 0
@@ -467,7 +588,7 @@ class Graph(ReadOnly):
             else:
                 parent, parent_length = todo.popleft()
             current_length = parent_length + 1
-            for current in self.neighbors[parent]:
+            for current in self.indices[indptr[parent]:indptr[parent+1]].tolist():
                 visited = work[current]
                 if visited == -1 or (do_duplicates and visited == current_length):
                     work[current] = current_length
@@ -517,6 +638,7 @@ class Graph(ReadOnly):
                 raise ValueError("start must be in the range [0, %i[" %
                                  self.num_vertices)
         from collections import deque
+        indptr = self.indptr
         work = np.zeros(self.num_vertices, int)
         work[:] = -1
         work[start] = 0
@@ -524,7 +646,7 @@ class Graph(ReadOnly):
         while len(todo) > 0:
             parent = todo.popleft()
             distance = work[parent]
-            for current in self.neighbors[parent]:
+            for current in self.indices[indptr[parent]:indptr[parent+1]].tolist():
                 if work[current] == -1:
                     yield (parent, current), distance, False
                     work[current] = distance+1
@@ -567,35 +689,25 @@ class Graph(ReadOnly):
            ``normalize==True``.
         """
         if normalize:
-            revorder = dict((j, i) for i, j in enumerate(subvertices))
-            new_edges = []
-            old_edge_indexes = []
-            for counter, (i, j) in enumerate(self.edges):
-                new_i = revorder.get(i)
-                if new_i is None:
-                    continue
-                new_j = revorder.get(j)
-                if new_j is None:
-                    continue
-                new_edges.append((new_i, new_j))
-                old_edge_indexes.append(counter)
+            subvertices = np.array(subvertices, dtype=int)
+            revorder = np.zeros(self.num_vertices, int) - 1
+            revorder[subvertices] = np.arange(len(subvertices))
+            new_edges = revorder[self.edge_array]
+            old_edge_indexes = (new_edges >= 0).all(axis=1).nonzero()[0]
+            new_edges = np.sort(new_edges[old_edge_indexes], axis=1)
             # sort the edges
-            order = list(range(len(new_edges)))
-            # argsort in pure python
-            order.sort( key=(lambda i: tuple(sorted(new_edges[i]))) )
-            new_edges = [new_edges[i] for i in order]
-            old_edge_indexes = [old_edge_indexes[i] for i in order]
+            order = np.lexsort([new_edges[:, 1], new_edges[:, 0]])
+            new_edges = new_edges[order]
+            old_edge_indexes = old_edge_indexes[order]
 
             result = Graph(new_edges, num_vertices=len(subvertices))
-            result._old_vertex_indexes = np.array(subvertices, dtype=int)
+            result._old_vertex_indexes = subvertices
             #result.new_vertex_indexes = revorder
-            result._old_edge_indexes = np.array(old_edge_indexes, dtype=int)
+            result._old_edge_indexes = old_edge_indexes
         else:
-            subvertices = set(subvertices)
-            old_edge_indexes = np.array([
-                i for i, edge in enumerate(self.edges)
-                if edge.issubset(subvertices)
-            ], dtype=int)
+            mask = np.zeros(self.num_vertices, bool)
+            mask[np.array(list(subvertices), dtype=int)] = True
+            old_edge_indexes = mask[self.edge_array].all(axis=1).nonzero()[0]
             new_edges = tuple(self.edges[i] for i in old_edge_indexes)
             result = Graph(new_edges, self.num_vertices)
             result._old_edge_indexes = old_edge_indexes
@@ -603,8 +715,85 @@ class Graph(ReadOnly):
             # same.
         return result
 
-    def get_vertex_fingerprints(self, vertex_strings, edge_strings, num_iter=None):
-        """Return an array with fingerprints for each vertex"""
+    def get_vertex_fingerprints(self, vertex_strings, edge_strings, num_iter=None, method="wl"):
+        """Return an array with fingerprints for each vertex
+
+           Arguments:
+            | ``vertex_strings`` -- A string for each vertex, see
+                                    :meth:`get_vertex_string`.
+            | ``edge_strings`` -- A string for each edge, see
+                                  :meth:`get_edge_string`.
+
+           Optional arguments:
+            | ``num_iter`` -- The (maximum) number of refinement iterations.
+            | ``method`` -- ``"wl"`` (default) or ``"sha1"``.
+
+           The default method is a compiled Weisfeiler-Lehman refinement of
+           128-bit hashes (16 bytes per vertex). The refinement of a connected
+           component stops as soon as its partition into classes with equal
+           hashes no longer changes. When num_iter is not given, there is no
+           other limit. Hence, the fingerprints of a connected component do not
+           depend on the rest of the graph.
+
+           The method ``"sha1"`` reproduces the fingerprints of older molmod
+           versions (20 bytes per vertex), e.g. for comparison with stored
+           fingerprints. It always performs num_iter iterations, which is by
+           default the max_distance of the graph.
+        """
+        if method == "sha1":
+            return self._get_vertex_fingerprints_sha1(vertex_strings, edge_strings, num_iter)
+        elif method != "wl":
+            raise ValueError("Unknown fingerprint method: %s" % method)
+        from molmod.ext import graphs_refine_hashes
+        import hashlib
+        cache = {}
+        def str2hash(x):
+            """convert a string to a pair of 64-bit integers"""
+            result = cache.get(x)
+            if result is None:
+                digest = hashlib.sha1(x.encode()).digest()[:16]
+                result = np.frombuffer(digest, "<u8").astype(np.uint64)
+                cache[x] = result
+            return result
+        # initialization
+        hashes = np.array([str2hash(s) for s in vertex_strings], np.uint64).reshape(-1, 2)
+        edge_hashes = np.array([str2hash(s) for s in edge_strings], np.uint64).reshape(-1, 2)
+        sources = np.repeat(np.arange(self.num_vertices), np.diff(self.indptr))
+        edge_hashes = edge_hashes[self.get_edge_indexes(np.array([sources, self.indices]).T)]
+        # iterations, until the partition of each connected component is
+        # stable, such that the result of a component does not depend on the
+        # rest of the graph.
+        if num_iter is None:
+            num_iter = self.num_vertices
+        labels = self._component_labels
+        def count_classes(hashes):
+            """the number of distinct hashes in each connected component"""
+            order = np.lexsort([hashes[:, 0], labels])
+            sorted_labels = labels[order]
+            sorted_hashes = hashes[order, 0]
+            first = np.ones(self.num_vertices, bool)
+            first[1:] = (sorted_labels[1:] != sorted_labels[:-1]) | \
+                        (sorted_hashes[1:] != sorted_hashes[:-1])
+            return np.bincount(sorted_labels[first], minlength=labels.max()+1)
+        result = hashes.copy()
+        if self.num_vertices > 0:
+            num_classes = count_classes(hashes)
+            active = np.ones(len(num_classes), bool)
+            for i in range(num_iter):
+                hashes = graphs_refine_hashes(self.indptr, self.indices, edge_hashes, hashes)
+                new_num_classes = count_classes(hashes)
+                # store the hashes of the components that are still refined
+                # and of those that have just become stable.
+                mask = active[labels]
+                result[mask] = hashes[mask]
+                active &= new_num_classes != num_classes
+                if not active.any():
+                    break
+                num_classes = new_num_classes
+        return result.astype("<u8").view(np.ubyte)
+
+    def _get_vertex_fingerprints_sha1(self, vertex_strings, edge_strings, num_iter=None):
+        """Return an array with SHA1-based fingerprints for each vertex"""
         import hashlib
         def str2array(x):
             """convert a hash string to a numpy array of bytes"""
@@ -632,9 +821,6 @@ class Graph(ReadOnly):
             for a, b in self.edges:
                 work[a] += result[b]
                 work[b] += result[a]
-            #for a in xrange(self.num_vertices):
-            #    for b in xrange(self.num_vertices):
-            #        work[a] += hashrow(result[b]*self.distances[a, b])
             for a in range(self.num_vertices):
                 result[a] = hashrow(work[a])
         return result
@@ -792,10 +978,8 @@ class Graph(ReadOnly):
             self.get_subgraph(group, normalize=True)
             for group in self.independent_vertices
         ]
-        graphs1 = [
-            other.get_subgraph(group)
-            for group in other.independent_vertices
-        ]
+        groups1 = list(other.independent_vertices)
+        graphs1 = [other.get_subgraph(group) for group in groups1]
 
         if len(graphs0) != len(graphs1):
             return
@@ -803,10 +987,25 @@ class Graph(ReadOnly):
         matches = []
 
         for graph0 in graphs0:
+            if graph0.num_vertices == 1:
+                # isolated vertices can not be matched with a GraphSearch
+                vertex0 = graph0._old_vertex_indexes[0]
+                for i, group1 in enumerate(groups1):
+                    if len(group1) == 1 and (
+                        self.vertex_fingerprints[vertex0] ==
+                        other.vertex_fingerprints[group1[0]]
+                    ).all():
+                        matches.append(OneToOne([(vertex0, group1[0])]))
+                        del groups1[i]
+                        del graphs1[i]
+                        break
+                else:
+                    return
+                continue
             pattern = EqualPattern(graph0)
             found_match = False
             for i, graph1 in enumerate(graphs1):
-                local_matches = list(GraphSearch(pattern)(graph1, one_match=True))
+                local_matches = list(GraphSearch(pattern, backend="pruned")(graph1, one_match=True))
                 if len(local_matches) == 1:
                     match = local_matches[0]
                     # we need to restore the relation between the normalized
@@ -816,6 +1015,7 @@ class Graph(ReadOnly):
                         in enumerate(graph0._old_vertex_indexes)
                     ))
                     matches.append(match * old_to_new)
+                    del groups1[i]
                     del graphs1[i]
                     found_match = True
                     break
@@ -929,7 +1129,7 @@ class Match(OneToOne):
         result = []
         #print "Match.get_new_edges self.previous_ends1", self.previous_ends1
         for vertex in self.previous_ends1:
-            for neighbor in subject_graph.neighbors[vertex]:
+            for neighbor in subject_graph.get_neighbors(vertex).tolist():
                 if neighbor not in self.reverse:
                     result.append((vertex, neighbor))
         return result
@@ -990,6 +1190,15 @@ class Pattern(object):
         """
         return True
 
+    def compare_degree(self, vertex0, vertex1, subject_graph):
+        """Test if the degrees of ``vertex0`` and ``vertex1`` are compatible
+
+           This is a cheap necessary condition for a relation between the two
+           vertices. It is only used by the ``"pruned"`` backend of the
+           :class:`GraphSearch`. By default, there is no restriction.
+        """
+        return True
+
     def check_next_match(self, match, new_relations, subject_graph, one_match):
         """Does this match object make sense for the current pattern
 
@@ -1046,10 +1255,10 @@ class CriteriaSet(object):
                 return False
         for edge0_index, c in self.edge_criteria.items():
             vertex0a, vertex0b = pattern_graph.edges[edge0_index]
-            edge1_index = subject_graph.edge_index[frozenset([
+            edge1_index = subject_graph.get_edge_index(
                 match.forward[vertex0a],
                 match.forward[vertex0b],
-            ])]
+            )
             if not c(edge1_index, subject_graph):
                 return False
         return True
@@ -1256,6 +1465,17 @@ class CustomPattern(Pattern):
             self.level_constraints.get(level, [])
         )
 
+    def compare_degree(self, vertex0, vertex1, subject_graph):
+        """See :meth:`Pattern.compare_degree`"""
+        indptr0 = self.pattern_graph.indptr
+        indptr1 = subject_graph.indptr
+        degree0 = indptr0[vertex0+1] - indptr0[vertex0]
+        degree1 = indptr1[vertex1+1] - indptr1[vertex1]
+        if self.sub:
+            return degree1 >= degree0
+        else:
+            return degree1 == degree0
+
     def check_next_match(self, match, new_relations, subject_graph, one_match):
         """Check if the (onset for a) match can be a valid"""
         # only returns true for ecaxtly one set of new_relations from all the
@@ -1468,7 +1688,7 @@ class RingPattern(Pattern):
         """Check the completeness of a ring match"""
         size = len(match)
         # check whether we have an odd strong ring
-        if match.forward[size-1] in subject_graph.neighbors[match.forward[size-2]]:
+        if subject_graph.get_edge_index(match.forward[size-1], match.forward[size-2]) is not None:
             # we have an odd closed cycle. check if this is a strong ring
             order = list(range(0, size, 2)) + list(range(1, size-1, 2))[::-1]
             ok = True
@@ -1548,16 +1768,30 @@ class GraphSearch(object):
          ...     print match.forward
     """
 
-    def __init__(self, pattern, debug=False):
+    def __init__(self, pattern, debug=False, backend="combine"):
         """
            Arguments:
             | ``pattern``  --  A Pattern instance, describing the pattern to
                                look for
             | ``debug``  --  When true, debugging info is printed on screen
                              [default=False]
+            | ``backend``  --  The algorithm that extends a match with new
+                               relations [default="combine"]
+
+           The ``"combine"`` backend enumerates all combinations of candidate
+           relations and only then checks if they are consistent. The
+           ``"pruned"`` backend filters the candidates on degree and label
+           before branching, assigns the most constrained pattern vertices
+           first and discards the candidates that become infeasible after each
+           assignment. It is much faster for highly symmetric graphs. Both
+           backends yield the same matches, but not necessarily in the same
+           order.
         """
+        if backend not in ("combine", "pruned"):
+            raise ValueError("Unknown GraphSearch backend: %s" % backend)
         self.pattern = pattern
         self.debug = debug
+        self.backend = backend
 
     def __call__(self, subject_graph, one_match=False):
         """Iterator over all matches of self.pattern in the given graph.
@@ -1570,6 +1804,9 @@ class GraphSearch(object):
         """
         # Matches are grown iteratively.
         for vertex0, vertex1 in self.pattern.iter_initial_relations(subject_graph):
+            if self.backend == "pruned" and \
+               not self.pattern.compare_degree(vertex0, vertex1, subject_graph):
+                continue
             init_match = self.pattern.MatchClass.from_first_relation(vertex0, vertex1)
             # init_match cotains only one source -> dest relation. starting from
             # this initial match, the function iter_matches extends the match
@@ -1686,13 +1923,111 @@ class GraphSearch(object):
                 continue
             # check the constraints
             for a0, b0 in constraints0:
-                if forward[a0] not in subject_graph.neighbors[forward[b0]]:
+                if subject_graph.get_edge_index(forward[a0], forward[b0]) is None:
                     forward = None
                     break
             if forward is None:
                 continue
             yield forward
 
+    def _iter_new_relations_pruned(self, init_match, subject_graph, edges0, constraints0, edges1):
+        """Given an onset for a match, iterate over all possible new key-value pairs
+
+           This is the ``"pruned"`` alternative for :meth:`_iter_new_relations`.
+           The candidates of each new pattern vertex are stored as a bitset, a
+           Python integer whose bits refer to the new subject vertices.
+        """
+        # A) the candidate subject vertices for each new pattern vertex are the
+        # common new neighbors of the subject vertices related to its parents.
+        vertices1 = []
+        local = {}
+        domains = {}
+        icg = self._iter_candidate_groups(init_match, edges0, edges1)
+        for end_vertices0, end_vertices1 in icg:
+            if len(end_vertices0) > len(end_vertices1):
+                return # this can never work, the subject graph is 'too small'
+            elif not self.pattern.sub and \
+                 len(end_vertices0) != len(end_vertices1):
+                return # an exact match is sought, this can never work
+            mask = 0
+            for end_vertex1 in end_vertices1:
+                index = local.get(end_vertex1)
+                if index is None:
+                    index = len(vertices1)
+                    local[end_vertex1] = index
+                    vertices1.append(end_vertex1)
+                mask |= 1 << index
+            for end_vertex0 in end_vertices0:
+                domains[end_vertex0] = domains.get(end_vertex0, mask) & mask
+        if len(domains) == 0:
+            return
+
+        # B) filter the candidates on degree and label before branching
+        for end_vertex0, domain in domains.items():
+            filtered = 0
+            for index, end_vertex1 in enumerate(vertices1):
+                if (domain >> index) & 1 and \
+                   self.pattern.compare_degree(end_vertex0, end_vertex1, subject_graph) and \
+                   self.pattern.compare(end_vertex0, end_vertex1, subject_graph):
+                    filtered |= 1 << index
+            if filtered == 0:
+                return
+            domains[end_vertex0] = filtered
+        self.print_debug("domains: %s" % domains)
+
+        # C) the constraints between new pattern vertices and the corresponding
+        # bitsets of neighbors among the new subject vertices
+        linked0 = {}
+        for a0, b0 in constraints0:
+            linked0.setdefault(a0, set([])).add(b0)
+            linked0.setdefault(b0, set([])).add(a0)
+        neighbors1 = {}
+        def get_neighbors1(index):
+            """bitset with the new subject vertices connected to vertices1[index]"""
+            result = neighbors1.get(index)
+            if result is None:
+                result = 0
+                for neighbor in subject_graph.get_neighbors(vertices1[index]).tolist():
+                    other = local.get(neighbor)
+                    if other is not None:
+                        result |= 1 << other
+                neighbors1[index] = result
+            return result
+
+        # D) assign the most constrained pattern vertex first, i.e. the one
+        # with the rarest labels among the subject candidates, and remove the
+        # candidates of the other vertices that become infeasible.
+        def search(domains):
+            """iterate over all consistent assignments within the domains"""
+            if len(domains) == 0:
+                yield {}
+                return
+            vertex0 = min(domains, key=(lambda v: (bin(domains[v]).count("1"), v)))
+            domain = domains[vertex0]
+            linked = linked0.get(vertex0, ())
+            while domain:
+                bit = domain & -domain
+                domain ^= bit
+                index = bit.bit_length() - 1
+                new_domains = {}
+                for other, other_domain in domains.items():
+                    if other == vertex0:
+                        continue
+                    other_domain &= ~bit
+                    if other in linked:
+                        other_domain &= get_neighbors1(index)
+                    if other_domain == 0:
+                        break
+                    new_domains[other] = other_domain
+                else:
+                    for forward in search(new_domains):
+                        forward[vertex0] = vertices1[index]
+                        yield forward
+
+        for forward in search(domains):
+            self.print_debug("new_relations: %s" % (forward, ))
+            yield forward
+
     def _iter_matches(self, input_match, subject_graph, one_match, level=0):
         """Given an onset for a match, iterate over all completions of that match
 
@@ -1726,8 +2061,12 @@ class GraphSearch(object):
         # separate concerns. This iterator also calls the routines that check
         # whether vertex1[j] also satisfies additional conditions inherent
         # vertex0[i].
-        inr = self._iter_new_relations(input_match, subject_graph, edges0,
-                                       constraints0, edges1)
+        if self.backend == "pruned":
+            inr = self._iter_new_relations_pruned(input_match, subject_graph,
+                                                  edges0, constraints0, edges1)
+        else:
+            inr = self._iter_new_relations(input_match, subject_graph, edges0,
+                                           constraints0, edges1)
         for new_relations in inr:
             # for each set of new_relations, construct a next_match and recurse
             next_match = input_match.copy_with_new_relations(new_relations)
@@ -0,0 +1,660 @@
+// MolMod is a collection of molecular modelling tools for python.
+// Copyright (C) 2007 - 2019 Toon Verstraelen <Toon.Verstraelen@UGent.be>, Center
+// for Molecular Modeling (CMM), Ghent University, Ghent, Belgium; all rights
+// reserved unless otherwise stated.
+//
+// This file is part of MolMod.
+//
+// MolMod is free software; you can redistribute it and/or
+// modify it under the terms of the GNU General Public License
+// as published by the Free Software Foundation; either version 3
+// of the License, or (at your option) any later version.
+//
+// MolMod is distributed in the hope that it will be useful,
+// but WITHOUT ANY WARRANTY; without even the implied warranty of
+// MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+// GNU General Public License for more details.
+//
+// You should have received a copy of the GNU General Public License
+// along with this program; if not, see <http://www.gnu.org/licenses/>
+//
+// --
+
+
+
+#include <math.h>
+#include "ic.h"
+
+// Needed for portability, M_PI is not part of the C/C++ standard
+#ifndef M_PI
+#define M_PI 3.14159265358979323846
+#endif
+
+// The dual numbers below follow the Scalar and Vector3 classes in ic.py
+// operation by operation, such that both give the same results, apart from
+// rounding errors in the math functions of numpy and libm. All objects
+// have a fixed size and live on the stack: nothing is allocated while an
+// internal coordinate is evaluated. Only the first size (and size*size)
+// elements of the derivative arrays are used.
+
+#define IC_MAX_SIZE 9
+
+typedef struct {
+  size_t size;  // the number of inputs, i.e. three times the number of relative vectors
+  long deriv;   // 0, 1 or 2
+} ic_context;
+
+typedef struct {
+  double v;
+  double d[IC_MAX_SIZE];
+  double dd[IC_MAX_SIZE*IC_MAX_SIZE];
+} ic_scalar;
+
+typedef struct {
+  ic_scalar x, y, z;
+} ic_vector;
+
+
+//
+// Scalar operations
+//
+
+
+static void scalar_init(const ic_context* c, ic_scalar* s, double value, long index) {
+  size_t i;
+  s->v = value;
+  if (c->deriv > 0) {
+    for (i = 0; i < c->size; i++) s->d[i] = 0.0;
+    if (index >= 0) s->d[index] = 1.0;
+  }
+  if (c->deriv > 1) {
+    for (i = 0; i < c->size*c->size; i++) s->dd[i] = 0.0;
+  }
+}
+
+static void scalar_copy(const ic_context* c, ic_scalar* s, const ic_scalar* other) {
+  size_t i;
+  s->v = other->v;
+  if (c->deriv > 0) {
+    for (i = 0; i < c->size; i++) s->d[i] = other->d[i];
+  }
+  if (c->deriv > 1) {
+    for (i = 0; i < c->size*c->size; i++) s->dd[i] = other->dd[i];
+  }
+}
+
+static void scalar_iadd(const ic_context* c, ic_scalar* s, const ic_scalar* other) {
+  size_t i;
+  if (c->deriv > 1) {
+    for (i = 0; i < c->size*c->size; i++) s->dd[i] += other->dd[i];
+  }
+  if (c->deriv > 0) {
+    for (i = 0; i < c->size; i++) s->d[i] += other->d[i];
+  }
+  s->v += other->v;
+}
+
+static void scalar_isub(const ic_context* c, ic_scalar* s, const ic_scalar* other) {
+  size_t i;
+  if (c->deriv > 1) {
+    for (i = 0; i < c->size*c->size; i++) s->dd[i] -= other->dd[i];
+  }
+  if (c->deriv > 0) {
+    for (i = 0; i < c->size; i++) s->d[i] -= other->d[i];
+  }
+  s->v -= other->v;
+}
+
+static void scalar_imul(const ic_context* c, ic_scalar* s, const ic_scalar* other) {
+  size_t i, j, k;
+  if (c->deriv > 1) {
+    for (i = 0; i < c->size; i++) {
+      for (j = 0; j < c->size; j++) {
+        k = i*c->size + j;
+        s->dd[k] = ((s->dd[k]*other->v + s->v*other->dd[k]) + s->d[i]*other->d[j])
+                   + s->d[j]*other->d[i];
+      }
+    }
+  }
+  if (c->deriv > 0) {
+    for (i = 0; i < c->size; i++) s->d[i] = s->d[i]*other->v + s->v*other->d[i];
+  }
+  s->v *= other->v;
+}
+
+static void scalar_idiv(const ic_context* c, ic_scalar* s, const ic_scalar* other) {
+  size_t i, j, k;
+  s->v /= other->v;
+  if (c->deriv > 0) {
+    for (i = 0; i < c->size; i++) s->d[i] = (s->d[i] - s->v*other->d[i])/other->v;
+  }
+  if (c->deriv > 1) {
+    for (i = 0; i < c->size; i++) {
+      for (j = 0; j < c->size; j++) {
+        k = i*c->size + j;
+        s->dd[k] = (((s->dd[k] - s->v*other->dd[k]) - s->d[i]*other->d[j])
+                    - s->d[j]*other->d[i])/other->v;
+      }
+    }
+  }
+}
+
+static void scalar_mul(const ic_context* c, ic_scalar* out, const ic_scalar* a, const ic_scalar* b) {
+  scalar_copy(c, out, a);
+  scalar_imul(c, out, b);
+}
+
+
+//
+// Vector operations
+//
+
+
+static void vector_init(const ic_context* c, ic_vector* r, const double* values, long first) {
+  scalar_init(c, &r->x, values[0], first);
+  scalar_init(c, &r->y, values[1], first + 1);
+  scalar_init(c, &r->z, values[2], first + 2);
+}
+
+static void vector_copy(const ic_context* c, ic_vector* r, const ic_vector* other) {
+  scalar_copy(c, &r->x, &other->x);
+  scalar_copy(c, &r->y, &other->y);
+  scalar_copy(c, &r->z, &other->z);
+}
+
+static void vector_isub(const ic_context* c, ic_vector* r, const ic_vector* other) {
+  scalar_isub(c, &r->x, &other->x);
+  scalar_isub(c, &r->y, &other->y);
+  scalar_isub(c, &r->z, &other->z);
+}
+
+static void vector_imul(const ic_context* c, ic_vector* r, const ic_scalar* s) {
+  scalar_imul(c, &r->x, s);
+  scalar_imul(c, &r->y, s);
+  scalar_imul(c, &r->z, s);
+}
+
+static void vector_idiv(const ic_context* c, ic_vector* r, const ic_scalar* s) {
+  scalar_idiv(c, &r->x, s);
+  scalar_idiv(c, &r->y, s);
+  scalar_idiv(c, &r->z, s);
+}
+
+static void vector_norm(const ic_context* c, ic_scalar* out, const ic_vector* r) {
+  size_t i, j, k, n;
+  double x, y, z, denom, fxx, fyy, fzz, fxy, fyz, fzx, tmp;
+  n = c->size;
+  x = r->x.v;
+  y = r->y.v;
+  z = r->z.v;
+  scalar_init(c, out, 0.0, -1);
+  out->v = sqrt(x*x + y*y + z*z);
+  if (c->deriv > 0) {
+    for (i = 0; i < n; i++) {
+      out->d[i] += x*r->x.d[i];
+      out->d[i] += y*r->y.d[i];
+      out->d[i] += z*r->z.d[i];
+      out->d[i] /= out->v;
+    }
+  }
+  if (c->deriv > 1) {
+    denom = out->v*out->v;
+    fxx = 1 - x*x/denom;
+    fyy = 1 - y*y/denom;
+    fzz = 1 - z*z/denom;
+    fxy = ((-x)*y)/denom;
+    fyz = ((-y)*z)/denom;
+    fzx = ((-z)*x)/denom;
+    for (i = 0; i < n; i++) {
+      for (j = 0; j < n; j++) {
+        k = i*n + j;
+        tmp = out->dd[k];
+        tmp += x*r->x.dd[k];
+        tmp += y*r->y.dd[k];
+        tmp += z*r->z.dd[k];
+        tmp += fxx*(r->x.d[i]*r->x.d[j]);
+        tmp += fyy*(r->y.d[i]*r->y.d[j]);
+        tmp += fzz*(r->z.d[i]*r->z.d[j]);
+        tmp += fxy*(r->x.d[i]*r->y.d[j]) + fxy*(r->x.d[j]*r->y.d[i]);
+        tmp += fyz*(r->y.d[i]*r->z.d[j]) + fyz*(r->y.d[j]*r->z.d[i]);
+        tmp += fzx*(r->z.d[i]*r->x.d[j]) + fzx*(r->z.d[j]*r->x.d[i]);
+        out->dd[k] = tmp/out->v;
+      }
+    }
+  }
+}
+
+static void vector_dot(const ic_context* c, ic_scalar* out, const ic_vector* a, const ic_vector* b) {
+  ic_scalar tmp;
+  scalar_mul(c, out, &a->x, &b->x);
+  scalar_mul(c, &tmp, &a->y, &b->y);
+  scalar_iadd(c, out, &tmp);
+  scalar_mul(c, &tmp, &a->z, &b->z);
+  scalar_iadd(c, out, &tmp);
+}
+
+static void vector_cross(const ic_context* c, ic_vector* out, const ic_vector* a, const ic_vector* b) {
+  ic_scalar tmp;
+  scalar_mul(c, &out->x, &a->y, &b->z);
+  scalar_mul(c, &tmp, &a->z, &b->y);
+  scalar_isub(c, &out->x, &tmp);
+  scalar_mul(c, &out->y, &a->z, &b->x);
+  scalar_mul(c, &tmp, &a->x, &b->z);
+  scalar_isub(c, &out->y, &tmp);
+  scalar_mul(c, &out->z, &a->x, &b->y);
+  scalar_mul(c, &tmp, &a->y, &b->x);
+  scalar_isub(c, &out->z, &tmp);
+}
+
+static void vector_normalize(const ic_context* c, ic_vector* r) {
+  ic_scalar norm;
+  vector_norm(c, &norm, r);
+  vector_idiv(c, r, &norm);
+}
+
+static void vector_reject(const ic_context* c, ic_vector* r, const ic_vector* unit) {
+  // Remove the component along the unit vector.
+  ic_vector tmp;
+  ic_scalar proj;
+  vector_copy(c, &tmp, unit);
+  vector_dot(c, &proj, r, unit);
+  vector_imul(c, &tmp, &proj);
+  vector_isub(c, r, &tmp);
+}
+
+
+//
+// Cosine and sine to angle conversion
+//
+
+
+static double clip(double x) {
+  return (x < -1.0) ? -1.0 : ((x > 1.0) ? 1.0 : x);
+}
+
+static void scalar_to_angle(const ic_context* c, ic_scalar* s, double v, double factor1, double sign) {
+  size_t i, j, n;
+  double factor2;
+  n = c->size;
+  if (c->deriv > 1) {
+    factor2 = s->v*pow(factor1, 3.0);
+    for (i = 0; i < n; i++) {
+      for (j = 0; j < n; j++) {
+        s->dd[i*n + j] = (factor2*(s->d[i]*s->d[j]) + factor1*s->dd[i*n + j])*sign;
+      }
+    }
+  }
+  if (c->deriv > 0) {
+    for (i = 0; i < n; i++) s->d[i] = (factor1*s->d[i])*sign;
+  }
+  s->v = v;
+}
+
+static void cos_to_angle(const ic_context* c, ic_scalar* s, double sign) {
+  double factor1 = (fabs(s->v) >= 1) ? 0.0 : -1.0/sqrt(1 - s->v*s->v);
+  scalar_to_angle(c, s, acos(clip(s->v))*sign, factor1, sign);
+}
+
+static void sin_to_angle(const ic_context* c, ic_scalar* s, double side) {
+  double v, offset, factor1;
+  v = asin(clip(s->v));
+  offset = (side == -1) ? ((v < 0) ? -M_PI : M_PI) : 0.0;
+  factor1 = (fabs(s->v) >= 1) ? 0.0 : 1.0/sqrt(1 - s->v*s->v);
+  scalar_to_angle(c, s, v*side + offset, factor1, side);
+}
+
+
+//
+// Low level internal coordinate functions, with relative vectors
+//
+
+
+typedef void (*ic_low)(const ic_context* c, const double* vecs, double det, ic_scalar* out);
+
+static void bond_length_low(const ic_context* c, const double* vecs, double det, ic_scalar* out) {
+  ic_vector r;
+  vector_init(c, &r, vecs, 0);
+  vector_norm(c, out, &r);
+}
+
+static void bend_cos_low(const ic_context* c, const double* vecs, double det, ic_scalar* out) {
+  ic_vector a, b;
+  vector_init(c, &a, vecs, 0);
+  vector_init(c, &b, vecs + 3, 3);
+  vector_normalize(c, &a);
+  vector_normalize(c, &b);
+  vector_dot(c, out, &a, &b);
+}
+
+static void bend_angle_low(const ic_context* c, const double* vecs, double det, ic_scalar* out) {
+  bend_cos_low(c, vecs, det, out);
+  cos_to_angle(c, out, 1.0);
+}
+
+static void dihed_low(const ic_context* c, const double* vecs, ic_vector* a, ic_vector* b,
+                      ic_vector* cc, ic_scalar* out) {
+  vector_init(c, a, vecs, 0);
+  vector_init(c, b, vecs + 3, 3);
+  vector_init(c, cc, vecs + 6, 6);
+  vector_normalize(c, b);
+  vector_reject(c, a, b);
+  vector_reject(c, cc, b);
+  vector_normalize(c, a);
+  vector_normalize(c, cc);
+  vector_dot(c, out, a, cc);
+}
+
+static void dihed_cos_low(const ic_context* c, const double* vecs, double det, ic_scalar* out) {
+  ic_vector a, b, cc;
+  dihed_low(c, vecs, &a, &b, &cc, out);
+}
+
+static void dihed_angle_low(const ic_context* c, const double* vecs, double det, ic_scalar* out) {
+  ic_vector a, b, cc, d;
+  dihed_low(c, vecs, &a, &b, &cc, out);
+  if (fabs(out->v) < 0.5) {
+    // If the cosine is far away from -1 or +1, it is safe to take the arccos
+    // and fix the sign of the angle with the determinant.
+    cos_to_angle(c, out, 1 - (det > 0)*2);
+  } else {
+    // If the cosine is close to -1 or +1, it is better to compute the sine,
+    // take the arcsin and fix the sign of the angle.
+    double side = (out->v > 0)*2 - 1;
+    vector_cross(c, &d, &b, &a);
+    vector_dot(c, out, &d, &cc);
+    sin_to_angle(c, out, side);
+  }
+}
+
+static void opbend_dist_low(const ic_context* c, const double* vecs, double det, ic_scalar* out) {
+  ic_vector a, b, cc, n;
+  vector_init(c, &a, vecs, 0);
+  vector_init(c, &b, vecs + 3, 3);
+  vector_init(c, &cc, vecs + 6, 6);
+  vector_cross(c, &n, &a, &b);
+  vector_normalize(c, &n);
+  vector_dot(c, out, &cc, &n);
+}
+
+static void opbend_cos_low(const ic_context* c, const double* vecs, double det, ic_scalar* out) {
+  ic_vector a, b, cc, n;
+  size_t i, j, size;
+  double cos, sin;
+  size = c->size;
+  vector_init(c, &a, vecs, 0);
+  vector_init(c, &b, vecs + 3, 3);
+  vector_init(c, &cc, vecs + 6, 6);
+  vector_cross(c, &n, &a, &b);
+  vector_normalize(c, &n);
+  vector_normalize(c, &cc);
+  // The cosine of the angle with the plane is the sine of the angle with the
+  // normal, which is computed from the cosine of the latter.
+  vector_dot(c, out, &n, &cc);
+  cos = out->v;
+  sin = sqrt(1.0 - cos*cos);
+  if (c->deriv > 1) {
+    for (i = 0; i < size; i++) {
+      for (j = 0; j < size; j++) {
+        out->dd[i*size + j] = (out->dd[i*size + j]*(-cos))/sin
+                              - (out->d[i]*out->d[j])/pow(sin, 3.0);
+      }
+    }
+  }
+  if (c->deriv > 0) {
+    for (i = 0; i < size; i++) out->d[i] = (out->d[i]*(-cos))/sin;
+  }
+  out->v = sin;
+}
+
+static void opbend_angle_low(const ic_context* c, const double* vecs, double det, ic_scalar* out) {
+  opbend_cos_low(c, vecs, det, out);
+  cos_to_angle(c, out, (det > 0) - (det < 0));
+}
+
+
+//
+// Transformation to Cartesian coordinates
+//
+
+
+// The relative vectors are differences of two points: head - tail. The
+// gradient of each point is written as a signed sum of the gradients towards
+// the relative vectors, e.g. "-a-b" is -grad_a - grad_b. Similarly, each
+// block of the Hessian is a signed sum of blocks of the Hessian towards the
+// relative vectors, e.g. "-aa-ab". The terms are added in the given order.
+typedef struct {
+  long npoint;
+  long nvec;
+  long heads[3];
+  long tails[3];
+  const char* gradient[4];
+  const char* hessian[16];
+} ic_transform;
+
+static const ic_transform bond_transform = {
+  2, 1, {0}, {1},
+  {"+a", "-a"},
+  {"+aa", "-aa",
+   "-aa", "+aa"}
+};
+
+static const ic_transform bend_transform = {
+  3, 2, {0, 2}, {1, 1},
+  {"+a", "-a-b", "+b"},
+  {"+aa", "-aa-ab", "+ab",
+   "-aa-ba", "+aa+ba+ab+bb", "-ab-bb",
+   "+ba", "-ba-bb", "+bb"}
+};
+
+static const ic_transform dihed_transform = {
+  4, 3, {0, 2, 3}, {1, 1, 2},
+  {"+a", "-a-b", "+b-c", "+c"},
+  {"+aa", "-aa-ab", "+ab-ac", "+ac",
+   "-aa-ba", "+aa+ba+ab+bb", "-ab-bb+ac+bc", "-ac-bc",
+   "+ba-ca", "-ba+ca-bb+cb", "+bb-cb-bc+cc", "+bc-cc",
+   "+ca", "-ca-cb", "+cb-cc", "+cc"}
+};
+
+static const ic_transform opbend_transform = {
+  4, 3, {1, 2, 3}, {0, 0, 0},
+  {"-a-b-c", "+a", "+b", "+c"},
+  {"+aa+ab+ac+ba+bb+bc+ca+cb+cc", "-aa-ba-ca", "-ab-bb-cb", "-ac-bc-cc",
+   "-aa-ab-ac", "+aa", "+ab", "+ac",
+   "-ba-bb-bc", "+ba", "+bb", "+bc",
+   "-ca-cb-cc", "+ca", "+cb", "+cc"}
+};
+
+static double transform_sum(const char* terms, long nletter, const double* x, size_t stride) {
+  // Add the signed terms. Each term consists of a sign and one or two
+  // letters, which select a relative vector and an element of x.
+  double result = 0.0;
+  long first = 1;
+  while (*terms != 0) {
+    size_t index = (terms[1] - 'a')*3*stride;
+    double term;
+    if (nletter == 2) index += (terms[2] - 'a')*3;
+    term = x[index];
+    if (first) {
+      result = (*terms == '-') ? -term : term;
+      first = 0;
+    } else if (*terms == '-') {
+      result -= term;
+    } else {
+      result += term;
+    }
+    terms += 1 + nletter;
+  }
+  return result;
+}
+
+static void transform_apply(const ic_context* c, const ic_transform* t, const ic_scalar* low,
+                            double* value, double* gradient, double* hessian) {
+  // Convert the result of a low level function to the value, gradient and
+  // Hessian towards the Cartesian coordinates of the points.
+  long p, q, i, j, size;
+  size = 3*t->npoint;
+  *value = low->v;
+  if (c->deriv > 0) {
+    for (p = 0; p < t->npoint; p++) {
+      for (i = 0; i < 3; i++) {
+        gradient[p*3 + i] = transform_sum(t->gradient[p], 1, low->d + i, 1);
+      }
+    }
+  }
+  if (c->deriv > 1) {
+    for (p = 0; p < t->npoint; p++) {
+      for (i = 0; i < 3; i++) {
+        for (q = 0; q < t->npoint; q++) {
+          for (j = 0; j < 3; j++) {
+            hessian[(p*3 + i)*size + q*3 + j] = transform_sum(
+              t->hessian[p*t->npoint + q], 2, low->dd + i*c->size + j, c->size);
+          }
+        }
+      }
+    }
+  }
+}
+
+static void transform_compute(const ic_context* c, const ic_transform* t, ic_low fn_low,
+                              const double* rs, double det, double* value,
+                              double* gradient, double* hessian) {
+  long ivec, i;
+  double vecs[9];
+  ic_scalar low;
+  for (ivec = 0; ivec < t->nvec; ivec++) {
+    for (i = 0; i < 3; i++) {
+      vecs[ivec*3 + i] = rs[t->heads[ivec]*3 + i] - rs[t->tails[ivec]*3 + i];
+    }
+  }
+  fn_low(c, vecs, det, &low);
+  transform_apply(c, t, &low, value, gradient, hessian);
+}
+
+static void transform_compute_mean(const ic_context* c, ic_low fn_low, const double* rs,
+                                   const double* dets, double* value, double* gradient,
+                                   double* hessian) {
+  // Compute the mean over the three cyclic permutations of the first three
+  // points of an out-of-plane internal coordinate.
+  static const long perms[3][3] = {{0, 1, 2}, {2, 0, 1}, {1, 2, 0}};
+  long iperm, p, q, i, j;
+  double prs[12], pvalue, pgradient[12], phessian[144];
+  *value = 0.0;
+  if (c->deriv > 0) {
+    for (i = 0; i < 12; i++) gradient[i] = 0.0;
+  }
+  if (c->deriv > 1) {
+    for (i = 0; i < 144; i++) hessian[i] = 0.0;
+  }
+  for (iperm = 0; iperm < 3; iperm++) {
+    // perm[p] is the original point at position p in the permuted set.
+    long perm[4] = {perms[iperm][0], perms[iperm][1], perms[iperm][2], 3};
+    long inv[4];
+    for (p = 0; p < 4; p++) {
+      inv[perm[p]] = p;
+      for (i = 0; i < 3; i++) prs[p*3 + i] = rs[perm[p]*3 + i];
+    }
+    transform_compute(c, &opbend_transform, fn_low, prs, (dets == NULL) ? 0.0 : dets[iperm],
+                      &pvalue, pgradient, phessian);
+    *value += pvalue/3;
+    if (c->deriv > 0) {
+      for (p = 0; p < 4; p++) {
+        for (i = 0; i < 3; i++) gradient[p*3 + i] += pgradient[inv[p]*3 + i]/3;
+      }
+    }
+    if (c->deriv > 1) {
+      for (p = 0; p < 4; p++) {
+        for (i = 0; i < 3; i++) {
+          for (q = 0; q < 4; q++) {
+            for (j = 0; j < 3; j++) {
+              hessian[(p*3 + i)*12 + q*3 + j] += phessian[(inv[p]*3 + i)*12 + inv[q]*3 + j]/3;
+            }
+          }
+        }
+      }
+    }
+  }
+}
+
+
+static int all_finite(const double* x, size_t n) {
+  size_t i;
+  for (i = 0; i < n; i++) {
+    if (!isfinite(x[i])) return 0;
+  }
+  return 1;
+}
+
+
+//
+// Public interface
+//
+
+
+typedef struct {
+  const ic_transform* transform;
+  ic_low fn_low;
+  long ndet;
+  long mean;
+} ic_definition;
+
+static const ic_definition ic_definitions[IC_NKIND] = {
+  {&bond_transform, bond_length_low, 0, 0},      // IC_BOND_LENGTH
+  {&bend_transform, bend_cos_low, 0, 0},         // IC_BEND_COS
+  {&bend_transform, bend_angle_low, 0, 0},       // IC_BEND_ANGLE
+  {&dihed_transform, dihed_cos_low, 0, 0},       // IC_DIHED_COS
+  {&dihed_transform, dihed_angle_low, 1, 0},     // IC_DIHED_ANGLE
+  {&opbend_transform, opbend_dist_low, 0, 0},    // IC_OPBEND_DIST
+  {&opbend_transform, opbend_cos_low, 0, 0},     // IC_OPBEND_COS
+  {&opbend_transform, opbend_angle_low, 1, 0},   // IC_OPBEND_ANGLE
+  {&opbend_transform, opbend_cos_low, 0, 1},     // IC_OPBEND_MCOS
+  {&opbend_transform, opbend_angle_low, 3, 1},   // IC_OPBEND_MANGLE
+};
+
+long ic_npoint(long kind) {
+  if ((kind < 0) || (kind >= IC_NKIND)) return -1;
+  return ic_definitions[kind].transform->npoint;
+}
+
+long ic_ndet(long kind) {
+  // The number of determinants per set of points. The determinants of the
+  // relative vectors fix the sign of some angles. They are computed by the
+  // caller, such that the result is consistent with the determinants used
+  // elsewhere.
+  if ((kind < 0) || (kind >= IC_NKIND)) return -1;
+  return ic_definitions[kind].ndet;
+}
+
+int ic_compute(long kind, size_t nset, const double* rs, const double* dets, long deriv,
+               double* values, double* gradients, double* hessians) {
+  // Compute the internal coordinate for nset sets of points (rs, shape
+  // (nset, npoint, 3)). The gradients, shape (nset, npoint, 3), and the
+  // Hessians, shape (nset, npoint, 3, npoint, 3), are only computed when
+  // deriv is larger than zero or one, respectively. The return value is zero
+  // on success, -1 for invalid arguments and 1 when the results of a set are
+  // not finite, e.g. for a dihedral angle of three collinear points. In the
+  // latter case, the remaining sets are not computed.
+  const ic_definition* def;
+  ic_context c;
+  size_t iset, npoint;
+  if ((kind < 0) || (kind >= IC_NKIND) || (deriv < 0) || (deriv > 2)) return -1;
+  def = ic_definitions + kind;
+  npoint = def->transform->npoint;
+  c.size = 3*def->transform->nvec;
+  c.deriv = deriv;
+  for (iset = 0; iset < nset; iset++) {
+    double* gradient = (deriv > 0) ? gradients + iset*npoint*3 : NULL;
+    double* hessian = (deriv > 1) ? hessians + iset*npoint*npoint*9 : NULL;
+    if (def->mean) {
+      transform_compute_mean(&c, def->fn_low, rs + iset*npoint*3,
+                             (def->ndet > 0) ? dets + iset*def->ndet : NULL, values + iset,
+                             gradient, hessian);
+    } else {
+      transform_compute(&c, def->transform, def->fn_low, rs + iset*npoint*3,
+                        (def->ndet > 0) ? dets[iset] : 0.0, values + iset, gradient, hessian);
+    }
+    if (!all_finite(values + iset, 1) ||
+        ((deriv > 0) && !all_finite(gradient, npoint*3)) ||
+        ((deriv > 1) && !all_finite(hessian, npoint*npoint*9))) return 1;
+  }
+  return 0;
+}
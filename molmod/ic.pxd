@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# MolMod is a collection of molecular modelling tools for python.
+# Copyright (C) 2007 - 2019 Toon Verstraelen <Toon.Verstraelen@UGent.be>, Center
+# for Molecular Modeling (CMM), Ghent University, Ghent, Belgium; all rights
+# reserved unless otherwise stated.
+#
+# This file is part of MolMod.
+#
+# MolMod is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# MolMod is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+
+
+cdef extern from "ic.h":
+    ctypedef enum ic_kind:
+        IC_BOND_LENGTH
+        IC_BEND_COS
+        IC_BEND_ANGLE
+        IC_DIHED_COS
+        IC_DIHED_ANGLE
+        IC_OPBEND_DIST
+        IC_OPBEND_COS
+        IC_OPBEND_ANGLE
+        IC_OPBEND_MCOS
+        IC_OPBEND_MANGLE
+
+    long ic_npoint(long kind)
+    long ic_ndet(long kind)
+    int ic_compute(long kind, size_t nset, const double* rs, const double* dets, long deriv,
+                   double* values, double* gradients, double* hessians)
@@ -22,16 +22,29 @@
 # --
 """Evaluation of internal coordinates with first and second order derivatives
 
-This implementation is pure python and sacrifices computational efficiency on
-the altar of programming flexibility. It is really easy to implement new types
-of internal coordinates since one only has to enter the formula that evaluates
-the internal coordinate. First and second order derivatives towards Cartesian
-coordinates require only a minimum of extra work.
-
-Two auxiliary classes Scalar and Vector3 support most of the mathematical
-operations required to compute the internal coordinates. Additionally they also
-know the chain rule for each operation and can therefore evaluate the
-derivatives simultaneously.
+The internal coordinates are evaluated by compiled code (ic.c) that carries
+the first and second order derivatives towards the Cartesian coordinates
+along with each intermediate result, i.e. a forward-mode automatic
+differentiation with dual numbers. These dual numbers have a fixed size and no
+memory is allocated while an internal coordinate is evaluated. The batch
+functions, e.g. dihed_angle_batch, compute the same internal coordinate for
+many sets of points in a single call. The results are identical to those of
+the corresponding functions for a single set of points, e.g. dihed_angle.
+
+When an internal coordinate or one of its derivatives is not finite, e.g. for
+a dihedral angle of three collinear points, a FloatingPointError is raised.
+
+Two auxiliary classes Scalar and Vector3 implement the same dual numbers in
+pure python. This sacrifices computational efficiency on the altar of
+programming flexibility: it is really easy to implement new types of internal
+coordinates since one only has to enter the formula that evaluates the
+internal coordinate. First and second order derivatives towards Cartesian
+coordinates require only a minimum of extra work. The compiled code follows
+these classes operation by operation.
+
+The values in Scalar and Vector3 objects may also be arrays, in which case the
+derivatives get an additional last axis. This is useful to evaluate a new type
+of internal coordinate for many sets of points at once.
 """
 
 
@@ -39,6 +52,8 @@ from __future__ import division
 
 import numpy as np
 
+from molmod.ext import ic_compute, ic_ndet, ic_npoint
+
 
 __all__ = [
     "Scalar", "Vector3", "dot", "cross",
@@ -47,9 +62,34 @@ __all__ = [
     "dihed_cos", "dihed_angle",
     "opbend_cos", "opbend_angle", "opbend_dist",
     "opbend_mcos", "opbend_mangle",
+    "bond_length_batch", "pair_distance_batch",
+    "bend_cos_batch", "bend_angle_batch",
+    "dihed_cos_batch", "dihed_angle_batch",
+    "opbend_cos_batch", "opbend_angle_batch", "opbend_dist_batch",
+    "opbend_mcos_batch", "opbend_mangle_batch",
 ]
 
 
+def _square(x):
+    """Compute x**2 with the pow function, also for arrays
+
+       Numpy computes x**2 for arrays as x*x, which may differ in the last bit
+       from x**2 for a single float. This function gives the same result in
+       both cases, such that batches match single evaluations exactly.
+    """
+    return np.power(x, 2.0)
+
+
+def _outer(a, b):
+    """Outer product of two (batches of) vectors, see np.outer"""
+    return a[:, None]*b[None, :]
+
+
+def _transpose(a):
+    """Transpose a (batch of) matrices"""
+    return a.swapaxes(0, 1)
+
+
 #
 # Auxiliary classes
 #
@@ -62,6 +102,8 @@ class Scalar(object):
        self.dd. The value of the scalar itself if self.v
     """
 
+    __slots__ = ["deriv", "size", "v", "d", "dd"]
+
     def __init__(self, size, deriv=0, value=0, index=None):
         """
            Arguments:
@@ -76,22 +118,26 @@ class Scalar(object):
         """
         self.deriv = deriv
         self.size = size
+        if isinstance(value, np.ndarray):
+            # A batch of values, see the module documentation.
+            value = value.astype(float)
         self.v = value
         if deriv > 0:
-            self.d = np.zeros(size, float)
+            self.d = np.zeros((size,) + np.shape(value), float)
             if index is not None:
                 self.d[index] = 1
         if deriv > 1:
-            self.dd = np.zeros((size, size), float)
+            self.dd = np.zeros((size, size) + np.shape(value), float)
         if deriv > 2:
             raise ValueError("This implementation (only) supports up to second order derivatives.")
 
     def copy(self):
         """Return a deep copy"""
-        result = Scalar(self.size, self.deriv)
-        result.v = self.v
-        if self.deriv > 0: result.d[:] = self.d[:]
-        if self.deriv > 1: result.dd[:] = self.dd[:]
+        result = Scalar(self.size)
+        result.deriv = self.deriv
+        result.v = self.v.copy() if isinstance(self.v, np.ndarray) else self.v
+        if self.deriv > 0: result.d = self.d.copy()
+        if self.deriv > 1: result.dd = self.dd.copy()
         return result
 
     def results(self):
@@ -137,9 +183,9 @@ class Scalar(object):
             if self.deriv > 1:
                 self.dd *= other.v
                 self.dd += self.v*other.dd
-                tmp = np.outer(self.d, other.d)
+                tmp = _outer(self.d, other.d)
                 self.dd += tmp
-                self.dd += tmp.transpose()
+                self.dd += _transpose(tmp)
             if self.deriv > 0:
                 self.d *= other.v
                 self.d += self.v*other.d
@@ -168,9 +214,9 @@ class Scalar(object):
                 self.d /= other.v
             if self.deriv > 1:
                 self.dd -= self.v*other.dd
-                tmp = np.outer(self.d, other.d)
+                tmp = _outer(self.d, other.d)
                 self.dd -= tmp
-                self.dd -= tmp.transpose()
+                self.dd -= _transpose(tmp)
                 self.dd /= other.v
         else:
             raise TypeError("Second argument must be float, int or Scalar")
@@ -179,9 +225,9 @@ class Scalar(object):
     def inv(self):
         """In place invert"""
         self.v = 1/self.v
-        tmp = self.v**2
+        tmp = _square(self.v)
         if self.deriv > 1:
-            self.dd[:] = tmp*(2*self.v*np.outer(self.d, self.d) - self.dd)
+            self.dd[:] = tmp*(2*self.v*_outer(self.d, self.d) - self.dd)
         if self.deriv > 0:
             self.d[:] = -tmp*self.d[:]
 
@@ -192,6 +238,8 @@ class Vector3(object):
        This object is nothing more than a tier for three Scalar objects.
     """
 
+    __slots__ = ["deriv", "size", "x", "y", "z"]
+
     def __init__(self, size, deriv=0, values=(0, 0, 0), indexes=(None, None, None)):
         """
            Arguments:
@@ -210,18 +258,11 @@ class Vector3(object):
 
     def copy(self):
         """Return a deep copy"""
-        result = Vector3(self.size, self.deriv)
-        result.x.v = self.x.v
-        result.y.v = self.y.v
-        result.z.v = self.z.v
-        if self.deriv > 0:
-            result.x.d[:] = self.x.d
-            result.y.d[:] = self.y.d
-            result.z.d[:] = self.z.d
-        if self.deriv > 1:
-            result.x.dd[:] = self.x.dd
-            result.y.dd[:] = self.y.dd
-            result.z.dd[:] = self.z.dd
+        result = Vector3(self.size)
+        result.deriv = self.deriv
+        result.x = self.x.copy()
+        result.y = self.y.copy()
+        result.z = self.z.copy()
         return result
 
     def __iadd__(self, other):
@@ -250,8 +291,8 @@ class Vector3(object):
 
     def norm(self):
         """Return a Scalar object with the norm of this vector"""
-        result = Scalar(self.size, self.deriv)
-        result.v = np.sqrt(self.x.v**2 + self.y.v**2 + self.z.v**2)
+        result = Scalar(self.size, self.deriv, self.x.v*0)
+        result.v = np.sqrt(_square(self.x.v) + _square(self.y.v) + _square(self.z.v))
         if self.deriv > 0:
             result.d += self.x.v*self.x.d
             result.d += self.y.v*self.y.d
@@ -261,16 +302,16 @@ class Vector3(object):
             result.dd += self.x.v*self.x.dd
             result.dd += self.y.v*self.y.dd
             result.dd += self.z.v*self.z.dd
-            denom = result.v**2
-            result.dd += (1 - self.x.v**2/denom)*np.outer(self.x.d, self.x.d)
-            result.dd += (1 - self.y.v**2/denom)*np.outer(self.y.d, self.y.d)
-            result.dd += (1 - self.z.v**2/denom)*np.outer(self.z.d, self.z.d)
-            tmp = -self.x.v*self.y.v/denom*np.outer(self.x.d, self.y.d)
-            result.dd += tmp+tmp.transpose()
-            tmp = -self.y.v*self.z.v/denom*np.outer(self.y.d, self.z.d)
-            result.dd += tmp+tmp.transpose()
-            tmp = -self.z.v*self.x.v/denom*np.outer(self.z.d, self.x.d)
-            result.dd += tmp+tmp.transpose()
+            denom = _square(result.v)
+            result.dd += (1 - _square(self.x.v)/denom)*_outer(self.x.d, self.x.d)
+            result.dd += (1 - _square(self.y.v)/denom)*_outer(self.y.d, self.y.d)
+            result.dd += (1 - _square(self.z.v)/denom)*_outer(self.z.d, self.z.d)
+            tmp = -self.x.v*self.y.v/denom*_outer(self.x.d, self.y.d)
+            result.dd += tmp+_transpose(tmp)
+            tmp = -self.y.v*self.z.v/denom*_outer(self.y.d, self.z.d)
+            result.dd += tmp+_transpose(tmp)
+            tmp = -self.z.v*self.x.v/denom*_outer(self.z.d, self.x.d)
+            result.dd += tmp+_transpose(tmp)
             result.dd /= result.v
         return result
 
@@ -314,6 +355,55 @@ def cross(r1, r2):
     return result
 
 
+#
+# Evaluation with the compiled dual numbers
+#
+
+
+# The relative vectors, (head, tail), of the matrices whose determinants fix
+# the sign of some angles. The determinants are computed with numpy and passed
+# to the compiled code.
+_det_vectors = {
+    "dihed_angle": [[(0, 1), (2, 1), (3, 2)]],
+    "opbend_angle": [[(1, 0), (2, 0), (3, 0)]],
+    "opbend_mangle": [
+        [(p1, p0), (p2, p0), (3, p0)]
+        for p0, p1, p2 in [(0, 1, 2), (2, 0, 1), (1, 2, 0)]
+    ],
+}
+
+
+def _compute_batch(name, rs, deriv, indexes):
+    """Compute an internal coordinate for a batch of sets of points
+
+       Arguments:
+        | ``name``  --  the name of the internal coordinate, e.g. dihed_angle
+        | ``rs``  --  an array with shape (N, npoint, 3), or an array with
+                      coordinates, shape (natom, 3), when indexes is given
+        | ``deriv``  --  the derivatives to be computed: 0, 1 or 2
+        | ``indexes``  --  None or an integer array with shape (N, npoint)
+    """
+    if deriv not in (0, 1, 2):
+        raise ValueError("deriv must be 0, 1 or 2.")
+    rs = np.asarray(rs, float)
+    if indexes is not None:
+        rs = rs[np.asarray(indexes)]
+    npoint = ic_npoint(name)
+    if rs.ndim != 3 or rs.shape[1:] != (npoint, 3):
+        raise TypeError("The points must be given as an array with shape (N, %i, 3)." % npoint)
+    rs = np.ascontiguousarray(rs)
+    dets = np.zeros((len(rs), ic_ndet(name)), float)
+    for i, vectors in enumerate(_det_vectors.get(name, [])):
+        matrices = np.array([rs[:, head] - rs[:, tail] for head, tail in vectors])
+        dets[:, i] = np.linalg.det(matrices.transpose(1, 0, 2))
+    return ic_compute(name, rs, deriv, dets)
+
+
+def _compute(name, rs, deriv):
+    """Compute an internal coordinate for a single set of points, see _compute_batch"""
+    return tuple(result[0] for result in _compute_batch(name, [rs], deriv, None))
+
+
 #
 # Internal coordinate functions
 #
@@ -327,7 +417,7 @@ def bond_length(rs, deriv=0):
 
        When derivatives are computed a tuple with a single result is returned
     """
-    return _bond_transform(rs, _bond_length_low, deriv)
+    return _compute("bond_length", rs, deriv)
 
 pair_distance = bond_length
 
@@ -341,7 +431,7 @@ def bend_cos(rs, deriv=0):
 
        When derivatives are computed a tuple with a single result is returned
     """
-    return _bend_transform(rs, _bend_cos_low, deriv)
+    return _compute("bend_cos", rs, deriv)
 
 
 def bend_angle(rs, deriv=0):
@@ -353,7 +443,7 @@ def bend_angle(rs, deriv=0):
 
        When derivatives are computed a tuple with a single result is returned
     """
-    return _bend_transform(rs, _bend_angle_low, deriv)
+    return _compute("bend_angle", rs, deriv)
 
 
 def dihed_cos(rs, deriv=0):
@@ -363,7 +453,7 @@ def dihed_cos(rs, deriv=0):
         | ``rs``  --  four numpy array with three elements
         | ``deriv``  --  the derivatives to be computed: 0, 1 or 2 [default=0]
     """
-    return _dihed_transform(rs, _dihed_cos_low, deriv)
+    return _compute("dihed_cos", rs, deriv)
 
 
 def dihed_angle(rs, deriv=0):
@@ -378,7 +468,7 @@ def dihed_angle(rs, deriv=0):
 
        When derivatives are computed a tuple with a single result is returned
     """
-    return _dihed_transform(rs, _dihed_angle_low, deriv)
+    return _compute("dihed_angle", rs, deriv)
 
 
 def opbend_dist(rs, deriv=0):
@@ -388,7 +478,7 @@ def opbend_dist(rs, deriv=0):
         | ``rs``  --  four numpy array with three elements
         | ``deriv``  --  the derivatives to be computed: 0, 1 or 2 [default=0]
     """
-    return _opbend_transform(rs, _opdist_low, deriv)
+    return _compute("opbend_dist", rs, deriv)
 
 
 def opbend_cos(rs, deriv=0):
@@ -398,7 +488,7 @@ def opbend_cos(rs, deriv=0):
         | ``rs``  --  four numpy array with three elements
         | ``deriv``  --  the derivatives to be computed: 0, 1 or 2 [default=0]
     """
-    return _opbend_transform(rs, _opbend_cos_low, deriv)
+    return _compute("opbend_cos", rs, deriv)
 
 
 def opbend_angle(rs, deriv=0):
@@ -414,389 +504,85 @@ def opbend_angle(rs, deriv=0):
 
        When no derivatives are computed a tuple with a single result is returned.
     """
-    return _opbend_transform(rs, _opbend_angle_low, deriv)
+    return _compute("opbend_angle", rs, deriv)
 
 
 def opbend_mangle(rs, deriv=0):
     """Compute the mean value of the 3 opbend_angles
     """
-    return _opbend_transform_mean(rs, _opbend_angle_low, deriv)
+    return _compute("opbend_mangle", rs, deriv)
 
 
 def opbend_mcos(rs, deriv=0):
     """Compute the mean cos of the 3 opbend_angles
     """
-    return _opbend_transform_mean(rs, _opbend_cos_low, deriv)
+    return _compute("opbend_mcos", rs, deriv)
 
 
 #
-# Transformers
+# Batch versions of the internal coordinate functions
 #
 
 
-def _bond_transform(rs, fn_low, deriv):
-    r = rs[0] - rs[1]
-    result = fn_low(r, deriv)
-    v = result[0]
-    if deriv == 0:
-        return v,
-    d = np.zeros((2, 3), float)
-    d[0] = result[1]
-    d[1] = -result[1]
-    if deriv == 1:
-        return v, d
-    dd = np.zeros((2, 3, 2, 3), float)
-    dd[0, :, 0, :] = result[2]
-    dd[1, :, 1, :] = result[2]
-    dd[0, :, 1, :] = -result[2]
-    dd[1, :, 0, :] = -result[2]
-    if deriv == 2:
-        return v, d, dd
-    raise ValueError("deriv must be 0, 1 or 2.")
-
-
-def _bend_transform(rs, fn_low, deriv):
-    a = rs[0] - rs[1]
-    b = rs[2] - rs[1]
-    result = fn_low(a, b, deriv)
-    v = result[0]
-    if deriv == 0:
-        return v,
-    d = np.zeros((3, 3), float)
-    d[0] = result[1][:3]
-    d[1] = -result[1][:3]-result[1][3:]
-    d[2] = result[1][3:]
-    if deriv == 1:
-        return v, d
-    dd = np.zeros((3, 3, 3, 3), float)
-    aa = result[2][:3, :3]
-    ab = result[2][:3, 3:]
-    ba = result[2][3:, :3]
-    bb = result[2][3:, 3:]
-    dd[0, :, 0, :] =   aa
-    dd[0, :, 1, :] = - aa - ab
-    dd[0, :, 2, :] =   ab
-    dd[1, :, 0, :] = - aa - ba
-    dd[1, :, 1, :] =   aa + ba + ab + bb
-    dd[1, :, 2, :] = - ab - bb
-    dd[2, :, 0, :] =   ba
-    dd[2, :, 1, :] = - ba - bb
-    dd[2, :, 2, :] =   bb
-    if deriv == 2:
-        return v, d, dd
-    raise ValueError("deriv must be 0, 1 or 2.")
-
-
-def _dihed_transform(rs, fn_low, deriv):
-    a = rs[0] - rs[1]
-    b = rs[2] - rs[1]
-    c = rs[3] - rs[2]
-    result = fn_low(a, b, c, deriv)
-    v = result[0]
-    if deriv == 0:
-        return v,
-    d = np.zeros((4, 3), float)
-    d[0] = result[1][:3]
-    d[1] = -result[1][:3]-result[1][3:6]
-    d[2] = result[1][3:6]-result[1][6:]
-    d[3] = result[1][6:]
-    if deriv == 1:
-        return v, d
-    dd = np.zeros((4, 3, 4, 3), float)
-    aa = result[2][:3, :3]
-    ab = result[2][:3, 3:6]
-    ac = result[2][:3, 6:]
-    ba = result[2][3:6, :3]
-    bb = result[2][3:6, 3:6]
-    bc = result[2][3:6, 6:]
-    ca = result[2][6:, :3]
-    cb = result[2][6:, 3:6]
-    cc = result[2][6:, 6:]
-
-    dd[0, :, 0, :] =   aa
-    dd[0, :, 1, :] = - aa - ab
-    dd[0, :, 2, :] =   ab - ac
-    dd[0, :, 3, :] =   ac
-
-    dd[1, :, 0, :] = - aa - ba
-    dd[1, :, 1, :] =   aa + ba + ab + bb
-    dd[1, :, 2, :] = - ab - bb + ac + bc
-    dd[1, :, 3, :] = - ac - bc
-
-    dd[2, :, 0, :] =   ba - ca
-    dd[2, :, 1, :] = - ba + ca - bb + cb
-    dd[2, :, 2, :] =   bb - cb - bc + cc
-    dd[2, :, 3, :] =   bc - cc
-
-    dd[3, :, 0, :] =   ca
-    dd[3, :, 1, :] = - ca - cb
-    dd[3, :, 2, :] =   cb - cc
-    dd[3, :, 3, :] =   cc
-    if deriv == 2:
-        return v, d, dd
-    raise ValueError("deriv must be 0, 1 or 2.")
-
-
-def _opbend_transform(rs, fn_low, deriv):
-    a = rs[1] - rs[0]
-    b = rs[2] - rs[0]
-    c = rs[3] - rs[0]
-    result = fn_low(a, b, c, deriv)
-    v = result[0]
-    if deriv == 0:
-        return v,
-    d = np.zeros((4, 3), float)
-    d[0] = -result[1][:3]-result[1][3:6]-result[1][6:]
-    d[1] = result[1][:3]
-    d[2] = result[1][3:6]
-    d[3] = result[1][6:]
-    if deriv == 1:
-        return v, d
-    dd = np.zeros((4, 3, 4, 3), float)
-    aa = result[2][:3, :3]
-    ab = result[2][:3, 3:6]
-    ac = result[2][:3, 6:]
-    ba = result[2][3:6, :3]
-    bb = result[2][3:6, 3:6]
-    bc = result[2][3:6, 6:]
-    ca = result[2][6:, :3]
-    cb = result[2][6:, 3:6]
-    cc = result[2][6:, 6:]
-
-    dd[0, :, 0, :] =   aa + ab + ac + ba + bb + bc + ca + cb + cc
-    dd[0, :, 1, :] = - aa - ba - ca
-    dd[0, :, 2, :] = - ab - bb - cb
-    dd[0, :, 3, :] = - ac - bc - cc
-
-    dd[1, :, 0, :] = - aa - ab - ac
-    dd[1, :, 1, :] =   aa
-    dd[1, :, 2, :] =   ab
-    dd[1, :, 3, :] =   ac
-
-    dd[2, :, 0, :] = - ba - bb - bc
-    dd[2, :, 1, :] =   ba
-    dd[2, :, 2, :] =   bb
-    dd[2, :, 3, :] =   bc
-
-    dd[3, :, 0, :] = - ca - cb - cc
-    dd[3, :, 1, :] =   ca
-    dd[3, :, 2, :] =   cb
-    dd[3, :, 3, :] =   cc
-    if deriv == 2:
-        return v, d, dd
-    raise ValueError("deriv must be 0, 1 or 2.")
-
-
-def _opbend_transform_mean(rs, fn_low, deriv=0):
-    """Compute the mean of the 3 opbends
+def bond_length_batch(rs, deriv=0, indexes=None):
+    """Compute many bond lengths at once, see bond_length
+
+       Arguments:
+        | ``rs``  --  an array with shape (N, 2, 3)
+
+       Optional arguments:
+        | ``deriv``  --  the derivatives to be computed: 0, 1 or 2 [default=0]
+        | ``indexes``  --  When given, an integer array with shape (N, 2) and
+                           rs is an array with all Cartesian coordinates.
+
+       Returns a tuple with the values, shape (N,), and optionally the
+       gradients, shape (N, 2, 3), and the Hessians, shape (N, 2, 3, 2, 3).
     """
-    v = 0.0
-    d = np.zeros((4,3), float)
-    dd = np.zeros((4,3,4,3), float)
-    #loop over the 3 cyclic permutations
-    for p in np.array([[0,1,2], [2,0,1], [1,2,0]]):
-        opbend = _opbend_transform([rs[p[0]], rs[p[1]], rs[p[2]], rs[3]], fn_low, deriv)
-        v += opbend[0]/3
-        index0 = np.where(p==0)[0][0] #index0 is the index of the 0th atom (rs[0])
-        index1 = np.where(p==1)[0][0]
-        index2 = np.where(p==2)[0][0]
-        index3 = 3
-        if deriv>0:
-            d[0] += opbend[1][index0]/3
-            d[1] += opbend[1][index1]/3
-            d[2] += opbend[1][index2]/3
-            d[3] += opbend[1][index3]/3
-        if deriv>1:
-            dd[0, :, 0, :] += opbend[2][index0, :, index0, :]/3
-            dd[0, :, 1, :] += opbend[2][index0, :, index1, :]/3
-            dd[0, :, 2, :] += opbend[2][index0, :, index2, :]/3
-            dd[0, :, 3, :] += opbend[2][index0, :, index3, :]/3
-
-            dd[1, :, 0, :] += opbend[2][index1, :, index0, :]/3
-            dd[1, :, 1, :] += opbend[2][index1, :, index1, :]/3
-            dd[1, :, 2, :] += opbend[2][index1, :, index2, :]/3
-            dd[1, :, 3, :] += opbend[2][index1, :, index3, :]/3
-
-            dd[2, :, 0, :] += opbend[2][index2, :, index0, :]/3
-            dd[2, :, 1, :] += opbend[2][index2, :, index1, :]/3
-            dd[2, :, 2, :] += opbend[2][index2, :, index2, :]/3
-            dd[2, :, 3, :] += opbend[2][index2, :, index3, :]/3
-
-            dd[3, :, 0, :] += opbend[2][index3, :, index0, :]/3
-            dd[3, :, 1, :] += opbend[2][index3, :, index1, :]/3
-            dd[3, :, 2, :] += opbend[2][index3, :, index2, :]/3
-            dd[3, :, 3, :] += opbend[2][index3, :, index3, :]/3
-    if deriv==0:
-        return v,
-    elif deriv==1:
-        return v, d
-    elif deriv==2:
-        return v, d, dd
-    else:
-        raise ValueError("deriv must be 0, 1 or 2.")
+    return _compute_batch("bond_length", rs, deriv, indexes)
 
+pair_distance_batch = bond_length_batch
 
-#
-# Low level Internal coordinate functions
-#
 
+def bend_cos_batch(rs, deriv=0, indexes=None):
+    """Compute many bend cosines at once, see bend_cos and bond_length_batch"""
+    return _compute_batch("bend_cos", rs, deriv, indexes)
 
-def _bond_length_low(r, deriv):
-    """Similar to bond_length, but with a relative vector"""
-    r = Vector3(3, deriv, r, (0, 1, 2))
-    d = r.norm()
-    return d.results()
-
-
-def _bend_cos_low(a, b, deriv):
-    """Similar to bend_cos, but with relative vectors"""
-    a = Vector3(6, deriv, a, (0, 1, 2))
-    b = Vector3(6, deriv, b, (3, 4, 5))
-    a /= a.norm()
-    b /= b.norm()
-    return dot(a, b).results()
-
-
-def _bend_angle_low(a, b, deriv):
-    """Similar to bend_angle, but with relative vectors"""
-    result = _bend_cos_low(a, b, deriv)
-    return _cos_to_angle(result, deriv)
-
-
-def _dihed_cos_low(a, b, c, deriv):
-    """Similar to dihed_cos, but with relative vectors"""
-    a = Vector3(9, deriv, a, (0, 1, 2))
-    b = Vector3(9, deriv, b, (3, 4, 5))
-    c = Vector3(9, deriv, c, (6, 7, 8))
-    b /= b.norm()
-    tmp = b.copy()
-    tmp *= dot(a, b)
-    a -= tmp
-    tmp = b.copy()
-    tmp *= dot(c, b)
-    c -= tmp
-    a /= a.norm()
-    c /= c.norm()
-    return dot(a, c).results()
-
-
-def _dihed_angle_low(av, bv, cv, deriv):
-    """Similar to dihed_cos, but with relative vectors"""
-    a = Vector3(9, deriv, av, (0, 1, 2))
-    b = Vector3(9, deriv, bv, (3, 4, 5))
-    c = Vector3(9, deriv, cv, (6, 7, 8))
-    b /= b.norm()
-    tmp = b.copy()
-    tmp *= dot(a, b)
-    a -= tmp
-    tmp = b.copy()
-    tmp *= dot(c, b)
-    c -= tmp
-    a /= a.norm()
-    c /= c.norm()
-    result = dot(a, c).results()
-    # avoid trobles with the gradients by either using arccos or arcsin
-    if abs(result[0]) < 0.5:
-        # if the cosine is far away for -1 or +1, it is safe to take the arccos
-        # and fix the sign of the angle.
-        sign = 1-(np.linalg.det([av, bv, cv]) > 0)*2
-        return _cos_to_angle(result, deriv, sign)
-    else:
-        # if the cosine is close to -1 or +1, it is better to compute the sine,
-        # take the arcsin and fix the sign of the angle
-        d = cross(b, a)
-        side = (result[0] > 0)*2-1 # +1 means angle in range [-pi/2,pi/2]
-        result = dot(d, c).results()
-        return _sin_to_angle(result, deriv, side)
-
-
-def _opdist_low(av, bv, cv, deriv):
-    """Similar to opdist, but with relative vectors"""
-    a = Vector3(9, deriv, av, (0, 1, 2))
-    b = Vector3(9, deriv, bv, (3, 4, 5))
-    c = Vector3(9, deriv, cv, (6, 7, 8))
-    n  = cross(a, b)
-    n /= n.norm()
-    dist = dot(c, n)
-    return dist.results()
-
-
-def _opbend_cos_low(a, b, c, deriv):
-    """Similar to opbend_cos, but with relative vectors"""
-    a = Vector3(9, deriv, a, (0, 1, 2))
-    b = Vector3(9, deriv, b, (3, 4, 5))
-    c = Vector3(9, deriv, c, (6, 7, 8))
-    n  = cross(a,b)
-    n /= n.norm()
-    c /= c.norm()
-    temp = dot(n,c)
-    result = temp.copy()
-    result.v = np.sqrt(1.0-temp.v**2)
-    if result.deriv > 0:
-        result.d *= -temp.v
-        result.d /= result.v
-    if result.deriv > 1:
-        result.dd *= -temp.v
-        result.dd /= result.v
-        temp2 = np.array([temp.d]).transpose()*temp.d
-        temp2 /= result.v**3
-        result.dd -= temp2
-    return result.results()
-
-
-def _opbend_angle_low(a, b, c, deriv=0):
-    """Similar to opbend_angle, but with relative vectors"""
-    result = _opbend_cos_low(a, b, c, deriv)
-    sign = np.sign(np.linalg.det([a, b, c]))
-    return _cos_to_angle(result, deriv, sign)
 
+def bend_angle_batch(rs, deriv=0, indexes=None):
+    """Compute many bend angles at once, see bend_angle and bond_length_batch"""
+    return _compute_batch("bend_angle", rs, deriv, indexes)
 
-#
-# Cosine and sine to angle conversion
-#
 
+def dihed_cos_batch(rs, deriv=0, indexes=None):
+    """Compute many dihedral cosines at once, see dihed_cos and bond_length_batch"""
+    return _compute_batch("dihed_cos", rs, deriv, indexes)
 
-def _cos_to_angle(result, deriv, sign=1):
-    """Convert a cosine and its derivatives to an angle and its derivatives"""
-    v = np.arccos(np.clip(result[0], -1, 1))
-    if deriv == 0:
-        return v*sign,
-    if abs(result[0]) >= 1:
-        factor1 = 0
-    else:
-        factor1 = -1.0/np.sqrt(1-result[0]**2)
-    d = factor1*result[1]
-    if deriv == 1:
-        return v*sign, d*sign
-    factor2 = result[0]*factor1**3
-    dd = factor2*np.outer(result[1], result[1]) + factor1*result[2]
-    if deriv == 2:
-        return v*sign, d*sign, dd*sign
-    raise ValueError("deriv must be 0, 1 or 2.")
-
-
-def _sin_to_angle(result, deriv, side=1):
-    """Convert a sine and its derivatives to an angle and its derivatives"""
-    v = np.arcsin(np.clip(result[0], -1, 1))
-    sign = side
-    if sign == -1:
-        if v < 0:
-            offset = -np.pi
-        else:
-            offset = np.pi
-    else:
-        offset = 0.0
-    if deriv == 0:
-        return v*sign + offset,
-    if abs(result[0]) >= 1:
-        factor1 = 0
-    else:
-        factor1 = 1.0/np.sqrt(1-result[0]**2)
-    d = factor1*result[1]
-    if deriv == 1:
-        return v*sign + offset, d*sign
-    factor2 = result[0]*factor1**3
-    dd = factor2*np.outer(result[1], result[1]) + factor1*result[2]
-    if deriv == 2:
-        return v*sign + offset, d*sign, dd*sign
-    raise ValueError("deriv must be 0, 1 or 2.")
+
+def dihed_angle_batch(rs, deriv=0, indexes=None):
+    """Compute many dihedral angles at once, see dihed_angle and bond_length_batch"""
+    return _compute_batch("dihed_angle", rs, deriv, indexes)
+
+
+def opbend_dist_batch(rs, deriv=0, indexes=None):
+    """Compute many out-of-plane distances at once, see opbend_dist and bond_length_batch"""
+    return _compute_batch("opbend_dist", rs, deriv, indexes)
+
+
+def opbend_cos_batch(rs, deriv=0, indexes=None):
+    """Compute many out-of-plane cosines at once, see opbend_cos and bond_length_batch"""
+    return _compute_batch("opbend_cos", rs, deriv, indexes)
+
+
+def opbend_angle_batch(rs, deriv=0, indexes=None):
+    """Compute many out-of-plane angles at once, see opbend_angle and bond_length_batch"""
+    return _compute_batch("opbend_angle", rs, deriv, indexes)
+
+
+def opbend_mangle_batch(rs, deriv=0, indexes=None):
+    """Compute many mean out-of-plane angles at once, see opbend_mangle and bond_length_batch"""
+    return _compute_batch("opbend_mangle", rs, deriv, indexes)
+
+
+def opbend_mcos_batch(rs, deriv=0, indexes=None):
+    """Compute many mean out-of-plane cosines at once, see opbend_mcos and bond_length_batch"""
+    return _compute_batch("opbend_mcos", rs, deriv, indexes)
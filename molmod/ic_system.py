@@ -0,0 +1,472 @@
+# -*- coding: utf-8 -*-
+# MolMod is a collection of molecular modelling tools for python.
+# Copyright (C) 2007 - 2019 Toon Verstraelen <Toon.Verstraelen@UGent.be>, Center
+# for Molecular Modeling (CMM), Ghent University, Ghent, Belgium; all rights
+# reserved unless otherwise stated.
+#
+# This file is part of MolMod.
+#
+# MolMod is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# MolMod is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Sparse Wilson B-matrices for systems of internal coordinates
+
+   An InternalCoordinates object describes a list of internal coordinates,
+   e.g. all bonds, bends, dihedrals and out-of-plane angles in a molecular
+   graph. Its values, the Wilson B-matrix (the derivatives of the internal
+   coordinates towards the Cartesian coordinates) and the second derivatives
+   are computed with the batch functions of :mod:`molmod.ic`, one call per
+   type of internal coordinate. Each internal coordinate depends on only a few
+   atoms, so these derivatives are stored as sparse matrices, see CSRMatrix.
+
+   Example::
+
+     >>> ics = InternalCoordinates.from_graph(molecule.graph)
+     >>> values, bmatrix = ics.compute(molecule.coordinates, 1)
+     >>> gradient_ic = ics.gradient_to_internal(gradient, bmatrix)
+
+   The transformations of gradients and Hessians from Cartesian to internal
+   coordinates use the generalized inverse of the B-matrix. The corresponding
+   linear systems, with the matrix B B^T, are solved with the conjugate
+   gradient method, which only needs products with the sparse B-matrix and
+   also works for redundant internal coordinates.
+"""
+
+
+from __future__ import division
+
+from builtins import range
+import numpy as np
+
+import molmod.ic as ic
+from molmod.graphs import CriteriaSet, GraphSearch
+from molmod.molecular_graphs import BondPattern, BendingAnglePattern, \
+    DihedralAnglePattern, OutOfPlanePattern, HasNumNeighbors
+
+
+__all__ = ["CSRMatrix", "InternalCoordinates"]
+
+
+class CSRMatrix(object):
+    """A sparse matrix in the compressed sparse row format
+
+       The nonzero elements of row i are stored in
+       ``data[indptr[i]:indptr[i+1]]`` and their column indexes in
+       ``indices[indptr[i]:indptr[i+1]]``. This is the same layout as
+       ``scipy.sparse.csr_matrix``, see to_scipy.
+    """
+
+    def __init__(self, shape, data, indices, indptr):
+        """
+           Arguments:
+            | ``shape``  --  the number of rows and columns
+            | ``data``  --  the nonzero elements
+            | ``indices``  --  the column indexes of the nonzero elements
+            | ``indptr``  --  the offsets of the rows in data and indices,
+                              an array with nrow+1 elements
+        """
+        self.shape = (int(shape[0]), int(shape[1]))
+        self.data = np.asarray(data, float)
+        self.indices = np.asarray(indices, int)
+        self.indptr = np.asarray(indptr, int)
+        if len(self.indptr) != self.shape[0] + 1:
+            raise TypeError("indptr must have nrow+1 elements.")
+        if self.data.shape != self.indices.shape or len(self.data) != self.indptr[-1]:
+            raise TypeError("data and indices must have indptr[-1] elements.")
+        self._transpose = None
+
+    @classmethod
+    def from_coo(cls, shape, rows, cols, values):
+        """Construct a sparse matrix from (row, column, value) triplets
+
+           Arguments:
+            | ``shape``  --  the number of rows and columns
+            | ``rows``, ``cols``, ``values``  --  arrays with the row index,
+                    the column index and the value of each element
+
+           Duplicate elements are added.
+        """
+        rows = np.asarray(rows, int).ravel()
+        cols = np.asarray(cols, int).ravel()
+        values = np.asarray(values, float).ravel()
+        order = np.lexsort((cols, rows))
+        rows = rows[order]
+        cols = cols[order]
+        values = values[order]
+        if len(rows) > 0:
+            first = np.ones(len(rows), bool)
+            first[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+            values = np.add.reduceat(values, first.nonzero()[0])
+            rows = rows[first]
+            cols = cols[first]
+        indptr = np.zeros(shape[0] + 1, int)
+        indptr[1:] = np.cumsum(np.bincount(rows, minlength=shape[0]))
+        return cls(shape, values, cols, indptr)
+
+    @classmethod
+    def from_blocks(cls, shape, rows, cols, blocks):
+        """Construct a sparse matrix from dense blocks with a fixed shape
+
+           Arguments:
+            | ``shape``  --  the number of rows and columns, in blocks
+            | ``rows``, ``cols``  --  arrays with the block row and the block
+                                      column of each block
+            | ``blocks``  --  an array with shape (nblock, m, n), where m and n
+                              are the number of rows and columns of a block
+
+           Duplicate blocks are added. This is much faster than from_coo
+           because only the blocks have to be sorted.
+        """
+        rows = np.asarray(rows, int)
+        cols = np.asarray(cols, int)
+        blocks = np.asarray(blocks, float)
+        m, n = blocks.shape[1:]
+        order = np.lexsort((cols, rows))
+        rows = rows[order]
+        cols = cols[order]
+        blocks = blocks[order]
+        if len(rows) > 0:
+            first = np.ones(len(rows), bool)
+            first[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+            blocks = np.add.reduceat(blocks, first.nonzero()[0], axis=0)
+            rows = rows[first]
+            cols = cols[first]
+        counts = np.bincount(rows, minlength=shape[0])
+        starts = np.zeros(shape[0], int)
+        starts[1:] = np.cumsum(counts)[:-1]
+        # Row k of block row i starts at m*n*starts[i] + k*n*counts[i] and
+        # contains the k-th rows of all blocks in block row i.
+        positions = np.arange(len(rows)) - starts[rows]
+        destinations = (
+            (m*n*starts[rows] + n*positions)[:, np.newaxis, np.newaxis] +
+            np.outer(n*counts[rows], np.arange(m))[:, :, np.newaxis] +
+            np.arange(n)
+        ).ravel()
+        data = np.zeros(len(rows)*m*n, float)
+        data[destinations] = blocks.ravel()
+        indices = np.zeros(len(rows)*m*n, int)
+        indices[destinations] = np.broadcast_to(
+            (n*cols[:, np.newaxis] + np.arange(n))[:, np.newaxis, :],
+            (len(rows), m, n)).ravel()
+        indptr = np.zeros(shape[0]*m + 1, int)
+        indptr[1:] = (m*n*starts[:, np.newaxis] + n*counts[:, np.newaxis]*np.arange(1, m+1)).ravel()
+        return cls((shape[0]*m, shape[1]*n), data, indices, indptr)
+
+    nnz = property(lambda self: len(self.data))
+
+    def dot(self, other):
+        """Return the product of this matrix with a vector or a dense matrix"""
+        other = np.asarray(other, float)
+        if other.shape[:1] != self.shape[1:]:
+            raise TypeError("The first dimension of the argument must be %i." % self.shape[1])
+        result = np.zeros(self.shape[:1] + other.shape[1:], float)
+        if self.nnz > 0:
+            products = self.data.reshape((-1,) + (1,)*(other.ndim - 1))*other[self.indices]
+            nonempty = self.indptr[:-1] < self.indptr[1:]
+            result[nonempty] = np.add.reduceat(products, self.indptr[:-1][nonempty], axis=0)
+        return result
+
+    def transpose(self):
+        """Return the transpose of this matrix, also in the CSR format"""
+        if self._transpose is None:
+            rows = np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+            self._transpose = CSRMatrix.from_coo(self.shape[::-1], self.indices, rows, self.data)
+            self._transpose._transpose = self
+        return self._transpose
+
+    T = property(transpose)
+
+    def tdot(self, other):
+        """Return the product of the transpose of this matrix with a vector or a dense matrix"""
+        return self.transpose().dot(other)
+
+    def toarray(self):
+        """Return a dense array with the same elements"""
+        result = np.zeros(self.shape, float)
+        rows = np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+        result[rows, self.indices] = self.data
+        return result
+
+    def to_scipy(self):
+        """Return the same matrix as a scipy.sparse.csr_matrix
+
+           This requires scipy, which is not a dependency of molmod.
+        """
+        from scipy.sparse import csr_matrix
+        return csr_matrix((self.data, self.indices, self.indptr), shape=self.shape)
+
+
+class InternalCoordinates(object):
+    """A list of internal coordinates of a system with a fixed number of atoms
+
+       The internal coordinates are grouped by type. Each type is the name of
+       a function in :mod:`molmod.ic` that has a batch version, e.g.
+       ``"bond_length"`` or ``"dihed_angle"``.
+    """
+
+    def __init__(self, natom, terms):
+        """
+           Arguments:
+            | ``natom``  --  the number of atoms
+            | ``terms``  --  a list of (name, indexes) pairs, where name is
+                             the type of internal coordinate and indexes is
+                             an integer array with shape (n, npoint), the
+                             atom indexes of the n internal coordinates
+
+           The internal coordinates are ordered as in the list of terms.
+        """
+        self.natom = natom
+        self.terms = []
+        for name, indexes in terms:
+            fn_batch = getattr(ic, name + "_batch", None)
+            if fn_batch is None:
+                raise ValueError("Unknown type of internal coordinate: %s" % name)
+            indexes = np.asarray(indexes, int)
+            if indexes.ndim != 2:
+                raise TypeError("The indexes must be given as a two-dimensional array.")
+            if indexes.size > 0 and (indexes.min() < 0 or indexes.max() >= natom):
+                raise ValueError("The atom indexes must be in the range [0, %i[." % natom)
+            self.terms.append((name, fn_batch, indexes))
+        self.size = sum(len(indexes) for name, fn_batch, indexes in self.terms)
+
+    @classmethod
+    def from_graph(cls, graph, bonds=True, bends=True, dihedrals=True, out_of_plane=True):
+        """Construct the internal coordinates from the topology of a molecule
+
+           Argument:
+            | ``graph``  --  a MolecularGraph instance
+
+           Optional arguments:
+            | ``bonds``  --  include all bond lengths [default=True]
+            | ``bends``  --  include all bending angles [default=True]
+            | ``dihedrals``  --  include all dihedral angles [default=True]
+            | ``out_of_plane``  --  include out-of-plane angles for all atoms
+                                    with three neighbors [default=True]
+
+           The internal coordinates are found with the corresponding patterns
+           in :mod:`molmod.molecular_graphs`, e.g. BondPattern.
+        """
+        selection = [
+            (bonds, "bond_length", BondPattern([CriteriaSet()]), 2),
+            (bends, "bend_angle", BendingAnglePattern([CriteriaSet()]), 3),
+            (dihedrals, "dihed_angle", DihedralAnglePattern([CriteriaSet()]), 4),
+            (out_of_plane, "opbend_angle", OutOfPlanePattern([
+                CriteriaSet(vertex_criteria={0: HasNumNeighbors(3)})
+            ]), 4),
+        ]
+        terms = []
+        for include, name, pattern, npoint in selection:
+            if not include:
+                continue
+            indexes = [
+                [match.get_destination(index) for index in range(npoint)]
+                for match in GraphSearch(pattern)(graph)
+            ]
+            terms.append((name, np.array(indexes, int).reshape(-1, npoint)))
+        return cls(graph.num_vertices, terms)
+
+    def iter_labels(self):
+        """Iterate over (name, atom indexes) for all internal coordinates"""
+        for name, fn_batch, indexes in self.terms:
+            for row in indexes:
+                yield name, tuple(row)
+
+    def compute(self, coordinates, deriv=0):
+        """Compute the internal coordinates and optionally their derivatives
+
+           Argument:
+            | ``coordinates``  --  the Cartesian coordinates, shape (natom, 3)
+
+           Optional argument:
+            | ``deriv``  --  the derivatives to be computed: 0, 1 or 2
+                             [default=0]
+
+           Returns a tuple with the values of the internal coordinates, shape
+           (size,), and optionally the B-matrix, a CSRMatrix with shape (size,
+           3*natom), and the second derivatives, a CSRMatrix with shape
+           (size, (3*natom)**2). Row i of the latter contains the Hessian of
+           internal coordinate i, flattened.
+        """
+        if deriv not in (0, 1, 2):
+            raise ValueError("deriv must be 0, 1 or 2.")
+        coordinates = np.asarray(coordinates, float)
+        if coordinates.shape != (self.natom, 3):
+            raise TypeError("The coordinates must be an array with shape (%i, 3)." % self.natom)
+        ncart = 3*self.natom
+        values = []
+        rows = [[], []]
+        cols = [[], []]
+        data = [[], []]
+        offset = 0
+        for name, fn_batch, indexes in self.terms:
+            results = fn_batch(coordinates, deriv, indexes)
+            values.append(results[0])
+            # The Cartesian indexes of the points, shape (n, 3*npoint).
+            cart = (indexes[:, :, None]*3 + np.arange(3)).reshape(len(indexes), 3*indexes.shape[1])
+            ic_indexes = offset + np.arange(len(indexes))
+            if deriv > 0:
+                rows[0].append(np.repeat(ic_indexes, cart.shape[1]))
+                cols[0].append(cart.ravel())
+                data[0].append(results[1].ravel())
+            if deriv > 1:
+                rows[1].append(np.repeat(ic_indexes, cart.shape[1]**2))
+                cols[1].append((cart[:, :, None]*ncart + cart[:, None, :]).ravel())
+                data[1].append(results[2].ravel())
+            offset += len(indexes)
+        result = [np.concatenate(values) if values else np.zeros(0, float)]
+        for order in range(deriv):
+            shape = (self.size, ncart**(order + 1))
+            if len(rows[order]) == 0:
+                result.append(CSRMatrix(shape, [], [], np.zeros(self.size + 1, int)))
+            else:
+                result.append(CSRMatrix.from_coo(
+                    shape, np.concatenate(rows[order]), np.concatenate(cols[order]),
+                    np.concatenate(data[order])
+                ))
+        return tuple(result)
+
+    def _get_curvature(self, bderiv, gradient_ic):
+        """Return the sum of the Hessians of the internal coordinates, weighted
+           with the gradient towards the internal coordinates, as a CSRMatrix
+        """
+        ncart = 3*self.natom
+        rows = np.repeat(np.arange(self.size), np.diff(bderiv.indptr))
+        values = bderiv.data*np.asarray(gradient_ic, float)[rows]
+        return CSRMatrix.from_coo(
+            (ncart, ncart), bderiv.indices//ncart, bderiv.indices%ncart, values)
+
+    def gradient_to_cartesian(self, gradient_ic, bmatrix):
+        """Transform a gradient towards internal coordinates to Cartesian coordinates
+
+           Arguments:
+            | ``gradient_ic``  --  the gradient towards the internal
+                                   coordinates, shape (size,)
+            | ``bmatrix``  --  the B-matrix, see compute
+
+           Returns an array with shape (natom, 3).
+        """
+        return bmatrix.tdot(gradient_ic).reshape(self.natom, 3)
+
+    def gradient_to_internal(self, gradient, bmatrix, threshold=1e-10, maxiter=None):
+        """Transform a Cartesian gradient to internal coordinates
+
+           Arguments:
+            | ``gradient``  --  the Cartesian gradient, shape (natom, 3)
+            | ``bmatrix``  --  the B-matrix, see compute
+
+           Optional arguments:
+            | ``threshold``, ``maxiter``  --  the convergence criterion of the
+                    conjugate gradient method, see _solve_gram
+
+           For redundant internal coordinates, the result with the smallest
+           norm is returned.
+        """
+        rhs = bmatrix.dot(np.asarray(gradient, float).ravel())
+        return self._solve_gram(bmatrix, rhs, threshold, maxiter)
+
+    def hessian_to_cartesian(self, hessian_ic, gradient_ic, bmatrix, bderiv):
+        """Transform a Hessian towards internal coordinates to Cartesian coordinates
+
+           Arguments:
+            | ``hessian_ic``  --  the Hessian towards the internal coordinates,
+                                  shape (size, size)
+            | ``gradient_ic``  --  the gradient towards the internal
+                                   coordinates, shape (size,)
+            | ``bmatrix``, ``bderiv``  --  the B-matrix and the second
+                                           derivatives, see compute
+
+           Returns an array with shape (3*natom, 3*natom).
+        """
+        tmp = bmatrix.tdot(np.asarray(hessian_ic, float))
+        result = bmatrix.tdot(tmp.T).T
+        result += self._get_curvature(bderiv, gradient_ic).toarray()
+        return result
+
+    def hessian_to_internal(self, hessian, gradient_ic, bmatrix, bderiv, threshold=1e-10,
+                            maxiter=None):
+        """Transform a Cartesian Hessian to internal coordinates
+
+           Arguments:
+            | ``hessian``  --  the Cartesian Hessian, shape (3*natom, 3*natom)
+            | ``gradient_ic``  --  the gradient towards the internal
+                                   coordinates, see gradient_to_internal
+            | ``bmatrix``, ``bderiv``  --  the B-matrix and the second
+                                           derivatives, see compute
+
+           Optional arguments:
+            | ``threshold``, ``maxiter``  --  the convergence criterion of the
+                    conjugate gradient method, see _solve_gram
+
+           Returns an array with shape (size, size).
+        """
+        hessian = np.asarray(hessian, float) - self._get_curvature(bderiv, gradient_ic).toarray()
+        tmp = bmatrix.dot(hessian)
+        projected = bmatrix.dot(tmp.T).T
+        tmp = self._solve_gram(bmatrix, projected, threshold, maxiter)
+        result = self._solve_gram(bmatrix, tmp.T, threshold, maxiter)
+        return 0.5*(result + result.T)
+
+    def _solve_gram(self, bmatrix, rhs, threshold=1e-10, maxiter=None):
+        """Solve B B^T x = rhs with the conjugate gradient method
+
+           Arguments:
+            | ``bmatrix``  --  the B-matrix, see compute
+            | ``rhs``  --  the right-hand side, a vector or a matrix with one
+                           right-hand side per column
+
+           Optional arguments:
+            | ``threshold``  --  the iterations stop when the norm of the
+                                 residual drops below threshold times the norm
+                                 of the right-hand side [default=1e-10]
+            | ``maxiter``  --  the maximum number of iterations
+                               [default=10*size]
+
+           All columns are solved simultaneously. When rhs lies in the range
+           of B, as in the transformations above, the iterations converge to
+           the solution with the smallest norm.
+
+           A RuntimeError is raised when the residual of a column is still
+           above the threshold after maxiter iterations.
+        """
+        if maxiter is None:
+            maxiter = 10*self.size
+        rhs = np.asarray(rhs, float)
+        vector = rhs.ndim == 1
+        if vector:
+            rhs = rhs.reshape(-1, 1)
+        x = np.zeros(rhs.shape, float)
+        r = rhs.copy()
+        p = r.copy()
+        rr = (r*r).sum(axis=0)
+        limit = threshold**2*rr
+        for counter in range(maxiter):
+            active = rr > limit
+            if not active.any():
+                break
+            q = bmatrix.dot(bmatrix.tdot(p[:, active]))
+            pq = (p[:, active]*q).sum(axis=0)
+            alpha = np.zeros(len(rr), float)
+            alpha[active] = rr[active]/pq
+            x += alpha*p
+            r[:, active] -= alpha[active]*q
+            rr_new = (r*r).sum(axis=0)
+            beta = np.zeros(len(rr), float)
+            beta[active] = rr_new[active]/rr[active]
+            p = r + beta*p
+            rr = rr_new
+        if (rr > limit).any():
+            raise RuntimeError("The conjugate gradient method did not converge in %i iterations." % maxiter)
+        if vector:
+            return x[:, 0]
+        return x
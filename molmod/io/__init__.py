@@ -30,6 +30,7 @@
 """
 
 from molmod.io.atrj import *
+from molmod.io.binary_trajectory import *
 from molmod.io.chk import *
 from molmod.io.cml import *
 from molmod.io.common import *
@@ -126,6 +126,25 @@ class ATRJReader(SlicedReader):
         # Done
         return frame
 
+    def _get_frame_arrays(self, frame):
+        """Return a dictionary with the arrays of a frame, see SlicedReader"""
+        return {"time": frame.time, "pos": frame.coordinates}
+
     def _skip_frame(self):
         """Skip a single frame from the trajectory"""
         self._secfile.get_next("Frame Number")
+
+    def _seek_frame(self, offset):
+        """Move the file to the beginning of a frame"""
+        self._f.seek(offset)
+        self._secfile = SectionFile(self._f)
+
+    def _scan_frame_offsets(self, f):
+        """Iterate over the byte offsets of all frames, see SlicedReader"""
+        while True:
+            offset = f.tell()
+            line = f.readline()
+            if len(line) == 0:
+                return
+            if line.startswith(b"Frame Number"):
+                yield offset
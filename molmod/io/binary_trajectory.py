@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+# MolMod is a collection of molecular modelling tools for python.
+# Copyright (C) 2007 - 2019 Toon Verstraelen <Toon.Verstraelen@UGent.be>, Center
+# for Molecular Modeling (CMM), Ghent University, Ghent, Belgium; all rights
+# reserved unless otherwise stated.
+#
+# This file is part of MolMod.
+#
+# MolMod is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# MolMod is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Binary trajectory files that can be memory-mapped without parsing
+
+   A binary trajectory file starts with a header of 256 bytes, followed by one
+   fixed-size record per frame. Each record contains the time (always float64)
+   and the fields that are present in the trajectory, in the following order:
+   ``cell`` (3x3), ``pos``, ``vel`` and ``frc`` (natom x 3). All values are
+   little-endian floating point numbers in atomic units, with the precision
+   chosen at the time of writing.
+
+   Such a file is created from any reader that supports it, e.g.::
+
+     >>> dump_binary_trajectory(XYZReader("traj.xyz"), "traj.bintrj")
+     >>> bt = BinaryTrajectory("traj.bintrj")
+     >>> print bt.pos.shape  # (nframe, natom, 3), read from disk on demand
+
+   or from the command line::
+
+     python -m molmod.io.binary_trajectory xyz traj.xyz traj.bintrj
+
+   A LAMMPSDumpReader supports this when its columns are given by name. On
+   the command line, the columns are taken from the dump file and the units
+   are selected with ``--lammps-units`` (real or metal).
+"""
+
+
+from __future__ import print_function
+
+import os
+
+import numpy as np
+
+from molmod.io.common import FileFormatError
+
+
+__all__ = ["BinaryTrajectory", "dump_binary_trajectory"]
+
+
+MAGIC = b"MMBINTRJ"
+VERSION = 1
+HEADER_SIZE = 256
+
+# The optional fields, in the order they appear in a record.
+FIELDS = ["cell", "pos", "vel", "frc"]
+
+header_dtype = np.dtype([
+    ("magic", "S8"), ("version", "<u4"), ("itemsize", "<u4"), ("natom", "<u8"),
+    ("fields", "<u4"), ("reserved", "<u4"), ("source_size", "<i8"),
+    ("source_mtime", "<f8"), ("source_key", "S%i" % (HEADER_SIZE - 48)),
+])
+assert header_dtype.itemsize == HEADER_SIZE
+
+
+def get_record_dtype(natom, fields, itemsize):
+    """Return the dtype of a single frame record
+
+       Arguments:
+        | ``natom``  --  the number of atoms
+        | ``fields``  --  a list with the names of the optional fields
+        | ``itemsize``  --  4 or 8, for single or double precision
+    """
+    if itemsize not in (4, 8):
+        raise ValueError("The itemsize must be 4 or 8.")
+    value_type = "<f%i" % itemsize
+    items = [("time", "<f8")]
+    for name in FIELDS:
+        if name in fields:
+            items.append((name, value_type, (3, 3) if name == "cell" else (natom, 3)))
+    return np.dtype(items)
+
+
+class BinaryTrajectory(object):
+    """A memory-mapped binary trajectory file
+
+       The following attributes are arrays that are only read from disk when
+       their elements are accessed:
+        | ``time``  --  array with shape (nframe,)
+        | ``cell``  --  array with shape (nframe, 3, 3), or None
+        | ``pos``  --  array with shape (nframe, natom, 3), or None
+        | ``vel``  --  array with shape (nframe, natom, 3), or None
+        | ``frc``  --  array with shape (nframe, natom, 3), or None
+    """
+
+    def __init__(self, filename):
+        """
+           Argument:
+            | ``filename``  --  the binary trajectory file
+        """
+        header = np.fromfile(filename, header_dtype, 1)
+        if len(header) != 1 or header["magic"][0] != MAGIC:
+            raise FileFormatError("%s is not a binary trajectory file." % filename)
+        header = header[0]
+        if header["version"] != VERSION:
+            raise FileFormatError("Unsupported binary trajectory version: %i" % header["version"])
+        self.filename = filename
+        self.natom = int(header["natom"])
+        self.fields = [name for index, name in enumerate(FIELDS) if header["fields"] & (1 << index)]
+        self.source_size = int(header["source_size"])
+        self.source_mtime = float(header["source_mtime"])
+        self.source_key = header["source_key"].decode()
+        record_dtype = get_record_dtype(self.natom, self.fields, int(header["itemsize"]))
+        # An incomplete record at the end, e.g. due to an interrupted
+        # conversion, is ignored.
+        nframe = (os.path.getsize(filename) - HEADER_SIZE)//record_dtype.itemsize
+        if nframe > 0:
+            self.records = np.memmap(filename, record_dtype, "r", HEADER_SIZE, (nframe,))
+        else:
+            self.records = np.zeros(0, record_dtype)
+        self.time = self.records["time"]
+        for name in FIELDS:
+            setattr(self, name, self.records[name] if name in self.fields else None)
+
+    def __len__(self):
+        """The number of frames"""
+        return len(self.records)
+
+    def __getitem__(self, index):
+        """Return a dictionary with the arrays of one frame"""
+        record = self.records[index]
+        result = {"time": float(record["time"])}
+        for name in self.fields:
+            result[name] = record[name]
+        return result
+
+
+def dump_binary_trajectory(reader, filename, dtype=np.float64, source=None):
+    """Write the (remaining) frames of a reader to a binary trajectory file
+
+       Arguments:
+        | ``reader``  --  a SlicedReader instance whose frames can be
+                          converted to arrays, e.g. an XYZReader or a
+                          DLPolyHistoryReader
+        | ``filename``  --  the binary trajectory file
+
+       Optional arguments:
+        | ``dtype``  --  np.float64 or np.float32, the precision of the
+                         coordinates, the cell vectors, ...
+        | ``source``  --  a tuple (size, mtime, key) that describes the source
+                          of the frames. It is stored in the header, such that
+                          the file can be used as a cache.
+
+       The file is written to a temporary file first, which is only renamed
+       after all frames are written. The frames are written one at a time,
+       such that the memory usage does not depend on the number of frames.
+       Returns a BinaryTrajectory instance.
+    """
+    itemsize = np.dtype(dtype).itemsize
+    if source is None:
+        source = (-1, 0.0, "")
+    tmp_filename = filename + ".tmp"
+    try:
+        with open(tmp_filename, "wb") as f:
+            header = np.zeros(1, header_dtype)
+            header["magic"] = MAGIC
+            header["version"] = VERSION
+            header["itemsize"] = itemsize
+            header["source_size"] = source[0]
+            header["source_mtime"] = source[1]
+            header["source_key"] = source[2].encode()
+            record = None
+            for frame in reader:
+                arrays = reader._get_frame_arrays(frame)
+                if record is None:
+                    fields = [name for name in FIELDS if name in arrays]
+                    natom = len(arrays["pos"]) if "pos" in arrays else 0
+                    header["natom"] = natom
+                    header["fields"] = sum(1 << index for index, name in enumerate(FIELDS) if name in fields)
+                    f.write(header.tobytes())
+                    record = np.zeros(1, get_record_dtype(natom, fields, itemsize))
+                elif set(arrays) - set(["time"]) != set(fields):
+                    raise FileFormatError("All frames must contain the same fields.")
+                record["time"] = arrays.get("time", 0.0)
+                for name in fields:
+                    record[name] = arrays[name]
+                f.write(record.tobytes())
+            if record is None:
+                raise FileFormatError("The trajectory does not contain any frames.")
+        os.rename(tmp_filename, filename)
+    finally:
+        if os.path.isfile(tmp_filename):
+            os.remove(tmp_filename)
+    return BinaryTrajectory(filename)
+
+
+def _get_lammps_reader(filename, unit_style):
+    """Return a LAMMPSDumpReader for the arrays in a dump file
+
+       Arguments:
+        | ``filename``  --  the LAMMPS dump file
+        | ``unit_style``  --  ``real`` or ``metal``, see the units command of
+                              LAMMPS
+
+       The columns for the positions, velocities and forces are looked up in
+       the first ``ITEM: ATOMS`` line.
+    """
+    from molmod.io.lammps import LAMMPSDumpReader
+    from molmod.units import angstrom, femtosecond, picosecond, kcalmol, electronvolt
+    units = {
+        "real": {"pos": angstrom, "vel": angstrom/femtosecond, "frc": kcalmol/angstrom},
+        "metal": {"pos": angstrom, "vel": angstrom/picosecond, "frc": electronvolt/angstrom},
+    }[unit_style]
+    with open(filename) as f:
+        for line in f:
+            if line.startswith("ITEM: ATOMS"):
+                names = line.split()[2:]
+                break
+        else:
+            raise FileFormatError("Could not find line 'ITEM: ATOMS'.")
+    columns = []
+    column_units = []
+    for key, alternatives in LAMMPSDumpReader._array_columns:
+        for alternative in alternatives:
+            if all(name in names for name in alternative):
+                columns.extend(alternative)
+                column_units.extend([units[key]]*3)
+                break
+    return LAMMPSDumpReader(filename, column_units, columns=columns, sort=True, box=True)
+
+
+def main(args=None):
+    """Convert a trajectory file to a binary trajectory file"""
+    import argparse
+    from molmod.io.atrj import ATRJReader
+    from molmod.io.cpmd import CPMDTrajectoryReader
+    from molmod.io.dlpoly import DLPolyHistoryReader
+    from molmod.io.gromacs import GroReader
+    from molmod.io.lammps import LAMMPSDumpReader
+    from molmod.io.xyz import XYZReader
+    readers = {
+        "atrj": ATRJReader, "cpmd": CPMDTrajectoryReader, "dlpoly": DLPolyHistoryReader,
+        "gro": GroReader, "lammps": LAMMPSDumpReader, "xyz": XYZReader,
+    }
+    parser = argparse.ArgumentParser(
+        prog="python -m molmod.io.binary_trajectory", description=main.__doc__)
+    parser.add_argument("format", choices=sorted(readers), help="the format of the input file")
+    parser.add_argument("input", help="the trajectory file")
+    parser.add_argument("output", help="the binary trajectory file")
+    parser.add_argument("--single", default=False, action="store_true",
+                        help="store values in single instead of double precision")
+    parser.add_argument("--lammps-units", default="real", choices=["real", "metal"],
+                        help="the units of a LAMMPS dump file [default=%(default)s]")
+    args = parser.parse_args(args)
+    if args.format == "lammps":
+        # The columns and units can not be passed on the command line.
+        reader = _get_lammps_reader(args.input, args.lammps_units)
+    else:
+        reader = readers[args.format](args.input)
+    bt = dump_binary_trajectory(reader, args.output, np.float32 if args.single else np.float64)
+    print("Wrote %i frames with %i atoms to %s" % (len(bt), bt.natom, args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -20,89 +20,280 @@
 # along with this program; if not, see <http://www.gnu.org/licenses/>
 #
 # --
-
-
 from __future__ import print_function
 
+from builtins import range
 import numpy as np
 
 
 __all__ = ['load_chk', 'dump_chk']
 
 
-def load_chk(filename):
+# The first line of a binary checkpoint file. (Text checkpoint files start
+# with a header line of at least 54 characters.)
+BINARY_MAGIC = b'MOLMOD BINARY CHK 1\n'
+
+# The dtypes of the arrays in text and binary checkpoint files.
+text_dtypes = {'str': np.dtype('U22'), 'int': int, 'bln': bool, 'flt': float}
+binary_dtypes = {
+    'str': np.dtype('<U22'), 'int': np.dtype('<i8'), 'bln': np.dtype('?'),
+    'flt': np.dtype('<f8'),
+}
+
+# The arrays in binary files start at a multiple of this number of bytes.
+binary_alignment = 8
+
+
+def load_chk(filename, mmap_mode=None):
     '''Load a checkpoint file
 
        Argument:
         | filename  --  the file to load from
 
+       Optional argument:
+        | mmap_mode  --  When given, the arrays in a binary checkpoint file are
+                         memory-mapped instead of read into memory. This
+                         argument is passed on to np.memmap, e.g. 'r' or
+                         'c'. It has no effect on text checkpoint files.
+
        The return value is a dictionary whose keys are field labels and the
        values can be None, string, integer, float, boolean or an array of
        strings, integers, booleans or floats.
 
        The file format is similar to the Gaussian fchk format, but has the extra
-       feature that the shapes of the arrays are also stored.
+       feature that the shapes of the arrays are also stored. Text and binary
+       checkpoint files (see dump_chk) are detected automatically.
+    '''
+    with open(filename, 'rb') as f:
+        if f.read(len(BINARY_MAGIC)) == BINARY_MAGIC:
+            return _load_chk_binary(f, filename, mmap_mode)
+        f.seek(0)
+        return _load_chk_text(f.read())
+
+
+def _parse_header(line):
+    '''Split a header line in a key, a kind and a value'''
+    if len(line) < 53:
+        raise IOError('Header lines must be at least 54 characters long.')
+    return line[:40].strip(), line[47:52].strip(), line[53:]
+
+
+def _parse_scalar(kind, value):
+    '''Convert the value of a header line without an array'''
+    if kind == 'str':
+        return value
+    elif kind == 'int':
+        return int(value)
+    elif kind == 'bln':
+        return value.lower() in ['true', '1', 'yes']
+    elif kind == 'flt':
+        return float(value)
+    elif kind == 'none':
+        return None
+    else:
+        raise IOError('Unsupported kind: %s' % kind)
+
+
+def _parse_array_kind(kind, value, dtypes):
+    '''Return the dtype and the shape of an array'''
+    dtype = dtypes.get(kind[:3])
+    if dtype is None:
+        raise IOError('Unsupported kind: %s' % kind)
+    shape = tuple(int(i) for i in value.split(','))
+    return dtype, shape
+
+
+def _load_chk_text(data):
+    '''Load the contents of a text checkpoint file'''
+    result = {}
+    pos = 0
+    while pos < len(data):
+        end = data.find(b'\n', pos)
+        if end == -1:
+            end = len(data)
+        line = data[pos:end].decode().rstrip('\r')
+        pos = end + 1
+        key, kind, value = _parse_header(line)
+        if kind[3:5] == 'ar':
+            dtype, shape = _parse_array_kind(kind, value, text_dtypes)
+            result[key], pos = _read_text_array(data, pos, dtype, shape)
+        else:
+            result[key] = _parse_scalar(kind, value)
+    return result
+
+
+def _read_text_array(data, pos, dtype, shape):
+    '''Read an array from a text checkpoint file
+
+       Arguments:
+        | data  --  the contents of the file
+        | pos  --  the position where the array starts
+        | dtype  --  the dtype of the array
+        | shape  --  the shape of the array
+
+       Returns the array and the position of the first line after the array.
     '''
-    with open(filename) as f:
-        result = {}
-        while True:
-            line = f.readline()
-            if line == '':
-                break
-            if len(line) < 54:
-                raise IOError('Header lines must be at least 54 characters long.')
-            key = line[:40].strip()
-            kind = line[47:52].strip()
-            value = line[53:-1] # discard newline
-            if kind == 'str':
-                result[key] = value
-            elif kind == 'int':
-                result[key] = int(value)
-            elif kind == 'bln':
-                result[key] = value.lower() in ['true', '1', 'yes']
-            elif kind == 'flt':
-                result[key] = float(value)
-            elif kind[3:5] == 'ar':
-                if kind[:3] == 'str':
-                    dtype = np.dtype('U22')
-                elif kind[:3] == 'int':
-                    dtype = int
-                elif kind[:3] == 'bln':
-                    dtype = bool
-                elif kind[:3] == 'flt':
-                    dtype = float
+    size = int(np.prod(shape))
+    if size == 0:
+        return np.zeros(shape, dtype), pos
+    if dtype is float or dtype is int:
+        from molmod.ext import parsing_numbers
+        try:
+            array, consumed = parsing_numbers(memoryview(data)[pos:], size)
+        except ValueError:
+            pass
+        else:
+            if dtype is int:
+                int_array = array.astype(int)
+                # Large integers can not be represented exactly by a float.
+                if (int_array != array).any() or abs(array).max() >= 2**53:
+                    array = None
                 else:
-                    raise IOError('Unsupported kind: %s' % kind)
-                shape = tuple(int(i) for i in value.split(','))
-                array = np.zeros(shape, dtype)
-                if array.size > 0:
-                    work = array.ravel()
-                    counter = 0
-                    while True:
-                        short = f.readline().split()
-                        if len(short) == 0:
-                            raise IOError('Insufficient data')
-                        for s in short:
-                            if dtype == bool:
-                                work[counter] = s.lower() in ['true', '1', 'yes']
-                            elif callable(dtype):
-                                work[counter] = dtype(s)
-                            else:
-                                work[counter] = s
-                            counter += 1
-                            if counter == array.size:
-                                break
-                        if counter == array.size:
-                            break
-                result[key] = array
-            elif kind == 'none':
-                result[key] = None
+                    array = int_array
+            if array is not None:
+                end = data.find(b'\n', pos + consumed)
+                return array.reshape(shape), (len(data) if end == -1 else end + 1)
+    # Generic code for strings, booleans and unusually formatted numbers.
+    words = []
+    while len(words) < size:
+        end = data.find(b'\n', pos)
+        if end == -1:
+            end = len(data)
+        short = data[pos:end].split()
+        if len(short) == 0:
+            raise IOError('Insufficient data')
+        words.extend(short)
+        pos = end + 1
+    words = words[:size]
+    if dtype is bool:
+        array = np.array([word.lower() in [b'true', b'1', b'yes'] for word in words])
+    elif dtype is int or dtype is float:
+        array = np.array([dtype(word) for word in words], dtype)
+    else:
+        array = np.array([word.decode() for word in words], dtype)
+    return array.reshape(shape), pos
+
+
+def _load_chk_binary(f, filename, mmap_mode):
+    '''Load the contents of a binary checkpoint file
+
+       Arguments:
+        | f  --  the file object, positioned after the magic line
+        | filename  --  the filename of the file
+        | mmap_mode  --  the mode for np.memmap or None
+    '''
+    result = {}
+    buf = None
+    if mmap_mode is not None:
+        buf = np.memmap(filename, np.uint8, mmap_mode)
+    while True:
+        line = f.readline()
+        if len(line) == 0:
+            break
+        key, kind, value = _parse_header(line.decode().rstrip('\n'))
+        if kind[3:5] == 'ar':
+            dtype, shape = _parse_array_kind(kind, value, binary_dtypes)
+            begin = -(-f.tell()//binary_alignment)*binary_alignment
+            nbytes = int(np.prod(shape))*dtype.itemsize
+            if buf is None:
+                f.seek(begin)
+                payload = bytearray(nbytes)
+                if f.readinto(payload) != nbytes:
+                    raise IOError('Insufficient data')
+                array = np.frombuffer(payload, dtype)
             else:
-                raise IOError('Unsupported kind: %s' % kind)
+                if begin + nbytes > len(buf):
+                    raise IOError('Insufficient data')
+                array = buf[begin:begin+nbytes].view(dtype)
+            result[key] = array.reshape(shape)
+            f.seek(begin + nbytes)
+        else:
+            result[key] = _parse_scalar(kind, value)
     return result
 
 
-def dump_chk(filename, data):
+def _iter_fields(data):
+    '''Check and convert the fields to be written to a checkpoint file
+
+       Argument:
+        | data  --  see dump_chk
+
+       Yields tuples (key, kind, value) with the information for a header line
+       and, in case of arrays, the corresponding numpy array.
+    '''
+    for key, value in sorted(data.items()):
+        if not isinstance(key, str):
+            raise TypeError('The keys must be strings.')
+        if len(key) > 40:
+            raise ValueError('Key strings cannot be longer than 40 characters.')
+        if '\n' in key:
+            raise ValueError('Key strings cannot contain newlines.')
+        if isinstance(value, str):
+            if len(value) > 256:
+                raise ValueError('Only small strings are supported (256 chars).')
+            if '\n' in value:
+                raise ValueError('The string cannot contain new lines.')
+            yield key, 'str', value, None
+        elif isinstance(value, bool):
+            yield key, 'bln', '%s' % value, None
+        elif isinstance(value, (int, np.integer)):
+            yield key, 'int', '%i' % value, None
+        elif isinstance(value, float):
+            yield key, 'flt', '%22.15e' % value, None
+        elif isinstance(value, np.ndarray) or isinstance(value, list) or \
+             isinstance(value, tuple):
+            if isinstance(value, list) or isinstance(value, tuple):
+                value = np.array(value)
+            if value.dtype.fields is not None:
+                raise TypeError('Arrays with fields are not supported.')
+            shape_str = ','.join(str(i) for i in value.shape)
+            if issubclass(value.dtype.type, (str, np.unicode, np.bytes_)):
+                value = value.astype(np.unicode)
+                for cell in value.flat:
+                    if len(cell) >= 22:
+                        raise ValueError('In case of string arrays, a string may contain at most 21 characters.')
+                    if ' ' in cell or '\n' in cell:
+                        raise ValueError('In case of string arrays, a string may not contain spaces or new lines.')
+                yield key, 'strar', shape_str, value
+            elif issubclass(value.dtype.type, np.integer):
+                yield key, 'intar', shape_str, value
+            elif issubclass(value.dtype.type, np.bool_):
+                yield key, 'blnar', shape_str, value
+            elif issubclass(value.dtype.type, float):
+                yield key, 'fltar', shape_str, value
+            else:
+                raise TypeError('Numpy array type %s not supported.' % value.dtype.type)
+        elif value is None:
+            yield key, 'none', ' None', None
+        else:
+            raise TypeError('Type %s not supported.' % type(value))
+
+
+def _format_header(key, kind, value):
+    '''Return a header line, including the newline'''
+    return '%40s  kind=%-5s %s\n' % (key.ljust(40), kind, value)
+
+
+# The format of the values in text checkpoint files, four per line.
+text_formats = {'str': '%22s', 'int': '%22i', 'bln': '%22s', 'flt': '%22.15e'}
+
+
+def _write_text_array(f, format_str, array):
+    '''Write the values of an array, four per line, to a text checkpoint file'''
+    values = array.ravel().tolist()
+    nfull = (len(values)//4)*4
+    row_format = ' '.join([format_str]*4) + '\n'
+    # Format many lines at once, without building one huge string.
+    chunk_size = 4096
+    for begin in range(0, nfull, chunk_size):
+        chunk = values[begin:min(begin + chunk_size, nfull)]
+        f.write((row_format*(len(chunk)//4)) % tuple(chunk))
+    if nfull < len(values):
+        rest = values[nfull:]
+        f.write(' '.join([format_str]*len(rest)) % tuple(rest) + '\n')
+
+
+def dump_chk(filename, data, binary=False):
     '''Dump a checkpoint file
 
        Argument:
@@ -111,66 +302,31 @@ def dump_chk(filename, data):
                    be None, string, integer, float, boolean, an array/list of
                    strings, integers, floats or booleans.
 
+       Optional argument:
+        | binary  --  When True, a binary checkpoint file is written.
+
        The file format is similar to the Gaussian fchk format, but has the extra
        feature that the shapes of the arrays are also stored.
+
+       A binary checkpoint file starts with a line ``MOLMOD BINARY CHK 1``
+       and has the same header lines as a text file. The values of an array
+       are not written as text but as raw little-endian data, starting at the
+       next multiple of 8 bytes after the header line. Such arrays can be
+       memory-mapped by load_chk.
     '''
-    with open(filename, 'w') as f:
-        for key, value in sorted(data.items()):
-            if not isinstance(key, str):
-                raise TypeError('The keys must be strings.')
-            if len(key) > 40:
-                raise ValueError('Key strings cannot be longer than 40 characters.')
-            if '\n' in key:
-                raise ValueError('Key strings cannot contain newlines.')
-            if isinstance(value, str):
-                if len(value) > 256:
-                    raise ValueError('Only small strings are supported (256 chars).')
-                if '\n' in value:
-                    raise ValueError('The string cannot contain new lines.')
-                print('%40s  kind=str   %s' % (key.ljust(40), value), file=f)
-            elif isinstance(value, bool):
-                print('%40s  kind=bln   %s' % (key.ljust(40), value), file=f)
-            elif isinstance(value, (int, np.integer)):
-                print('%40s  kind=int   %i' % (key.ljust(40), value), file=f)
-            elif isinstance(value, float):
-                print('%40s  kind=flt   %22.15e' % (key.ljust(40), value), file=f)
-            elif isinstance(value, np.ndarray) or isinstance(value, list) or \
-                 isinstance(value, tuple):
-                if isinstance(value, list) or isinstance(value, tuple):
-                    value = np.array(value)
-                if value.dtype.fields is not None:
-                    raise TypeError('Arrays with fields are not supported.')
-                shape_str = ','.join(str(i) for i in value.shape)
-                if issubclass(value.dtype.type, (str, np.unicode, np.bytes_)):
-                    value = value.astype(np.unicode)
-                    for cell in value.flat:
-                        if len(cell) >= 22:
-                            raise ValueError('In case of string arrays, a string may contain at most 21 characters.')
-                        if ' ' in cell or '\n' in cell:
-                            raise ValueError('In case of string arrays, a string may not contain spaces or new lines.')
-                    print('%40s  kind=strar %s' % (key.ljust(40), shape_str), file=f)
-                    format_str = '%22s'
-                elif issubclass(value.dtype.type, np.integer):
-                    print('%40s  kind=intar %s' % (key.ljust(40), shape_str), file=f)
-                    format_str = '%22i'
-                elif issubclass(value.dtype.type, np.bool_):
-                    print('%40s  kind=blnar %s' % (key.ljust(40), shape_str), file=f)
-                    format_str = '%22s'
-                elif issubclass(value.dtype.type, float):
-                    print('%40s  kind=fltar %s' % (key.ljust(40), shape_str), file=f)
-                    format_str = '%22.15e'
-                else:
-                    raise TypeError('Numpy array type %s not supported.' % value.dtype.type)
-                short_len = 4
-                short = []
-                for x in value.ravel():
-                    short.append(x)
-                    if len(short) == 4:
-                        print(' '.join(format_str  % s for s in short), file=f)
-                        short = []
-                if len(short) > 0:
-                    print(' '.join(format_str  % s for s in short), file=f)
-            elif value is None:
-                print('%40s  kind=none   None' % key.ljust(40), file=f)
-            else:
-                raise TypeError('Type %s not supported.' % type(value))
+    if binary:
+        with open(filename, 'wb') as f:
+            f.write(BINARY_MAGIC)
+            for key, kind, value, array in _iter_fields(data):
+                f.write(_format_header(key, kind, value).encode())
+                if array is not None:
+                    padding = -f.tell() % binary_alignment
+                    f.write(b'\0'*padding)
+                    array = np.ascontiguousarray(array, binary_dtypes[kind[:3]])
+                    f.write(array.tobytes())
+    else:
+        with open(filename, 'w') as f:
+            for key, kind, value, array in _iter_fields(data):
+                f.write(_format_header(key, kind, value))
+                if array is not None:
+                    _write_text_array(f, text_formats[kind[:3]], array)
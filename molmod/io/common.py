@@ -24,6 +24,12 @@
 
 
 from builtins import object
+from collections import deque
+from itertools import islice
+import multiprocessing
+import os
+
+import numpy as np
 
 
 try:
@@ -32,7 +38,10 @@ except NameError:
     basestring = str
 
 
-__all__ = ["slice_match", "FileFormatError", "SlicedReader"]
+__all__ = [
+    "slice_match", "skip_lines", "FileFormatError", "SlicedReader",
+    "parallel_frames",
+]
 
 
 def slice_match(sub, counter):
@@ -60,13 +69,51 @@ def slice_match(sub, counter):
     return True
 
 
+def skip_lines(f, num):
+    """Skip a number of lines in a file and return how many could be skipped
+
+       Arguments:
+        | ``f``  --  a file object
+        | ``num``  --  the number of lines to skip
+    """
+    counter = 0
+    for line in f:
+        counter += 1
+        if counter == num:
+            break
+    return counter
+
+
 class FileFormatError(Exception):
     """Is raised when unexpected data is encountered while reading a file"""
     pass
 
 
 class SlicedReader(object):
-    """Base class for readers that can read a slice of all the frames"""
+    """Base class for readers that can read a slice of all the frames
+
+       Subclasses that implement ``_scan_frame_offsets`` also support random
+       access, ``len(reader)`` (once the frames are indexed) and skipping of
+       frames by seeking. The byte offsets of all frames are then determined
+       with one scan of the file and stored in a sidecar file,
+       ``filename + '.offsets.npz'``, if the file is larger than
+       ``sidecar_min_size`` bytes. The sidecar file is only reused when the
+       size and the modification time of the trajectory file have not
+       changed. When an up-to-date sidecar file exists, iterating over a slice
+       of the frames also uses seeks instead of reading the skipped frames.
+    """
+
+    # Smaller files are scanned again instead of writing a sidecar file.
+    sidecar_min_size = 16*1024*1024
+
+    # The counter of the first frame, as used by the sub argument.
+    _first_counter = 0
+
+    # The mode used to open the file when a filename is given.
+    _file_mode = "r"
+
+    # The attributes that affect the arrays in a binary trajectory file.
+    _binary_options = ()
 
     def __init__(self, f, sub=slice(None)):
         """
@@ -79,12 +126,20 @@ class SlicedReader(object):
         """
         if isinstance(f, basestring):
             self._auto_close = True
-            self._f = open(f)
+            self._f = open(f, self._file_mode)
+            self._filename = f
         else:
             self._auto_close = False
             self._f = f
+            self._filename = getattr(f, "name", None)
+            if not (isinstance(self._filename, basestring) and os.path.isfile(self._filename)):
+                self._filename = None
         self._sub = sub
-        self._counter = 0
+        self._counter = self._first_counter
+        self._frame_offsets = None
+        self._sidecar_checked = False
+        self._binary = isinstance(self._f.read(0), bytes)
+        self._block_size = 0
 
     def __del__(self):
         """Clean up the open file"""
@@ -95,10 +150,241 @@ class SlicedReader(object):
         """Read a single frame from the trajectory"""
         raise NotImplementedError
 
+    def _readline(self):
+        """Read a line as a string with a Unix newline or raise StopIteration
+
+           This also works for files opened in binary mode.
+        """
+        line = self._f.readline()
+        if len(line) == 0:
+            raise StopIteration
+        if not isinstance(line, str):
+            line = line.decode().replace("\r\n", "\n")
+        return line
+
+    def _read_lines(self, nline):
+        """Read a number of lines as a single bytes object
+
+           Raises StopIteration when the file ends before all lines are read.
+           Files opened in binary mode are read in large blocks, after which
+           the file is moved back to the end of the last line.
+        """
+        if not self._binary:
+            lines = [self._f.readline() for counter in range(nline)]
+            if nline > 0 and len(lines[-1]) == 0:
+                raise StopIteration
+            return "".join(lines).encode()
+        if nline == 0:
+            return b""
+        start = self._f.tell()
+        data = self._f.read(max(self._block_size, 1024))
+        while True:
+            newlines = np.flatnonzero(np.frombuffer(data, np.uint8) == ord("\n"))
+            if len(newlines) >= nline:
+                end = newlines[nline-1] + 1
+                break
+            more = self._f.read(len(data))
+            if len(more) == 0:
+                # The last line may not have a newline at the end of the file.
+                if len(newlines) == nline - 1 and len(data) > 0 and data[-1:] != b"\n":
+                    end = len(data)
+                    break
+                raise StopIteration
+            data += more
+        # Make sure the next block is large enough.
+        self._block_size = max(self._block_size, end*5//4 + 256)
+        self._f.seek(start + end)
+        return data[:end]
+
+    def _read_table(self, nrow, columns):
+        """Read a number of lines and convert the selected columns at once
+
+           Arguments:
+            | ``nrow``  --  the number of lines to read
+            | ``columns``  --  an array with the (increasing) indexes of the
+                               whitespace-separated words to convert
+
+           Returns an array with shape (nrow, len(columns)). When the lines
+           can not be converted, a list with the lines is returned instead,
+           such that the caller can figure out what is wrong.
+
+           Files opened in binary mode are read in large blocks, which likely
+           contain all lines. The file is moved back to the end of the last
+           line afterwards.
+        """
+        from molmod.ext import parsing_table
+        if self._binary:
+            start = self._f.tell()
+            block = self._f.read(self._block_size)
+            try:
+                table, consumed = parsing_table(block, nrow, columns)
+                self._f.seek(start + consumed)
+                return table
+            except ValueError:
+                self._f.seek(start)
+        lines = [self._f.readline() for counter in range(nrow)]
+        if self._binary:
+            data = b"".join(lines)
+            # Make sure the next block is large enough.
+            self._block_size = max(self._block_size, len(data)*5//4 + 256)
+        else:
+            data = "".join(lines).encode()
+        try:
+            return parsing_table(data, nrow, columns)[0]
+        except ValueError:
+            return lines
+
     def _skip_frame(self):
         """Skip a single frame from the trajectory"""
         raise NotImplementedError
 
+    def _scan_frame_offsets(self, f):
+        """Iterate over the byte offsets of all (complete) frames
+
+           Argument:
+            | ``f``  --  the trajectory file, opened in binary mode
+
+           This should be a fast scan that does not interpret the data in the
+           frames. Subclasses that support random access implement this
+           method.
+        """
+        raise NotImplementedError
+
+    def _get_frame_arrays(self, frame):
+        """Return a dictionary with the arrays of a frame
+
+           Argument:
+            | ``frame``  --  a frame as returned by _read_frame
+
+           The dictionary may contain the keys ``time``, ``cell``, ``pos``,
+           ``vel`` and ``frc``, all in atomic units. Subclasses implement
+           this method to support binary trajectory files, see
+           molmod.io.binary_trajectory.
+        """
+        raise NotImplementedError
+
+    def _seek_frame(self, offset):
+        """Move the file to the beginning of a frame"""
+        self._f.seek(offset)
+
+    def _get_sidecar_key(self):
+        """Return the properties that must match to reuse the sidecar file"""
+        stat = os.stat(self._filename)
+        return stat.st_size, stat.st_mtime, self.__class__.__name__
+
+    def _load_frame_offsets(self):
+        """Return the offsets from the sidecar file or None if it is outdated"""
+        try:
+            with open(self._filename + ".offsets.npz", "rb") as f:
+                data = np.load(f)
+                key = (int(data["size"]), float(data["mtime"]), str(data["reader"]))
+                if key == self._get_sidecar_key():
+                    return data["offsets"]
+        except (IOError, OSError, KeyError, ValueError):
+            pass
+
+    def _get_frame_offsets(self):
+        """The byte offsets of all frames in the file"""
+        if self._frame_offsets is None:
+            if self._filename is None:
+                raise TypeError("Random access requires a trajectory file with a file name.")
+            offsets = self._load_frame_offsets()
+            if offsets is None:
+                key = self._get_sidecar_key()
+                with open(self._filename, "rb") as f:
+                    offsets = np.array(list(self._scan_frame_offsets(f)), np.int64)
+                if key[0] >= self.sidecar_min_size:
+                    try:
+                        with open(self._filename + ".offsets.npz", "wb") as f:
+                            np.savez(f, size=key[0], mtime=key[1], reader=key[2], offsets=offsets)
+                    except (IOError, OSError):
+                        # The index is still used, even if it can not be stored.
+                        pass
+            self._frame_offsets = offsets
+        return self._frame_offsets
+
+    frame_offsets = property(_get_frame_offsets)
+
+    def _get_selected_frames(self):
+        """Return the indexes of the frames selected by the sub argument"""
+        first = self._first_counter
+        counters = np.arange(*self._sub.indices(len(self.frame_offsets) + first))
+        return counters[counters >= first] - first
+
+    def __len__(self):
+        """The number of frames selected by the sub argument
+
+           This requires the frame index, which is built when ``frame_offsets``
+           or a frame by index is accessed for the first time. When there is
+           no index yet (nor an up-to-date sidecar file), a TypeError is
+           raised instead of scanning the whole file. As a result, e.g.
+           ``list(reader)`` reads the file only once.
+        """
+        if self._frame_offsets is None and self._filename is not None:
+            self._frame_offsets = self._load_frame_offsets()
+        if self._frame_offsets is None:
+            raise TypeError("The length of the reader is not known before the "
+                "frames are indexed. Access frame_offsets first.")
+        return len(self._get_selected_frames())
+
+    def __getitem__(self, index):
+        """Read one of the frames selected by the sub argument
+
+           Argument:
+            | ``index``  --  an integer, negative values count from the end
+
+           The iterator continues with the frames after the returned frame.
+        """
+        frame = self._get_selected_frames()[index]
+        self._seek_frame(self.frame_offsets[frame])
+        self._counter = frame + self._first_counter
+        result = self._read_frame()
+        self._counter += 1
+        return result
+
+    def get_binary_trajectory(self, filename=None, dtype=np.float64):
+        """Return the selected frames as a memory-mapped binary trajectory
+
+           Optional arguments:
+            | ``filename``  --  the binary trajectory file [default=the
+                                trajectory file name with suffix
+                                ``.bintrj``]
+            | ``dtype``  --  np.float64 or np.float32, the precision of the
+                             values in the binary file
+
+           When the binary file was created from the same trajectory file
+           (same size and modification time) with the same reader settings,
+           it is used without reading the trajectory file. Otherwise, the
+           binary file is (re)created from the frames of this reader. In that
+           case, no frames may have been read from this reader yet.
+
+           Returns a BinaryTrajectory instance.
+        """
+        from molmod.io.binary_trajectory import BinaryTrajectory, dump_binary_trajectory
+        if self._filename is None:
+            raise TypeError("Binary trajectories require a trajectory file with a file name.")
+        if filename is None:
+            filename = self._filename + ".bintrj"
+        stat = os.stat(self._filename)
+        key = "%s %r %r %i" % (
+            self.__class__.__name__,
+            tuple(getattr(self, name) for name in self._binary_options),
+            (self._sub.start, self._sub.stop, self._sub.step),
+            np.dtype(dtype).itemsize,
+        )
+        source = (stat.st_size, stat.st_mtime, key)
+        if os.path.isfile(filename):
+            try:
+                binary_trajectory = BinaryTrajectory(filename)
+                if (binary_trajectory.source_size, binary_trajectory.source_mtime,
+                    binary_trajectory.source_key) == source:
+                    return binary_trajectory
+            except FileFormatError:
+                pass
+        if self._counter != self._first_counter:
+            raise ValueError("The binary trajectory must be created before reading frames.")
+        return dump_binary_trajectory(self, filename, dtype, source)
+
     def __iter__(self):
         return self
 
@@ -107,11 +393,109 @@ class SlicedReader(object):
 
            This method is part of the iterator protocol.
         """
-        # skip frames as requested
-        while not slice_match(self._sub, self._counter):
-            self._skip_frame()
-            self._counter += 1
+        if self._frame_offsets is None and not self._sidecar_checked:
+            self._sidecar_checked = True
+            if self._filename is not None and self._sub != slice(None):
+                self._frame_offsets = self._load_frame_offsets()
+
+        if self._frame_offsets is None:
+            # skip frames as requested
+            while not slice_match(self._sub, self._counter):
+                self._skip_frame()
+                self._counter += 1
+        else:
+            # seek to the next frame as requested
+            counter = self._counter
+            while True:
+                if counter - self._first_counter >= len(self._frame_offsets):
+                    raise StopIteration
+                if slice_match(self._sub, counter):
+                    break
+                counter += 1
+            if counter != self._counter:
+                self._seek_frame(self._frame_offsets[counter - self._first_counter])
+                self._counter = counter
 
         result = self._read_frame()
         self._counter += 1
         return result
+
+
+# Readers that are reused by the tasks of parallel_frames in a worker process.
+_worker_readers = {}
+
+
+def _read_frames_worker(args):
+    """Read the frames at the given offsets, see parallel_frames
+
+       Returns a list of frames and a flag that is True when the reader
+       stopped early, e.g. at an incomplete frame at the end of the file.
+    """
+    reader_cls, filename, kwargs, frames, offsets = args
+    key = (reader_cls, filename, repr(sorted(kwargs.items())))
+    reader = _worker_readers.get(key)
+    if reader is None:
+        _worker_readers.clear()
+        reader = reader_cls(filename, **kwargs)
+        _worker_readers[key] = reader
+    result = []
+    for frame, offset in zip(frames, offsets):
+        reader._seek_frame(offset)
+        reader._counter = frame + reader._first_counter
+        try:
+            result.append(reader._read_frame())
+        except StopIteration:
+            return result, True
+    return result, False
+
+
+def parallel_frames(reader_cls, filename, workers=1, sub=slice(None), chunksize=16, **kwargs):
+    """Iterate over the frames of a trajectory file, parsed by a pool of processes
+
+       Arguments:
+        | ``reader_cls``  --  a subclass of SlicedReader that supports random
+                              access, e.g. XYZReader or DLPolyHistoryReader
+        | ``filename``  --  the trajectory file
+
+       Optional arguments:
+        | ``workers``  --  The number of worker processes. When 1, all frames
+                           are read in the current process.
+        | ``sub``  --  a slice indicating which frames to read/skip
+        | ``chunksize``  --  The number of consecutive frames parsed by a
+                             worker at once.
+
+       All other keyword arguments are passed to the constructor of the reader.
+
+       The file is split at frame boundaries with the frame offset index of
+       the reader. Each worker seeks to the beginning of its chunk and parses
+       it. The frames are yielded in the same order as with the reader. At
+       most ``2*workers`` chunks are pending at any time, such that the
+       memory usage does not depend on the size of the file.
+    """
+    reader = reader_cls(filename, sub=sub, **kwargs)
+    if workers <= 1:
+        for frame in reader:
+            yield frame
+        return
+    frames = reader._get_selected_frames()
+    offsets = reader.frame_offsets[frames]
+    pool = multiprocessing.Pool(workers)
+    try:
+        pending = deque()
+        begins = iter(range(0, len(frames), chunksize))
+        while True:
+            # Keep the number of pending chunks bounded.
+            for begin in islice(begins, 2*workers - len(pending)):
+                end = begin + chunksize
+                pending.append(pool.apply_async(_read_frames_worker, [(
+                    reader_cls, filename, kwargs, frames[begin:end], offsets[begin:end]
+                )]))
+            if len(pending) == 0:
+                break
+            result, stopped = pending.popleft().get()
+            for frame in result:
+                yield frame
+            if stopped:
+                break
+    finally:
+        pool.terminate()
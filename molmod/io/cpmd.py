@@ -26,7 +26,7 @@
 from builtins import range
 import numpy as np
 
-from molmod.io.common import SlicedReader
+from molmod.io.common import SlicedReader, skip_lines
 
 
 __all__ = ["CPMDTrajectoryReader"]
@@ -76,7 +76,19 @@ class CPMDTrajectoryReader(SlicedReader):
             vel[i, 2] = float(words[6])
         return pos, vel
 
+    def _get_frame_arrays(self, frame):
+        """Return a dictionary with the arrays of a frame, see SlicedReader"""
+        return {"pos": frame[0], "vel": frame[1]}
+
     def _skip_frame(self):
         """Skip the next time frame"""
         for i in range(self.num_atoms):
             line = next(self._f)
+
+    def _scan_frame_offsets(self, f):
+        """Iterate over the byte offsets of all frames, see SlicedReader"""
+        while True:
+            offset = f.tell()
+            if skip_lines(f, self.num_atoms) < self.num_atoms:
+                return
+            yield offset
@@ -26,12 +26,15 @@
 from __future__ import print_function
 
 from builtins import range, object
+import os
+
 import numpy as np
 
 from molmod.molecules import Molecule
+from molmod.io.common import FileFormatError
 
 
-__all__ = ['get_cube_points', 'CubeReader', 'Cube']
+__all__ = ['get_cube_points', 'CubePoints', 'CubeReader', 'Cube']
 
 
 def get_cube_points(origin, axes, nrep):
@@ -56,10 +59,69 @@ def get_cube_points(origin, axes, nrep):
     return points
 
 
+class CubePoints(object):
+    '''The Cartesian coordinates of the points in a cube file, computed on demand
+
+       This object is returned by Cube.get_points_lazy. It can be indexed
+       like a read-only array with shape (nrep[0], nrep[1], nrep[2], 3), but
+       only the coordinates that are selected with an index are computed. It
+       is not an ndarray: use ``np.asarray`` to get all points at once. The
+       attributes ``ndim``, ``size`` and ``dtype`` and the method ``reshape``
+       are provided for convenience.
+    '''
+    dtype = np.dtype(float)
+    ndim = 4
+
+    def __init__(self, origin, axes, nrep):
+        '''
+           *Arguemnts:*
+
+           origin
+                The cartesian coordinate for the origin of the grid.
+
+           axes
+                The 3 by 3 array with the grid spacings as rows.
+
+           nrep
+                The number of grid points along each axis.
+        '''
+        self.origin = np.array(origin, float)
+        self.axes = np.array(axes, float)
+        self.shape = (int(nrep[0]), int(nrep[1]), int(nrep[2]), 3)
+        # One term per axis, broadcast to the full shape without copying.
+        self._terms = []
+        for i in range(3):
+            term_shape = [1, 1, 1, 3]
+            term_shape[i] = self.shape[i]
+            term = np.outer(np.arange(self.shape[i], dtype=float), self.axes[i])
+            self._terms.append(np.broadcast_to(term.reshape(term_shape), self.shape))
+
+    size = property(lambda self: int(np.prod(self.shape)))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, index):
+        result = np.broadcast_to(self.origin, self.shape)[index]
+        for term in self._terms:
+            result = result + term[index]
+        return result
+
+    def __array__(self, dtype=None):
+        return get_cube_points(self.origin, self.axes, self.shape[:3]).astype(dtype or float, copy=False)
+
+    def reshape(self, *shape):
+        '''Return all points as an ndarray with the given shape'''
+        return np.asarray(self).reshape(*shape)
+
+
 def read_cube_header(f):
     # skip the first two lines
     title = f.readline().strip()
     subtitle = f.readline().strip()
+    if isinstance(title, bytes):
+        title = title.decode()
+        subtitle = subtitle.decode()
 
     def read_grid_line(line):
         """Read a grid line from the cube file"""
@@ -98,6 +160,36 @@ def read_cube_header(f):
     return molecule, origin, axes, nrep, subtitle, nuclear_charges
 
 
+def read_cube_data(f, nrep):
+    '''Read the grid values that follow the header of a cube file
+
+       *Arguments:*
+
+       f
+            A file object, opened in binary mode, positioned right after the
+            header.
+
+       nrep
+            The number of grid points along each axis.
+
+       *Returns:* an array with shape (nrep[0], nrep[1], nrep[2]).
+    '''
+    from molmod.ext import parsing_numbers
+    size = int(np.prod(nrep))
+    data = f.read()
+    if len(data) > 0 and not data[-1:].isspace():
+        data += b'\n'
+    try:
+        values = parsing_numbers(data, size)[0]
+    except ValueError:
+        # Let the slow code figure out what is wrong.
+        words = data.split()
+        if len(words) < size:
+            raise FileFormatError('The cube file contains %i instead of %i grid values.' % (len(words), size))
+        values = np.array([float(word) for word in words[:size]])
+    return values.reshape(tuple(nrep))
+
+
 class CubeReader(object):
     """Iterator that reads cube files. See the cubegen manual for more
        information about cube files:
@@ -124,7 +216,11 @@ class CubeReader(object):
         self._counter1 = 0
         self._counter2 = 0
         self._done = False
-        self._values = []
+        # The values and vectors of one row along the last axis are computed
+        # at once.
+        self._words = []
+        self._row_values = None
+        self._row_vectors = None
 
     def __del__(self):
         self.f.close()
@@ -139,15 +235,12 @@ class CubeReader(object):
         """
         if self._done:
             raise StopIteration
-        if len(self._values) == 0:
-            line = self.f.readline()
-            if len(line) == 0:
-                raise StopIteration
-            self._values = [float(word) for word in line.split()]
-        value = self._values.pop(0)
-        vector = self.origin + self._counter0*self.axes[0] \
-                             + self._counter1*self.axes[1] \
-                             + self._counter2*self.axes[2]
+        if self._counter2 == 0:
+            self._read_row()
+        if self._counter2 >= len(self._row_values):
+            raise StopIteration
+        value = self._row_values[self._counter2]
+        vector = self._row_vectors[self._counter2]
         self._counter2 += 1
         if self._counter2 >= self.nrep[2]:
             self._counter2 = 0
@@ -159,12 +252,27 @@ class CubeReader(object):
                     self._done = True
         return vector, value
 
+    def _read_row(self):
+        """Read the values and compute the vectors of the next row"""
+        nrep2 = self.nrep[2]
+        words = self._words
+        while len(words) < nrep2:
+            line = self.f.readline()
+            if len(line) == 0:
+                break
+            words.extend(line.split())
+        self._row_values = np.array(words[:nrep2], float)
+        self._words = words[nrep2:]
+        row_origin = self.origin + self._counter0*self.axes[0] \
+                                 + self._counter1*self.axes[1]
+        self._row_vectors = row_origin + np.outer(np.arange(len(self._row_values)), self.axes[2])
+
 
 class Cube(object):
     '''A data structure for cube file data.
     '''
     @classmethod
-    def from_file(cls, filename):
+    def from_file(cls, filename, cache=False):
         '''Create a cube object by loading data from a file.
 
            *Arguemnts:*
@@ -172,23 +280,69 @@ class Cube(object):
            filename
                 The file to load. It must contain the header with the
                 description of the grid and the molecule.
+
+           *Optional arguments:*
+
+           cache
+                When True, the grid data are also stored in a binary sidecar
+                file, ``filename + '.npy'``. The size and the modification
+                time of the cube file are written to a second sidecar file,
+                ``filename + '.npy.source'``. When both files exist and the
+                cube file has not changed, the data are memory-mapped from
+                the ``.npy`` file instead of being parsed again. The data
+                array is then read-only.
         '''
-        with open(filename) as f:
+        fn_npy = filename + '.npy'
+        with open(filename, 'rb') as f:
             molecule, origin, axes, nrep, subtitle, nuclear_charges = \
                 read_cube_header(f)
-            data = np.zeros(tuple(nrep), float)
-            tmp = data.ravel()
-            counter = 0
-            while True:
-                line = f.readline()
-                if len(line) == 0:
-                    break
-                words = line.split()
-                for word in words:
-                    tmp[counter] = float(word)
-                    counter += 1
+            data = None
+            if cache:
+                stat = os.fstat(f.fileno())
+                source = '%i %r' % (stat.st_size, stat.st_mtime)
+                data = cls._load_cache(fn_npy, nrep, source)
+            if data is None:
+                data = read_cube_data(f, nrep)
+                if cache:
+                    cls._dump_cache(fn_npy, data, source)
         return cls(molecule, origin, axes, nrep, data, subtitle, nuclear_charges)
 
+    @staticmethod
+    def _load_cache(fn_npy, nrep, source):
+        '''Return the memory-mapped data from the sidecar file or None'''
+        try:
+            with open(fn_npy + '.source') as f:
+                if f.read().strip() != source:
+                    return None
+            data = np.load(fn_npy, mmap_mode='r')
+        except (IOError, OSError, ValueError):
+            return None
+        if data.shape != tuple(nrep) or data.dtype != float:
+            return None
+        return data
+
+    @staticmethod
+    def _dump_cache(fn_npy, data, source):
+        '''Write the data and their source to the sidecar files, ignoring failures'''
+        fn_source = fn_npy + '.source'
+        fn_tmp = fn_npy + '.tmp'
+        try:
+            # The old data are never used with the new source, not even when
+            # writing fails halfway.
+            if os.path.isfile(fn_source):
+                os.remove(fn_source)
+            with open(fn_tmp, 'wb') as f:
+                np.save(f, data)
+            os.rename(fn_tmp, fn_npy)
+            with open(fn_source, 'w') as f:
+                f.write(source + '\n')
+        except (IOError, OSError):
+            # The data can still be used, even if it can not be stored.
+            pass
+        finally:
+            if os.path.isfile(fn_tmp):
+                os.remove(fn_tmp)
+
     def __init__(self, molecule, origin, axes, nrep, data, subtitle='', nuclear_charges=None):
         '''
            *Arguments:*
@@ -271,3 +425,12 @@ class Cube(object):
            points in the cube.
         '''
         return get_cube_points(self.origin, self.axes, self.nrep)
+
+    def get_points_lazy(self):
+        '''Return a Nz*Nb*Nc*3 array-like object with all Cartesian
+           coordinates of the points in the cube.
+
+           The coordinates are only computed for the points that are selected
+           with an index. See CubePoints for more details.
+        '''
+        return CubePoints(self.origin, self.axes, self.nrep)
@@ -29,7 +29,7 @@ from builtins import range
 import numpy as np
 
 from molmod.units import picosecond, amu, angstrom, atm, deg
-from molmod.io.common import SlicedReader, FileFormatError
+from molmod.io.common import SlicedReader, FileFormatError, skip_lines
 
 
 __all__ = ["DLPolyHistoryReader", "DLPolyOutputReader"]
@@ -45,9 +45,16 @@ class DLPolyHistoryReader(SlicedReader):
          ...     print frame["cell"]
 
     """
+    _first_counter = 1 # make our counter compatible with dlpoly
+    _binary_options = ("pos_unit", "vel_unit", "frc_unit", "time_unit")
+    # Binary files can be read in blocks of several lines, see _read_lines.
+    _file_mode = "rb"
+    # The columns with the mass and the charge in the atom header lines.
+    _head_columns = np.array([2, 3])
+
     def __init__(self, f, sub=slice(None), pos_unit=angstrom,
         vel_unit=angstrom/picosecond, frc_unit=amu*angstrom/picosecond**2,
-        time_unit=picosecond, mass_unit=amu, restart=False,
+        time_unit=picosecond, mass_unit=amu, restart=False, out=None,
     ):
         """
            Arguments:
@@ -59,6 +66,12 @@ class DLPolyHistoryReader(SlicedReader):
                ``mass_unit``  --  The conversion factors for the unit conversion
                 from the units in the data file to atomic units. The defaults of
                 these optional arguments correspond to the defaults of dlpoly.
+             | ``out``  --  A dictionary with arrays that are reused for every
+                            frame, instead of allocating new arrays. It may
+                            contain the keys ``cell``, ``masses``,
+                            ``charges``, ``pos``, ``vel`` and ``frc``. All
+                            frames then refer to the same arrays, which are
+                            overwritten by the next frame.
 
            When the file starts with a line that satisfies the following
            conditions, it is assumed that this is a history restart file:
@@ -69,7 +82,6 @@ class DLPolyHistoryReader(SlicedReader):
            * the last word is a float
         """
         SlicedReader.__init__(self, f, sub)
-        self._counter = 1 # make our counter compatible with dlpoly
         self.pos_unit = pos_unit
         self.vel_unit = vel_unit
         self.frc_unit = frc_unit
@@ -78,8 +90,8 @@ class DLPolyHistoryReader(SlicedReader):
         restart = self._detect_restart()
         if restart is None:
             try:
-                self.header = next(self._f)[:-1]
-                integers = tuple(int(word) for word in next(self._f).split())
+                self.header = self._readline()[:-1]
+                integers = tuple(int(word) for word in self._readline().split())
                 if len(integers) != 3:
                     raise FileFormatError("Second line must contain three integers.")
                 self.keytrj, self.imcon, self.num_atoms = integers
@@ -90,10 +102,15 @@ class DLPolyHistoryReader(SlicedReader):
         else:
             self.header = ''
             self.num_atoms, self.keytrj, self.imcon = restart
+        self._restart = restart is not None
         self._frame_size = 4 + self.num_atoms*(self.keytrj+2)
+        self._out = {} if out is None else out
+        self._scratch = {}
+        self._symbol_chars = None
+        self._symbols = None
 
     def _detect_restart(self):
-        words = next(self._f).split()
+        words = self._readline().split()
         self._f.seek(0)
         if len(words) != 6:
             return
@@ -108,21 +125,35 @@ class DLPolyHistoryReader(SlicedReader):
             return
         return int(words[2]), int(words[3]), int(words[4])
 
+    def _get_array(self, key, shape):
+        """Return an output array, reused when it is given by the caller"""
+        result = self._out.get(key)
+        if result is None:
+            return np.zeros(shape, float)
+        if result.shape != shape:
+            raise TypeError("The array %s must have shape %s." % (key, shape))
+        return result
+
+    def _get_scratch(self, key, shape, dtype=float):
+        """Return an array for intermediate results, reused for every frame"""
+        result = self._scratch.get(key)
+        if result is None or result.shape != shape:
+            result = np.zeros(shape, dtype)
+            self._scratch[key] = result
+        return result
+
+    def _read_three(self, line, msg):
+        """Convert a line with three fixed-width floating point numbers"""
+        try:
+            return [float(line[:12]), float(line[12:24]), float(line[24:])]
+        except ValueError:
+            raise FileFormatError(msg)
 
     def _read_frame(self):
         """Read a single frame from the trajectory"""
-        # auxiliary read function
-        def read_three(msg):
-            """Read three words as floating point numbers"""
-            line = next(self._f)
-            try:
-                return [float(line[:12]), float(line[12:24]), float(line[24:])]
-            except ValueError:
-                raise FileFormatError(msg)
-
         frame = {}
         # read the frame header line
-        words = next(self._f).split()
+        words = self._readline().split()
         if len(words) != 6:
             raise FileFormatError("The first line of each time frame must contain 6 words. (%i'th frame)" % self._counter)
         if words[0] != "timestep":
@@ -141,30 +172,98 @@ class DLPolyHistoryReader(SlicedReader):
         except ValueError:
             raise FileFormatError("Could not convert all numbers on the first line of the current time frame. (%i'th frame)" % self._counter)
         # the three cell lines
-        cell = np.zeros((3, 3), float)
+        cell = self._get_array("cell", (3, 3))
         frame["cell"] = cell
         cell_msg = "The cell lines must consist of three floating point values. (%i'th frame, %i'th step)" % (self._counter, step)
         for i in range(3):
-            cell[:, i] = read_three(cell_msg)
+            cell[:, i] = self._read_three(self._readline(), cell_msg)
         cell *= self.pos_unit
         # the atoms
-        symbols = []
-        frame["symbols"] = symbols
-        masses = np.zeros(self.num_atoms, float)
-        frame["masses"] = masses
-        charges = np.zeros(self.num_atoms, float)
-        frame["charges"] = charges
-        pos = np.zeros((self.num_atoms, 3), float)
-        frame["pos"] = pos
+        frame["masses"] = self._get_array("masses", (self.num_atoms,))
+        frame["charges"] = self._get_array("charges", (self.num_atoms,))
+        frame["pos"] = self._get_array("pos", (self.num_atoms, 3))
+        if self.keytrj > 0:
+            frame["vel"] = self._get_array("vel", (self.num_atoms, 3))
+        if self.keytrj > 1:
+            frame["frc"] = self._get_array("frc", (self.num_atoms, 3))
+        if self._binary:
+            # Fast path: read a large block of bytes at once, which likely
+            # contains all atom lines, and move the file back to the end of
+            # the frame.
+            start = self._f.tell()
+            consumed = self._decode_atoms(frame, self._f.read(self._block_size))
+            if consumed is not None:
+                self._f.seek(start + consumed)
+                return frame
+            self._f.seek(start)
+        data = self._read_lines(self.num_atoms*(self.keytrj+2))
+        if self._decode_atoms(frame, data) is None:
+            # Let the slow code figure out what is wrong.
+            self._read_atoms(frame, iter(data.decode().splitlines()), step)
+        return frame
+
+    def _decode_atoms(self, frame, data):
+        """Convert the atom lines of a frame at once in compiled code
+
+           Returns the number of bytes consumed or None when the atom lines
+           can not be converted.
+        """
+        from molmod.ext import parsing_table, parsing_fixed
+        nvec = self.keytrj + 1
+        if self.num_atoms == 0:
+            frame["symbols"] = []
+            return 0
+        first_words = self._get_scratch("first_words", (self.num_atoms, 2), int)
+        try:
+            heads = parsing_table(
+                data, self.num_atoms, self._head_columns, nvec,
+                self._get_scratch("heads", (self.num_atoms, 2)), first_words)[0]
+            offset = data.index(b"\n") + 1
+            vecs, consumed = parsing_fixed(
+                memoryview(data)[offset:], self.num_atoms, nvec, 3, 12, 1,
+                self._get_scratch("vecs", (self.num_atoms*nvec, 3)))
+        except ValueError:
+            return None
+        np.multiply(heads[:, 0], self.mass_unit, out=frame["masses"])
+        frame["charges"][:] = heads[:, 1]
+        vecs = vecs.reshape(self.num_atoms, nvec, 3)
+        np.multiply(vecs[:, 0], self.pos_unit, out=frame["pos"])
         if self.keytrj > 0:
-            vel = np.zeros((self.num_atoms, 3), float)
-            frame["vel"] = vel
+            np.multiply(vecs[:, 1], self.vel_unit, out=frame["vel"])
         if self.keytrj > 1:
-            frc = np.zeros((self.num_atoms, 3), float)
-            frame["frc"] = frc
+            np.multiply(vecs[:, 2], self.frc_unit, out=frame["frc"])
+        frame["symbols"] = self._decode_symbols(data, first_words)
+        return offset + consumed
+
+    def _decode_symbols(self, data, first_words):
+        """Return the list of symbols, given the offsets of the symbols in data
+
+           The symbols are only converted to strings when they differ from
+           those in the previous frame.
+        """
+        lengths = first_words[:, 1] - first_words[:, 0]
+        width = np.arange(lengths.max())
+        chars = np.frombuffer(data, np.uint8)[first_words[:, :1] + np.minimum(width, lengths[:, None] - 1)]
+        chars[width >= lengths[:, None]] = 0
+        if self._symbol_chars is None or not np.array_equal(chars, self._symbol_chars):
+            unique, inverse = np.unique(chars.view("S%i" % len(width)).ravel(), return_inverse=True)
+            unique = [symbol.decode() for symbol in unique]
+            self._symbols = [unique[index] for index in inverse]
+            self._symbol_chars = chars
+        return list(self._symbols)
+
+    def _read_atoms(self, frame, lines, step):
+        """Convert the atom lines of a frame line by line"""
+        symbols = []
+        frame["symbols"] = symbols
+        masses = frame["masses"]
+        charges = frame["charges"]
+        pos = frame["pos"]
+        vel = frame.get("vel")
+        frc = frame.get("frc")
         for i in range(self.num_atoms):
             # the atom header line
-            words = next(self._f).split()
+            words = next(lines).split()
             if len(words) != 4:
                 raise FileFormatError("The atom header line must contain 4 words. (%i'th frame, %i'th step, %i'th atom)" % (self._counter, step, i+1))
             symbols.append(words[0])
@@ -175,24 +274,39 @@ class DLPolyHistoryReader(SlicedReader):
                 raise FileFormatError("The numbers in the atom header line could not be interpreted.")
             # the pos line
             pos_msg = "The position lines must consist of three floating point values. (%i'th frame, %i'th step, %i'th atom)" % (self._counter, step, i+1)
-            pos[i] = read_three(pos_msg)
+            pos[i] = self._read_three(next(lines), pos_msg)
             if self.keytrj > 0:
                 vel_msg = "The velocity lines must consist of three floating point values. (%i'th frame, %i'th step, %i'th atom)" % (self._counter, step, i+1)
-                vel[i] = read_three(vel_msg)
+                vel[i] = self._read_three(next(lines), vel_msg)
             if self.keytrj > 1:
                 frc_msg = "The force lines must consist of three floating point values. (%i'th frame, %i'th step, %i'th atom)" % (self._counter, step, i+1)
-                frc[i] = read_three(frc_msg)
+                frc[i] = self._read_three(next(lines), frc_msg)
         pos *= self.pos_unit # convert to au
         if self.keytrj > 0:
             vel *= self.vel_unit # convert to au
         if self.keytrj > 1:
             frc *= self.frc_unit # convert to au
-        return frame
+
+    def _get_frame_arrays(self, frame):
+        """Return a dictionary with the arrays of a frame, see SlicedReader"""
+        return dict((key, frame[key]) for key in ("time", "cell", "pos", "vel", "frc") if key in frame)
 
     def _skip_frame(self):
         """Skip a single frame from the trajectory"""
         for i in range(self._frame_size):
-            next(self._f)
+            self._readline()
+
+    def _scan_frame_offsets(self, f):
+        """Iterate over the byte offsets of all frames, see SlicedReader"""
+        if not self._restart:
+            skip_lines(f, 2)
+        while True:
+            offset = f.tell()
+            if not f.readline().startswith(b"timestep"):
+                return
+            if skip_lines(f, self._frame_size-1) < self._frame_size-1:
+                return
+            yield offset
 
 
 class DLPolyOutputReader(SlicedReader):
@@ -206,8 +320,13 @@ class DLPolyOutputReader(SlicedReader):
 
        The variable row in the example above is a concatenation of all the
        values that belong to one time frame. (line after line)
+
+       The frame index for random access contains all frames, also those of
+       the equilibration period. When ``skip_equi_period`` is set, reading a
+       frame of the equilibration period returns the first frame after it.
     """
 
+    _first_counter = 1 # make our counter compatible with dlpoly
     _marker = " " + "-"*130
 
     def __init__(self, f, sub=slice(None), skip_equi_period=True,
@@ -229,7 +348,6 @@ class DLPolyOutputReader(SlicedReader):
 
         """
         SlicedReader.__init__(self, f, sub)
-        self._counter = 1 # make our counter compatible with dlpoly
         self.skip_equi_period = skip_equi_period
 
         self._conv = [
@@ -302,3 +420,29 @@ class DLPolyOutputReader(SlicedReader):
     def _skip_frame(self):
         """Skip a single frame from the trajectory"""
         self.goto_next_frame()
+
+    def _scan_frame_offsets(self, f):
+        """Iterate over the byte offsets of all frames, see SlicedReader
+
+           The offset of a frame is that of the marker line before it, which
+           is where goto_next_frame starts.
+        """
+        marker = self._marker.encode()
+        marker_offset = None
+        while True:
+            offset = f.tell()
+            line = f.readline()
+            if len(line) == 0:
+                return
+            line = line.rstrip(b"\r\n")
+            if marker_offset is not None and len(line) > 0 and not line.startswith(b" --------"):
+                try:
+                    int(line[:10])
+                except ValueError:
+                    pass
+                else:
+                    # Only complete frames are included.
+                    if skip_lines(f, 2) < 2:
+                        return
+                    yield marker_offset
+            marker_offset = offset if line == marker else None
@@ -26,21 +26,134 @@
 from __future__ import print_function
 
 from builtins import range
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
 import numpy as np
 
 from molmod.molecules import Molecule
-from molmod.io.common import FileFormatError
+from molmod.io.common import FileFormatError, skip_lines
 
 
 __all__ = ["FCHKFile"]
 
 
+# The number of values per line for each type of array in an FCHK file.
+values_per_line = {b"I": 6, b"R": 5, b"C": 5, b"L": 72}
+
+
+class FCHKFields(MutableMapping):
+    """Dictionary with the fields of a formatted checkpoint file
+
+       This is an internal class and should not be used directly.
+
+       Scalar fields are read immediately. For array fields, only the
+       location in the file is stored. They are read from the file when they
+       are accessed for the first time.
+
+       An array field that can not be read (and ignore_errors is False) is
+       reported in the same way as a missing field: a warning is printed and
+       a KeyError is raised when it is accessed for the first time. It is then
+       removed from the dictionary. Membership tests only look at the index,
+       so such a field is ``in`` the dictionary until it is accessed.
+    """
+
+    def __init__(self, filename, ignore_errors=False):
+        """
+           Arguments:
+            | ``filename``  --  The formatted checkpoint file
+
+           Optional argument:
+            | ``ignore_errors``  --  Replace numbers that can not be read by
+                                     NaN (or 0 for integers) instead of
+                                     leaving out the field.
+        """
+        self.filename = filename
+        self.ignore_errors = ignore_errors
+        # label -> None (for values in _values) or (datatype, length, begin, end)
+        self._index = {}
+        self._values = {}
+
+    def add_array(self, label, datatype, length, begin, end):
+        """Register an array field that is stored in the given byte range"""
+        self._index[label] = (datatype, length, begin, end)
+        self._values.pop(label, None)
+
+    def __getitem__(self, label):
+        if label in self._values:
+            return self._values[label]
+        location = self._index[label]
+        value = self._load(*location)
+        if value is None:
+            # The field can not be read. Act as if it is not present.
+            del self._index[label]
+            raise KeyError(label)
+        self._values[label] = value
+        return value
+
+    def __setitem__(self, label, value):
+        self._index[label] = None
+        self._values[label] = value
+
+    def __contains__(self, label):
+        # Avoid the default implementation, which reads the array.
+        return label in self._index
+
+    def __delitem__(self, label):
+        del self._index[label]
+        self._values.pop(label, None)
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def _load(self, datatype, length, begin, end):
+        """Read an array field from the file, returns None if it fails"""
+        from molmod.ext import parsing_numbers
+        with open(self.filename, "rb") as f:
+            f.seek(begin)
+            data = f.read(end - begin)
+        try:
+            value = parsing_numbers(data, length)[0]
+            if datatype is int:
+                int_value = value.astype(int)
+                if (int_value != value).any():
+                    raise ValueError("Not all numbers are integers.")
+                value = int_value
+            return value
+        except ValueError:
+            pass
+        # Let the slow code figure out what is wrong.
+        unreadable = 0 if datatype is int else np.nan
+        value = np.zeros(length, datatype)
+        for counter, word in enumerate(data.split()[:length]):
+            try:
+                value[counter] = datatype(word)
+            except (ValueError, OverflowError) as e:
+                print('WARNING: could not interpret word while reading %s: %s' % (word.decode(), self.filename))
+                if self.ignore_errors:
+                    value[counter] = unreadable
+                else:
+                    return None
+        return value
+
+
 class FCHKFile(object):
     """Reader for Formatted checkpoint files
 
        After initialization, the data from the file is available in the fields
        dictionary. Also the following attributes are read from the file: title,
        command, lot (level of theory) and basis.
+
+       The file is indexed in a single pass, without interpreting the numbers
+       in the array fields. An array is only read from the file when it is
+       accessed through the fields dictionary for the first time. If that
+       fails, the field is treated as missing, i.e. a KeyError is raised and
+       ``fields.get`` returns None. See FCHKFields for details.
     """
 
     def __init__(self, filename, ignore_errors=False, field_labels=None):
@@ -71,80 +184,16 @@ class FCHKFile(object):
         self._analyze()
 
     def _read(self, filename, field_labels=None):
-        """Read all the requested fields
+        """Index all the requested fields
 
            Arguments:
             | ``filename``  --  the filename of the FCHK file
             | ``field_labels``  --  when given, only these fields are read
         """
-        # if fields is None, all fields are read
-        def read_field(f):
-            """Read a single field"""
-            datatype = None
-            while datatype is None:
-                # find a sane header line
-                line = f.readline()
-                if line == "":
-                    return False
-
-                label = line[:43].strip()
-                if field_labels is not None:
-                    if len(field_labels) == 0:
-                        return False
-                    elif label not in field_labels:
-                        return True
-                    else:
-                        field_labels.discard(label)
-                line = line[43:]
-                words = line.split()
-                if len(words) == 0:
-                    return True
-
-                if words[0] == 'I':
-                    datatype = int
-                    unreadable = 0
-                elif words[0] == 'R':
-                    datatype = float
-                    unreadable = np.nan
-
-            if len(words) == 2:
-                try:
-                    value = datatype(words[1])
-                except ValueError:
-                    return True
-            elif len(words) == 3:
-                if words[1] != "N=":
-                    raise FileFormatError("Unexpected line in formatted checkpoint file %s\n%s" % (filename, line[:-1]))
-                length = int(words[2])
-                value = np.zeros(length, datatype)
-                counter = 0
-                try:
-                    while counter < length:
-                        line = f.readline()
-                        if line == "":
-                            raise FileFormatError("Unexpected end of formatted checkpoint file %s" % filename)
-                        for word in line.split():
-                            try:
-                                value[counter] = datatype(word)
-                            except (ValueError, OverflowError) as e:
-                                print('WARNING: could not interpret word while reading %s: %s' % (word, self.filename))
-                                if self.ignore_errors:
-                                    value[counter] = unreadable
-                                else:
-                                    raise
-                            counter += 1
-                except ValueError:
-                    return True
-            else:
-                raise FileFormatError("Unexpected line in formatted checkpoint file %s\n%s" % (filename, line[:-1]))
-
-            self.fields[label] = value
-            return True
-
-        self.fields = {}
-        with open(filename, 'r') as f:
-            self.title = f.readline()[:-1].strip()
-            words = f.readline().split()
+        self.fields = FCHKFields(filename, self.ignore_errors)
+        with open(filename, 'rb') as f:
+            self.title = f.readline().decode().strip()
+            words = f.readline().decode().split()
             if len(words) == 3:
                 self.command, self.lot, self.basis = words
             elif len(words) == 2:
@@ -152,8 +201,45 @@ class FCHKFile(object):
             else:
                 raise FileFormatError('The second line of the FCHK file should contain two or three words.')
 
-            while read_field(f):
-                pass
+            while field_labels is None or len(field_labels) > 0:
+                # find a sane header line
+                line = f.readline()
+                if len(line) == 0:
+                    break
+                label = line[:43].strip().decode()
+                words = line[43:].split()
+                if len(words) == 0:
+                    continue
+                if len(words) == 3 and words[1] == b"N=" and words[0] in values_per_line:
+                    # skip the lines of an array
+                    length = int(words[2])
+                    begin = f.tell()
+                    num_lines = (length + values_per_line[words[0]] - 1)//values_per_line[words[0]]
+                    if skip_lines(f, num_lines) < num_lines:
+                        raise FileFormatError("Unexpected end of formatted checkpoint file %s" % filename)
+                    end = f.tell()
+                if words[0] == b'I':
+                    datatype = int
+                elif words[0] == b'R':
+                    datatype = float
+                else:
+                    continue
+                if field_labels is not None:
+                    if label not in field_labels:
+                        continue
+                    field_labels.discard(label)
+
+                if len(words) == 2:
+                    try:
+                        self.fields[label] = datatype(words[1])
+                    except ValueError:
+                        pass
+                elif len(words) == 3:
+                    if words[1] != b"N=":
+                        raise FileFormatError("Unexpected line in formatted checkpoint file %s\n%s" % (filename, line[:-1].decode()))
+                    self.fields.add_array(label, datatype, length, begin, end)
+                else:
+                    raise FileFormatError("Unexpected line in formatted checkpoint file %s\n%s" % (filename, line[:-1].decode()))
 
     def _analyze(self):
         """Convert a few elementary fields into a molecule object"""
@@ -218,9 +304,7 @@ class FCHKFile(object):
             return None
         N = len(self.molecule.numbers)
         result = np.zeros((3*N, 3*N), float)
-        counter = 0
-        for row in range(3*N):
-            result[row, :row+1] = force_const[counter:counter+row+1]
-            result[:row+1, row] = force_const[counter:counter+row+1]
-            counter += row + 1
+        rows, cols = np.tril_indices(3*N)
+        result[rows, cols] = force_const
+        result[cols, rows] = force_const
         return result
@@ -29,7 +29,7 @@ from builtins import range
 import numpy as np
 
 from molmod.units import picosecond, nanometer
-from molmod.io.common import SlicedReader
+from molmod.io.common import SlicedReader, skip_lines
 
 
 __all__ = ["GroReader"]
@@ -110,6 +110,10 @@ class GroReader(SlicedReader):
         cell *= nanometer
         return time, pos, vel, cell
 
+    def _get_frame_arrays(self, frame):
+        """Return a dictionary with the arrays of a frame, see SlicedReader"""
+        return dict(zip(["time", "pos", "vel", "cell"], frame))
+
     def _skip_frame(self):
         """Skip one frame"""
         self._get_line()
@@ -118,3 +122,16 @@ class GroReader(SlicedReader):
             raise ValueError("The number of atoms must be the same over the entire file.")
         for i in range(num_atoms+1):
             self._get_line()
+
+    def _scan_frame_offsets(self, f):
+        """Iterate over the byte offsets of all frames, see SlicedReader"""
+        while True:
+            offset = f.tell()
+            f.readline()
+            try:
+                num_atoms = int(f.readline())
+            except ValueError:
+                return
+            if skip_lines(f, num_atoms+1) < num_atoms+1:
+                return
+            yield offset
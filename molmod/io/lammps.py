@@ -26,7 +26,9 @@
 from builtins import range
 import numpy as np
 
-from molmod.io.common import SlicedReader, FileFormatError
+from molmod.io.common import SlicedReader, FileFormatError, skip_lines
+from molmod.unit_cells import UnitCell
+from molmod.units import angstrom
 
 
 __all__ = ["LAMMPSDumpReader"]
@@ -40,8 +42,31 @@ class LAMMPSDumpReader(SlicedReader):
          >>> ldr = LAMMPSDumpReader("some_file.dump", [some, units])
          >>> for fields in ldr:
          ...     print fields[0]
+
+       Columns can also be selected by their name in the ``ITEM: ATOMS``
+       header line, e.g. to get the box and the positions ordered by atom id::
+
+         >>> ldr = LAMMPSDumpReader("some_file.dump", [angstrom]*3,
+         ...                        columns=["x", "y", "z"], sort=True, box=True)
+         >>> for step, unit_cell, x, y, z in ldr:
+         ...     print unit_cell.matrix
+
+       When the columns are given by name, the frames can also be stored in a
+       binary trajectory file, see _get_frame_arrays.
     """
-    def __init__(self, f, units, sub=slice(None)):
+    # Binary files can be read in blocks of several lines, see _read_table.
+    _file_mode = "rb"
+    _binary_options = ("units", "columns", "sort", "box", "box_unit")
+    # The columns with the Cartesian components of the arrays in a binary
+    # trajectory. The first alternative that is present is used.
+    _array_columns = [
+        ("pos", [("x", "y", "z"), ("xu", "yu", "zu")]),
+        ("vel", [("vx", "vy", "vz")]),
+        ("frc", [("fx", "fy", "fz")]),
+    ]
+
+    def __init__(self, f, units, sub=slice(None), columns=None, sort=False, box=False,
+                 box_unit=angstrom):
         """
            Arguments:
             | ``f``  --  a filename or a file-like object
@@ -51,16 +76,31 @@ class LAMMPSDumpReader(SlicedReader):
 
            Optional argumtent:
             | ``sub``  --  a slice object indicating which time frames to skip/read
+            | ``columns``  --  The names of the atom fields in the ``ITEM:
+                               ATOMS`` header line, one for each unit. When
+                               not given, the fields are the columns after
+                               the first one (the atom id).
+            | ``sort``  --  When True, the atoms are sorted by their id. This
+                            is the column ``id``, or the first column when
+                            the header line does not contain names.
+            | ``box``  --  When True, the box of each frame is returned as a
+                           UnitCell object, after the step.
+            | ``box_unit``  --  The unit of the box bounds [default=angstrom].
+
+           The number of atoms may change from frame to frame. The attribute
+           ``num_atoms`` is the number of atoms in the first frame.
         """
         SlicedReader.__init__(self, f, sub)
+        if columns is not None and len(columns) != len(units):
+            raise TypeError("The number of columns and units must be the same.")
         # first read the number of atoms
         try:
             while True:
-                line = next(self._f)
+                line = self._readline()
                 if line == "ITEM: NUMBER OF ATOMS\n":
                     break
             try:
-                line = next(self._f)
+                line = self._readline()
                 self.num_atoms = int(line)
             except ValueError:
                 raise FileFormatError("Could not read the number of atoms. Expected an integer. Got '%s'" % line)
@@ -68,56 +108,163 @@ class LAMMPSDumpReader(SlicedReader):
             raise FileFormatError("Could not find line 'ITEM: NUMBER OF ATOMS'.")
         self._f.seek(0) # go back to the beginning of the file
         self.units = units
+        self.columns = columns
+        self.sort = sort
+        self.box = box
+        self.box_unit = box_unit
+
+    def _read_box(self):
+        """Read the box section and return it as a UnitCell object"""
+        words = self._readline().split()
+        if words[:3] != ["ITEM:", "BOX", "BOUNDS"]:
+            raise FileFormatError("Expecting line 'ITEM: BOX BOUNDS'.")
+        flags = [word for word in words[3:] if word not in ("xy", "xz", "yz")]
+        try:
+            bounds = np.array([
+                [float(word) for word in self._readline().split()]
+                for i in range(3)
+            ])
+        except ValueError:
+            raise FileFormatError("Could not read the box bounds.")
+        if bounds.shape == (3, 2):
+            lo, hi = bounds.T
+            xy, xz, yz = 0.0, 0.0, 0.0
+        elif bounds.shape == (3, 3):
+            # Triclinic box. The bounds include the tilt, see the
+            # documentation of the dump command in LAMMPS.
+            lo, hi = bounds[:, 0].copy(), bounds[:, 1].copy()
+            xy, xz, yz = bounds[:, 2]
+            lo[0] -= min(0.0, xy, xz, xy + xz)
+            hi[0] -= max(0.0, xy, xz, xy + xz)
+            lo[1] -= min(0.0, yz)
+            hi[1] -= max(0.0, yz)
+        else:
+            raise FileFormatError("The box bounds must consist of two or three floating point values.")
+        matrix = np.array([
+            [hi[0] - lo[0], xy, xz],
+            [0.0, hi[1] - lo[1], yz],
+            [0.0, 0.0, hi[2] - lo[2]],
+        ])*self.box_unit
+        if len(flags) == 3:
+            active = np.array([flag == "pp" for flag in flags])
+        else:
+            active = np.ones(3, bool)
+        return UnitCell(matrix, active)
+
+    def _get_atom_columns(self, names):
+        """Return the indexes of the words to convert and of the id
+
+           Argument:
+            | ``names``  --  The column names in the ``ITEM: ATOMS`` line, or an
+                             empty list.
+
+           Returns an array with the indexes of the words to convert and the
+           indexes of the fields and the id in that array.
+        """
+        if self.columns is None:
+            selected = list(range(1, len(self.units) + 1))
+        else:
+            try:
+                selected = [names.index(name) for name in self.columns]
+            except ValueError:
+                raise FileFormatError("Not all columns %s are present in the line 'ITEM: ATOMS %s'." % (self.columns, " ".join(names)))
+        id_column = names.index("id") if "id" in names else 0
+        columns = np.unique(selected + [id_column])
+        return columns, columns.searchsorted(selected), columns.searchsorted(id_column)
 
     def _read_frame(self):
         """Read and return the next time frame"""
         # Read one frame, we assume that the current file position is at the
         # line 'ITEM: TIMESTEP' and that this line marks the beginning of a
         # time frame.
-        line = next(self._f)
+        line = self._readline()
         if line != 'ITEM: TIMESTEP\n':
             raise FileFormatError("Expecting line 'ITEM: TIMESTEP' at the beginning of a time frame.")
         try:
-            line = next(self._f)
+            line = self._readline()
             step = int(line)
         except ValueError:
             raise FileFormatError("Could not read the step number. Expected an integer. Got '%s'" % line[:-1])
 
         # Now we assume that the next section contains (again) the number of
         # atoms.
-        line = next(self._f)
+        line = self._readline()
         if line != 'ITEM: NUMBER OF ATOMS\n':
             raise FileFormatError("Expecting line 'ITEM: NUMBER OF ATOMS'.")
         try:
-            line = next(self._f)
+            line = self._readline()
             num_atoms = int(line)
         except ValueError:
             raise FileFormatError("Could not read the number of atoms. Expected an integer. Got '%s'" % line[:-1])
-        if num_atoms != self.num_atoms:
-            raise FileFormatError("A variable number of atoms is not supported.")
 
-        # The next section contains the box boundaries. We will skip it
-        for i in range(4):
-            next(self._f)
+        # The next section contains the box boundaries.
+        unit_cell = self._read_box()
 
         # The next and last section contains the atom related properties
-        line = next(self._f)
-        if line != 'ITEM: ATOMS\n':
+        words = self._readline().split()
+        if words[:2] != ["ITEM:", "ATOMS"]:
             raise FileFormatError("Expecting line 'ITEM: ATOMS'.")
-        fields = [list() for i in range(len(self.units))]
-        for i in range(self.num_atoms):
-            line = next(self._f)
-            words = line.split()[1:]
-            for j in range(len(fields)):
-                fields[j].append(float(words[j]))
-        fields = [step] + [np.array(field)*unit for field, unit in zip(fields, self.units)]
+        columns, fields, id_field = self._get_atom_columns(words[2:])
+        table = self._read_table(num_atoms, columns)
+        if isinstance(table, list):
+            if any(len(line) == 0 for line in table):
+                raise StopIteration
+            raise FileFormatError("Could not read the atom fields. (step %i)" % step)
+        if self.sort:
+            table = table[table[:, id_field].argsort(kind="mergesort")]
+        fields = [table[:, field]*unit for field, unit in zip(fields, self.units)]
+        if self.box:
+            return [step, unit_cell] + fields
+        return [step] + fields
+
+    def _get_frame_arrays(self, frame):
+        """Return a dictionary with the arrays of a frame, see SlicedReader
 
-        return fields
+           This requires the argument ``columns``. The positions are taken from
+           the columns x, y, z (or xu, yu, zu), the velocities from vx, vy, vz
+           and the forces from fx, fy, fz. The cell is only included when
+           ``box`` is True. A dump file contains no time, only the step, so
+           the time is not included. When the atoms are not dumped in the
+           same order in each frame, also use ``sort=True``.
+        """
+        if self.columns is None:
+            raise TypeError("The arrays of a LAMMPS dump file can only be found when the columns are given by name.")
+        if self.box:
+            result = {"cell": frame[1].matrix}
+            fields = frame[2:]
+        else:
+            result = {}
+            fields = frame[1:]
+        for key, alternatives in self._array_columns:
+            for names in alternatives:
+                if all(name in self.columns for name in names):
+                    result[key] = np.array([fields[self.columns.index(name)] for name in names]).T
+                    break
+        if "pos" not in result:
+            raise TypeError("The columns must include x, y and z, or xu, yu and zu.")
+        return result
 
     def _skip_frame(self):
         """Skip the next time frame"""
-        for line in self._f:
-            if line == 'ITEM: ATOMS\n':
-                break
-        for i in range(self.num_atoms):
-            next(self._f)
+        for i in range(3):
+            self._readline()
+        num_atoms = int(self._readline())
+        for i in range(5 + num_atoms):
+            self._readline()
+
+    def _scan_frame_offsets(self, f):
+        """Iterate over the byte offsets of all frames, see SlicedReader"""
+        while True:
+            offset = f.tell()
+            if f.readline() != b"ITEM: TIMESTEP\n":
+                return
+            f.readline()
+            if f.readline() != b"ITEM: NUMBER OF ATOMS\n":
+                return
+            try:
+                num_atoms = int(f.readline())
+            except ValueError:
+                return
+            if skip_lines(f, 5 + num_atoms) < 5 + num_atoms:
+                return
+            yield offset
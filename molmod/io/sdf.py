@@ -29,6 +29,9 @@
 
 from builtins import range
 from builtins import object
+from collections import deque
+import multiprocessing
+
 import numpy as np
 
 from molmod.units import angstrom
@@ -38,7 +41,254 @@ from molmod.molecular_graphs import MolecularGraph
 from molmod.io.common import FileFormatError
 
 
-__all__ = ["SDFReader"]
+__all__ = ["SDFReader", "SDFBatch"]
+
+
+class SDFBatch(object):
+    """A batch of molecules from an SDF file, stored in flat arrays
+
+       The atoms of all molecules are concatenated. Molecule ``i`` consists of
+       the atoms ``atom_offsets[i]:atom_offsets[i+1]`` and the bonds
+       ``bond_offsets[i]:bond_offsets[i+1]``.
+
+       Attributes:
+        | ``titles``  --  a list with the titles of the molecules
+        | ``numbers``  --  the atom numbers, shape (natom,)
+        | ``coordinates``  --  the Cartesian coordinates in atomic units,
+                               shape (natom, 3)
+        | ``formal_charges``  --  the formal charges, shape (natom,)
+        | ``atom_offsets``  --  shape (nmolecule+1,)
+        | ``bonds``  --  the pairs of bonded atoms, as indexes in the
+                         concatenated atom arrays, shape (nbond, 2)
+        | ``bond_orders``  --  shape (nbond,)
+        | ``bond_offsets``  --  shape (nmolecule+1,)
+    """
+    def __init__(self, titles, numbers, coordinates, formal_charges, atom_offsets,
+                 bonds, bond_orders, bond_offsets):
+        self.titles = titles
+        self.numbers = numbers
+        self.coordinates = coordinates
+        self.formal_charges = formal_charges
+        self.atom_offsets = atom_offsets
+        self.bonds = bonds
+        self.bond_orders = bond_orders
+        self.bond_offsets = bond_offsets
+
+    def __len__(self):
+        """The number of molecules in the batch"""
+        return len(self.titles)
+
+    def get_molecule(self, index):
+        """Return a Molecule object for one molecule in the batch"""
+        atom_begin, atom_end = self.atom_offsets[index:index+2]
+        bond_begin, bond_end = self.bond_offsets[index:index+2]
+        numbers = self.numbers[atom_begin:atom_end]
+        molecule = Molecule(numbers, self.coordinates[atom_begin:atom_end], self.titles[index])
+        molecule.formal_charges = self.formal_charges[atom_begin:atom_end].copy()
+        molecule.formal_charges.setflags(write=False)
+        edges = [tuple(bond) for bond in (self.bonds[bond_begin:bond_end] - atom_begin).tolist()]
+        molecule.graph = MolecularGraph(edges, numbers, self.bond_orders[bond_begin:bond_end])
+        return molecule
+
+    def get_tail(self, begin):
+        """Return a new SDFBatch with the molecules from begin onwards"""
+        atom_begin = self.atom_offsets[begin]
+        bond_begin = self.bond_offsets[begin]
+        return SDFBatch(
+            self.titles[begin:], self.numbers[atom_begin:],
+            self.coordinates[atom_begin:], self.formal_charges[atom_begin:],
+            self.atom_offsets[begin:] - atom_begin, self.bonds[bond_begin:] - atom_begin,
+            self.bond_orders[bond_begin:], self.bond_offsets[begin:] - bond_begin)
+
+
+def _get_symbol_numbers(symbols):
+    """Return a dictionary with the atom number for each symbol"""
+    result = {}
+    for symbol in symbols:
+        atom = periodic[symbol]
+        if atom is None:
+            raise FileFormatError("Unrecognized atom symbol: %s" % symbol)
+        result[symbol] = atom.number
+    return result
+
+
+def _get_fixed_numbers(data):
+    """Return the atom numbers of atom lines in the fixed V2000 layout
+
+       Argument:
+        | ``data``  --  the atom lines as bytes, each ending with a newline
+
+       The symbol is taken from the columns 31 to 33. None is returned when a
+       line does not have the fourth word, i.e. the symbol, at that position.
+    """
+    buf = np.frombuffer(data, np.uint8)
+    ends = np.flatnonzero(buf == ord("\n"))
+    begins = np.zeros(len(ends), int)
+    begins[1:] = ends[:-1] + 1
+    if (ends - begins < 34).any():
+        return None
+    # Columns 0 to 34 of all lines. (Column 34 can be the newline.)
+    columns = buf[begins[:, None] + np.arange(35)]
+    space = np.in1d(columns, np.frombuffer(b" \t\r\n", np.uint8)).reshape(columns.shape)
+    # Exactly three words must start before column 31 and the symbol must
+    # be the only word in the columns 31 to 33.
+    word_begins = ~space[:, :31] & np.c_[np.ones(len(space), bool), space[:, :30]]
+    if (word_begins.sum(axis=1) != 3).any() or space[:, 31].any() or not space[:, 34].all() or \
+       (space[:, 32] & ~space[:, 33]).any():
+        return None
+    raw_symbols = np.ascontiguousarray(columns[:, 31:34]).view("S3").ravel()
+    unique, inverse = np.unique(raw_symbols, return_inverse=True)
+    unique = [symbol.decode().strip() for symbol in unique]
+    symbol_numbers = _get_symbol_numbers(unique)
+    return np.array([symbol_numbers[symbol] for symbol in unique], int)[inverse]
+
+
+def _parse_atom_lines(lines):
+    """Convert atom lines into atom numbers and coordinates in angstrom"""
+    from molmod.ext import parsing_table
+    if len(lines) == 0:
+        return np.zeros(0, int), np.zeros((0, 3), float)
+    data = ('\n'.join(lines) + '\n').encode()
+    try:
+        coordinates = parsing_table(data, len(lines), np.array([0, 1, 2]))[0]
+    except ValueError:
+        pass
+    else:
+        numbers = _get_fixed_numbers(data)
+        if numbers is not None:
+            return numbers, coordinates
+    # Let the slow code handle other layouts and figure out what is wrong.
+    symbols = []
+    coordinates = np.zeros((len(lines), 3), float)
+    for i, line in enumerate(lines):
+        words = line.split()
+        if len(words) < 4:
+            raise FileFormatError("Expecting at least four words on an atom line.")
+        try:
+            coordinates[i, 0] = float(words[0])
+            coordinates[i, 1] = float(words[1])
+            coordinates[i, 2] = float(words[2])
+        except ValueError:
+            raise FileFormatError("Coordinates must be floating point numbers.")
+        symbols.append(words[3])
+    symbol_numbers = _get_symbol_numbers(set(symbols))
+    numbers = np.array([symbol_numbers[symbol] for symbol in symbols], int)
+    return numbers, coordinates
+
+
+def _parse_bond_lines(lines):
+    """Convert bond lines into an array with two atom indexes and the order"""
+    from molmod.ext import parsing_table
+    try:
+        data = ('\n'.join(lines) + '\n').encode()
+        table = parsing_table(data, len(lines), np.array([0, 1, 2]))[0]
+        result = table.astype(int)
+        if (result == table).all():
+            return result.reshape(-1, 3)
+    except ValueError:
+        pass
+    result = np.zeros((len(lines), 3), int)
+    for i, line in enumerate(lines):
+        words = line.split()
+        if len(words) < 3:
+            raise FileFormatError("Expecting at least three numbers on a bond line.")
+        try:
+            result[i] = [int(words[0]), int(words[1]), int(words[2])]
+        except ValueError:
+            raise FileFormatError("Expecting at least three numbers on a bond line.")
+    return result
+
+
+def _parse_sdf_batch(text):
+    """Parse a number of consecutive records from an SDF file
+
+       Argument:
+        | ``text``  --  a string with the lines of the records
+
+       Returns an SDFBatch object. The header lines of each record are
+       interpreted one by one, but all atom and bond lines of the batch are
+       converted at once.
+    """
+    records = text.split("\n$$$$\n")
+    titles = []
+    atom_counts = []
+    bond_counts = []
+    atom_lines = []
+    bond_lines = []
+    charges = []
+    natom_total = 0
+    for irecord, record in enumerate(records):
+        if len(record) == 0:
+            continue
+        parts = record.split("\n", 4)
+        try:
+            if len(parts) < 5:
+                raise IndexError
+            words = parts[3].split()
+            if len(words) < 2:
+                raise FileFormatError("Expecting at least two numbers at fourth line.")
+            try:
+                num_atoms = int(words[0])
+                num_bonds = int(words[1])
+            except ValueError:
+                raise FileFormatError("Expecting at least two numbers at fourth line.")
+            body = parts[4].split("\n", num_atoms + num_bonds)
+            if len(body) <= num_atoms + num_bonds:
+                raise IndexError
+            # Only the properties before the M  END line are relevant.
+            tail = body[-1] + "\n"
+            if tail.startswith("M  END\n"):
+                end = 0
+            else:
+                end = tail.find("\nM  END\n")
+                if end < 0:
+                    raise IndexError
+        except IndexError:
+            if irecord == len(records) - 1:
+                # An incomplete record at the end is ignored, as in the
+                # iterator protocol.
+                break
+            raise FileFormatError("Incomplete record in the SDF file.")
+        for line in tail[:end].split("\n"):
+            if line.startswith("M  CHG"):
+                words = line[6:].split()[1:] # drop the first number which is the number of charges
+                i = 0
+                while i < len(words)-1:
+                    try:
+                        index = int(words[i])
+                        charges.append((natom_total + index - 1, int(words[i+1])))
+                    except ValueError:
+                        raise FileFormatError("Expecting only integer formal charges.")
+                    if index < 1 or index > num_atoms:
+                        raise FileFormatError("Atom index %i of a formal charge is out of range in record with %i atoms." % (index, num_atoms))
+                    i += 2
+        titles.append(parts[0].strip())
+        atom_counts.append(num_atoms)
+        bond_counts.append(num_bonds)
+        atom_lines.extend(body[:num_atoms])
+        bond_lines.extend(body[num_atoms:num_atoms+num_bonds])
+        natom_total += num_atoms
+
+    numbers, coordinates = _parse_atom_lines(atom_lines)
+    coordinates *= angstrom
+    atom_offsets = np.zeros(len(titles) + 1, int)
+    np.cumsum(atom_counts, out=atom_offsets[1:])
+    bond_offsets = np.zeros(len(titles) + 1, int)
+    np.cumsum(bond_counts, out=bond_offsets[1:])
+    table = _parse_bond_lines(bond_lines)
+    # Bonds may only refer to atoms of their own record.
+    bond_atom_counts = np.repeat(atom_counts, bond_counts).astype(int)
+    out_of_range = (table[:, :2] < 1) | (table[:, :2] > bond_atom_counts[:, None])
+    if out_of_range.any():
+        ibond = out_of_range.any(axis=1).nonzero()[0][0]
+        raise FileFormatError("Atom index out of range in bond line '%s' of record with %i atoms." % (bond_lines[ibond].strip(), bond_atom_counts[ibond]))
+    # Convert the one-based atom indexes to indexes in the concatenated arrays.
+    bonds = table[:, :2] - 1 + np.repeat(atom_offsets[:-1], bond_counts)[:, None]
+    formal_charges = np.zeros(natom_total, int)
+    for index, charge in charges:
+        formal_charges[index] = charge
+    return SDFBatch(titles, numbers, coordinates, formal_charges, atom_offsets,
+                    bonds, table[:, 2].copy(), bond_offsets)
 
 
 class SDFReader(object):
@@ -49,12 +299,29 @@ class SDFReader(object):
          >>> sr = SDFReader("somefile.sdf")
          >>> for mol in sr:
          ...     print mol.title
+
+       or read the molecules in batches of flat arrays, without creating
+       Molecule objects:
+
+         >>> for batch in SDFReader("somefile.sdf").iter_batches(1000):
+         ...     print batch.numbers.shape, batch.atom_offsets
     """
+    # The number of characters read from the file at once.
+    block_size = 1024*1024
+    # The number of records parsed at once by the iterator protocol.
+    next_size = 64
+
     def __init__(self, f):
         """
            Argument:
             | ``f``  --  a filename or a file-like object
         """
+        self._buffer = ""
+        # The molecules parsed by __next__ that are not returned yet.
+        self._batch = None
+        self._batch_index = 0
+        # The number of records that __next__ parses one at a time.
+        self._num_single = 0
         if isinstance(f, str):
             self.filename = f
             self.f = open(f)
@@ -71,80 +338,111 @@ class SDFReader(object):
     def __iter__(self):
         return self
 
+    def _read_records(self, count):
+        """Return a string with the lines of the next records
+
+           Argument:
+            | ``count``  --  the maximum number of records
+        """
+        # The file is read in blocks. The text after the last record is kept
+        # for the next call.
+        parts = []
+        text = self._buffer
+        pos = 0
+        nrecord = 0
+        while nrecord < count:
+            end = text.find("\n$$$$\n", pos)
+            if end >= 0:
+                pos = end + 6
+                nrecord += 1
+            else:
+                block = self.f.read(self.block_size)
+                if len(block) == 0:
+                    pos = len(text)
+                    break
+                parts.append(text[:pos])
+                text = text[pos:] + block
+                pos = 0
+        parts.append(text[:pos])
+        self._buffer = text[pos:]
+        return "".join(parts)
+
     def __next__(self):
         """Load the next molecule from the SDF file
 
            This method is part of the iterator protocol.
         """
-        while True:
-            title = next(self.f)
-            if len(title) == 0:
+        if self._batch is None or self._batch_index >= len(self._batch):
+            # Parse a few records at once. This is much faster than parsing
+            # the records one by one.
+            size = 1 if self._num_single > 0 else self.next_size
+            text = self._read_records(size)
+            if len(text) == 0:
                 raise StopIteration
-            else:
-                title = title.strip()
-            next(self.f) # skip line
-            next(self.f) # skip empty line
-            words = next(self.f).split()
-            if len(words) < 2:
-                raise FileFormatError("Expecting at least two numbers at fourth line.")
             try:
-                num_atoms = int(words[0])
-                num_bonds = int(words[1])
-            except ValueError:
-                raise FileFormatError("Expecting at least two numbers at fourth line.")
+                batch = _parse_sdf_batch(text)
+            except FileFormatError:
+                if size == 1:
+                    raise
+                # Parse these records one at a time, such that all molecules
+                # before the faulty record are returned first.
+                self._buffer = text + self._buffer
+                self._num_single = size
+                return next(self)
+            self._num_single = max(0, self._num_single - 1)
+            if len(batch) == 0:
+                raise StopIteration
+            self._batch = batch
+            self._batch_index = 0
+        result = self._batch.get_molecule(self._batch_index)
+        self._batch_index += 1
+        return result
 
-            numbers = np.zeros(num_atoms, int)
-            coordinates = np.zeros((num_atoms, 3), float)
-            for i in range(num_atoms):
-                words = next(self.f).split()
-                if len(words) < 4:
-                    raise FileFormatError("Expecting at least four words on an atom line.")
-                try:
-                    coordinates[i, 0] = float(words[0])
-                    coordinates[i, 1] = float(words[1])
-                    coordinates[i, 2] = float(words[2])
-                except ValueError:
-                    raise FileFormatError("Coordinates must be floating point numbers.")
-                atom = periodic[words[3]]
-                if atom is None:
-                    raise FileFormatError("Unrecognized atom symbol: %s" % words[3])
-                numbers[i] = atom.number
-            coordinates *= angstrom
-
-            edges = []
-            orders = np.zeros(num_bonds, int)
-            for i in range(num_bonds):
-                words = next(self.f).split()
-                if len(words) < 3:
-                    raise FileFormatError("Expecting at least three numbers on a bond line.")
-                try:
-                    edges.append((int(words[0])-1, int(words[1])-1))
-                    orders[i] = int(words[2])
-                except ValueError:
-                    raise FileFormatError("Expecting at least three numbers on a bond line.")
-
-            formal_charges = np.zeros(len(numbers), int)
-
-            line = next(self.f)
-            while line != "M  END\n":
-                if line.startswith("M  CHG"):
-                    words = line[6:].split()[1:] # drop the first number which is the number of charges
-                    i = 0
-                    while i < len(words)-1:
-                        try:
-                            formal_charges[int(words[i])-1] = int(words[i+1])
-                        except ValueError:
-                            raise FileFormatError("Expecting only integer formal charges.")
-                        i += 2
-                line = next(self.f)
-
-            # Read on to the next molecule
-            for line in self.f:
-                if line == "$$$$\n":
-                    break
+    def iter_batches(self, size=1000, workers=1):
+        """Iterate over the remaining molecules in batches
+
+           Optional arguments:
+            | ``size``  --  the number of molecules per batch. (The last
+                            batch may be smaller.)
+            | ``workers``  --  The number of worker processes. When larger
+                               than one, the records are read by the current
+                               process and parsed by a pool of processes.
 
-            molecule = Molecule(numbers, coordinates, title)
-            molecule.formal_charges = formal_charges
-            molecule.formal_charges.setflags(write=False)
-            molecule.graph = MolecularGraph(edges, numbers, orders)
-            return molecule
+           Yields SDFBatch objects, in the same order as the records in the
+           file. At most ``2*workers`` batches are pending at any time. When
+           the iterator protocol was used before, the first batch contains
+           the molecules that were already parsed but not yet returned.
+        """
+        # First return the molecules that were parsed by __next__.
+        if self._batch is not None and self._batch_index < len(self._batch):
+            batch = self._batch.get_tail(self._batch_index)
+            self._batch = None
+            yield batch
+        if workers <= 1:
+            while True:
+                text = self._read_records(size)
+                if len(text) == 0:
+                    break
+                batch = _parse_sdf_batch(text)
+                if len(batch) > 0:
+                    yield batch
+            return
+        pool = multiprocessing.Pool(workers)
+        try:
+            pending = deque()
+            done = False
+            while True:
+                # Keep the number of pending batches bounded.
+                while not done and len(pending) < 2*workers:
+                    text = self._read_records(size)
+                    if len(text) == 0:
+                        done = True
+                    else:
+                        pending.append(pool.apply_async(_parse_sdf_batch, [text]))
+                if len(pending) == 0:
+                    break
+                batch = pending.popleft().get()
+                if len(batch) > 0:
+                    yield batch
+        finally:
+            pool.terminate()
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+# MolMod is a collection of molecular modelling tools for python.
+# Copyright (C) 2007 - 2019 Toon Verstraelen <Toon.Verstraelen@UGent.be>, Center
+# for Molecular Modeling (CMM), Ghent University, Ghent, Belgium; all rights
+# reserved unless otherwise stated.
+#
+# This file is part of MolMod.
+#
+# MolMod is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# MolMod is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+
+
+from __future__ import division
+
+import os
+
+import numpy as np
+import pkg_resources
+
+from molmod.test.common import *
+from molmod.io import *
+from molmod.io.binary_trajectory import main
+from molmod import *
+
+
+__all__ = ["BinaryTrajectoryTestCase"]
+
+
+class BinaryTrajectoryTestCase(BaseTestCase):
+    def test_dlpoly(self):
+        fn_history = pkg_resources.resource_filename("molmod", "data/test/dlpoly_HISTORY")
+        frames = list(DLPolyHistoryReader(fn_history))
+        with tmpdir(__name__, 'test_dlpoly') as dn:
+            bt = dump_binary_trajectory(DLPolyHistoryReader(fn_history), "%s/traj.bintrj" % dn)
+            self.assertEqual(len(bt), len(frames))
+            self.assertEqual(bt.natom, 3)
+            self.assertEqual(bt.fields, ["cell", "pos", "vel", "frc"])
+            self.assertEqual(bt.pos.shape, (len(frames), 3, 3))
+            for i, frame in enumerate(frames):
+                self.assertEqual(bt.time[i], frame["time"])
+                for key in "cell", "pos", "vel", "frc":
+                    self.assertArraysEqual(getattr(bt, key)[i], frame[key])
+            self.assertArraysEqual(bt[-1]["pos"], frames[-1]["pos"])
+            # single precision
+            bt = dump_binary_trajectory(DLPolyHistoryReader(fn_history), "%s/traj.bintrj" % dn, np.float32)
+            self.assertEqual(bt.pos.dtype, np.float32)
+            self.assertArraysAlmostEqual(bt.frc[1], frames[1]["frc"].astype(np.float32))
+            # an incomplete record at the end is ignored
+            with open("%s/traj.bintrj" % dn, "ab") as f:
+                f.write(b"\0"*17)
+            self.assertEqual(len(BinaryTrajectory("%s/traj.bintrj" % dn)), len(frames))
+
+    def test_cache(self):
+        xr = XYZReader(pkg_resources.resource_filename("molmod", "data/test/thf.xyz"))
+        title, coordinates = next(xr)
+        with tmpdir(__name__, 'test_cache') as dn:
+            fn = "%s/thf.xyz" % dn
+            xw = XYZWriter(fn, xr.symbols)
+            for i in range(5):
+                xw.dump("frame %i" % i, coordinates + i)
+            del xw
+            frames = list(XYZReader(fn))
+            bt = XYZReader(fn).get_binary_trajectory()
+            self.assertEqual(bt.filename, fn + ".bintrj")
+            self.assertEqual(bt.fields, ["pos"])
+            self.assertArraysEqual(bt.pos, np.array([coordinates for title, coordinates in frames]))
+            # the cache is used when it is up to date, even after reading frames
+            xr = XYZReader(fn)
+            next(xr)
+            bt = xr.get_binary_trajectory()
+            self.assertEqual(len(bt), len(frames))
+            # the cache is replaced when the settings differ
+            xr = XYZReader(fn, slice(1, None, 2))
+            next(xr)
+            self.assertRaises(ValueError, xr.get_binary_trajectory)
+            bt = XYZReader(fn, slice(1, None, 2)).get_binary_trajectory()
+            self.assertEqual(len(bt), len(frames[1::2]))
+            self.assertArraysEqual(bt.pos[0], frames[1][1])
+
+    def test_main(self):
+        fn_xyz = pkg_resources.resource_filename("molmod", "data/test/thf.xyz")
+        with tmpdir(__name__, 'test_main') as dn:
+            main(["xyz", fn_xyz, "%s/thf.bintrj" % dn, "--single"])
+            bt = BinaryTrajectory("%s/thf.bintrj" % dn)
+            self.assertEqual(bt.pos.dtype, np.float32)
+            self.assertEqual(len(bt), len(list(XYZReader(fn_xyz))))
+
+    def test_lammps(self):
+        with tmpdir(__name__, 'test_lammps') as dn:
+            fn = "%s/dump.txt" % dn
+            with open(fn, "w") as f:
+                for step in 0, 10:
+                    f.write("ITEM: TIMESTEP\n%i\nITEM: NUMBER OF ATOMS\n2\n" % step)
+                    f.write("ITEM: BOX BOUNDS pp pp pp\n0.0 10.0\n0.0 9.0\n0.0 8.0\n")
+                    f.write("ITEM: ATOMS id type xu yu zu vx vy vz fx fy fz\n")
+                    f.write("2 1 0.4 0.5 %.1f 0.1 0.2 0.3 1.0 2.0 3.0\n" % (0.6 + step))
+                    f.write("1 1 0.1 0.2 %.1f 0.4 0.5 0.6 4.0 5.0 6.0\n" % (0.3 + step))
+            columns = ["xu", "yu", "zu", "vx", "vy", "vz", "fx", "fy", "fz"]
+            units = [angstrom]*3 + [angstrom/femtosecond]*3 + [kcalmol/angstrom]*3
+            ldr = LAMMPSDumpReader(fn, units, columns=columns, sort=True, box=True)
+            frames = list(ldr)
+            bt = LAMMPSDumpReader(fn, units, columns=columns, sort=True, box=True).get_binary_trajectory()
+            self.assertEqual(bt.fields, ["cell", "pos", "vel", "frc"])
+            self.assertEqual(bt.natom, 2)
+            self.assertEqual(len(bt), 2)
+            for i, frame in enumerate(frames):
+                self.assertArraysEqual(bt.cell[i], frame[1].matrix)
+                for key, begin in ("pos", 2), ("vel", 5), ("frc", 8):
+                    self.assertArraysEqual(bt[i][key], np.array(frame[begin:begin+3]).T)
+            self.assertAlmostEqual(bt.pos[1, 0, 2]/angstrom, 10.3)
+            # The same file from the command line.
+            main(["lammps", fn, "%s/dump.bintrj" % dn])
+            bt2 = BinaryTrajectory("%s/dump.bintrj" % dn)
+            for key in "cell", "pos", "vel", "frc":
+                self.assertArraysAlmostEqual(getattr(bt2, key), getattr(bt, key))
+            # The arrays can only be found with named columns.
+            ldr = LAMMPSDumpReader(fn, units)
+            self.assertRaises(TypeError, ldr._get_frame_arrays, next(ldr))
+            ldr = LAMMPSDumpReader(fn, units[3:], columns=columns[3:])
+            self.assertRaises(TypeError, ldr._get_frame_arrays, next(ldr))
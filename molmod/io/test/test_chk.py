@@ -32,13 +32,14 @@ from molmod.io import load_chk, dump_chk
 
 
 def check_data_array(testname, data0, dtype):
-    with tmpdir(__name__, testname) as dn:
-        fn_test = os.path.join(dn, 'test.chk')
-        dump_chk(fn_test, data0)
-        data1 = load_chk(fn_test)
-        assert data0.keys() == data1.keys()
-        assert data1['values'].dtype == dtype
-        assert (np.asarray(data0['values'], dtype=dtype) == data1['values']).all()
+    for binary in False, True:
+        with tmpdir(__name__, testname) as dn:
+            fn_test = os.path.join(dn, 'test.chk')
+            dump_chk(fn_test, data0, binary)
+            data1 = load_chk(fn_test)
+            assert data0.keys() == data1.keys()
+            assert data1['values'].dtype == dtype
+            assert (np.asarray(data0['values'], dtype=dtype) == data1['values']).all()
 
 
 def test_strings_array():
@@ -79,14 +80,62 @@ def test_bool_array():
     check_data_array('test_bool_array', {'values': [True, False, False]}, bool)
 
 
-def check_data(testname, data0, dtype):
-    with tmpdir(__name__, testname) as dn:
+def test_text_format():
+    data = {'a': 1, 'b': np.arange(6).reshape(2, 3), 'c': [0.5, -1.25], 'd': None}
+    with tmpdir(__name__, 'test_text_format') as dn:
+        fn_test = os.path.join(dn, 'test.chk')
+        dump_chk(fn_test, data)
+        with open(fn_test) as f:
+            lines = f.readlines()
+    assert lines == [
+        'a                                         kind=int   1\n',
+        'b                                         kind=intar 2,3\n',
+        '                     0                      1                      2                      3\n',
+        '                     4                      5\n',
+        'c                                         kind=fltar 2\n',
+        ' 5.000000000000000e-01 -1.250000000000000e+00\n',
+        'd                                         kind=none   None\n',
+    ]
+
+
+def test_text_array_layout():
+    # Arrays may be spread over the lines in any way.
+    with tmpdir(__name__, 'test_text_array_layout') as dn:
+        fn_test = os.path.join(dn, 'test.chk')
+        with open(fn_test, 'w') as f:
+            f.write('%-40s  kind=fltar 2,2\n' % 'a')
+            f.write('1.0\n2.0 3.0\n\t4e0 5.0\n')
+            f.write('%-40s  kind=intar 3\n' % 'b')
+            f.write('1 2 3')
+        data = load_chk(fn_test)
+        assert (data['a'] == [[1.0, 2.0], [3.0, 4.0]]).all()
+        assert (data['b'] == [1, 2, 3]).all()
+        assert data['b'].dtype == int
+
+
+def test_binary_mmap():
+    data0 = {'a': np.random.uniform(0, 1, (10, 3)), 'b': np.arange(5), 'c': 'foo'}
+    with tmpdir(__name__, 'test_binary_mmap') as dn:
         fn_test = os.path.join(dn, 'test.chk')
-        dump_chk(fn_test, data0)
-        data1 = load_chk(fn_test)
-        assert data0.keys() == data1.keys()
-        assert data0['values'] == data1['values']
-        assert isinstance(data1['values'], dtype)
+        dump_chk(fn_test, data0, binary=True)
+        data1 = load_chk(fn_test, mmap_mode='r')
+        assert data1['c'] == 'foo'
+        assert isinstance(data1['a'].base, np.memmap)
+        assert (data1['a'] == data0['a']).all()
+        assert (data1['b'] == data0['b']).all()
+        assert not data1['a'].flags.writeable
+        del data1
+
+
+def check_data(testname, data0, dtype):
+    for binary in False, True:
+        with tmpdir(__name__, testname) as dn:
+            fn_test = os.path.join(dn, 'test.chk')
+            dump_chk(fn_test, data0, binary)
+            data1 = load_chk(fn_test)
+            assert data0.keys() == data1.keys()
+            assert data0['values'] == data1['values']
+            assert isinstance(data1['values'], dtype)
 
 
 def test_strings():
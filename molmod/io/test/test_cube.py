@@ -22,6 +22,9 @@
 # --
 
 
+import os
+import shutil
+
 import numpy as np
 import pkg_resources
 
@@ -112,8 +115,58 @@ class CubeTestCase(BaseTestCase):
         self.assertAlmostEqual(cf2.data[-1,-1,-1], np.sqrt(1.93947E-16), 19)
         # Test the points
         points = cf.get_points()
+        self.assertIsInstance(points, np.ndarray)
+        self.assertArraysAlmostEqual(points, get_cube_points(cf.origin, cf.axes, cf.nrep))
+        self.assertArraysAlmostEqual(points*2.0, 2.0*get_cube_points(cf.origin, cf.axes, cf.nrep))
+        points = cf.get_points_lazy()
         self.assertArraysAlmostEqual(points[0,0,0], cf.origin)
         self.assertArraysAlmostEqual(points[1,0,0], cf.origin + cf.axes[0])
         self.assertArraysAlmostEqual(points[0,1,0], cf.origin + cf.axes[1])
         self.assertArraysAlmostEqual(points[0,0,1], cf.origin + cf.axes[2])
         self.assertArraysAlmostEqual(points[5,3,2], cf.origin + 5*cf.axes[0] + 3*cf.axes[1] + 2*cf.axes[2])
+        self.assertEqual(points.shape, (11, 10, 9, 3))
+        self.assertArraysAlmostEqual(points[5,:,2], np.asarray(points)[5,:,2])
+        self.assertArraysAlmostEqual(np.asarray(points), get_cube_points(cf.origin, cf.axes, cf.nrep))
+        self.assertEqual(points.ndim, 4)
+        self.assertEqual(points.size, 11*10*9*3)
+        self.assertEqual(points.dtype, float)
+        self.assertArraysAlmostEqual(points.reshape(-1, 3), get_cube_points(cf.origin, cf.axes, cf.nrep).reshape(-1, 3))
+
+    def test_cube_reader_consistency(self):
+        fn_cube = pkg_resources.resource_filename("molmod", "data/test/alanine.cube")
+        cf = Cube.from_file(fn_cube)
+        points = cf.get_points()
+        vectors, values = zip(*CubeReader(fn_cube))
+        self.assertArraysAlmostEqual(np.array(values), cf.data.ravel())
+        self.assertArraysAlmostEqual(np.array(vectors), points.reshape(-1, 3))
+
+    def test_cube_cache(self):
+        with tmpdir(__name__, 'test_cube_cache') as dn:
+            fn_cube = '%s/alanine.cube' % dn
+            shutil.copy(pkg_resources.resource_filename("molmod", "data/test/alanine.cube"), fn_cube)
+            cf1 = Cube.from_file(fn_cube, cache=True)
+            self.assertTrue(os.path.isfile(fn_cube + '.npy'))
+            self.assertTrue(os.path.isfile(fn_cube + '.npy.source'))
+            # The sidecar file contains just the grid data.
+            self.assertArraysEqual(np.load(fn_cube + '.npy'), cf1.data)
+            self.assertTrue(cf1.data.flags.writeable)
+            cf2 = Cube.from_file(fn_cube, cache=True)
+            self.assertFalse(cf2.data.flags.writeable)
+            self.assertTrue((cf1.data == cf2.data).all())
+            self.assertEqual(cf2.molecule.title, cf1.molecule.title)
+            # An outdated sidecar file is replaced, also when the new cube
+            # file is older than the sidecar file (e.g. after cp -p).
+            cf3 = cf1.copy(2*cf1.data)
+            fn_other = '%s/other.cube' % dn
+            cf3.write_to_file(fn_other)
+            os.utime(fn_other, (0, 0))
+            shutil.copy2(fn_other, fn_cube)
+            self.assertLess(os.path.getmtime(fn_cube), os.path.getmtime(fn_cube + '.npy'))
+            cf4 = Cube.from_file(fn_cube, cache=True)
+            self.assertTrue(cf4.data.flags.writeable)
+            self.assertArraysAlmostEqual(cf4.data, cf3.data)
+            cf5 = Cube.from_file(fn_cube, cache=True)
+            self.assertFalse(cf5.data.flags.writeable)
+            self.assertArraysAlmostEqual(cf5.data, cf3.data)
+            del cf5
+            del cf2
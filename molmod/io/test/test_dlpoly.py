@@ -62,6 +62,48 @@ class DLPolyTestCase(BaseTestCase):
         frame = next(hr)
         self.assertEqual(frame["step"], 10382000)
 
+    def test_history_reader_random_access(self):
+        frames = list(DLPolyHistoryReader(pkg_resources.resource_filename("molmod", "data/test/dlpoly_HISTORY")))
+        with tmpdir(__name__, 'test_history_reader_random_access') as dn:
+            fn = "%s/HISTORY" % dn
+            with open(fn, "w") as f:
+                f.write(open(pkg_resources.resource_filename("molmod", "data/test/dlpoly_HISTORY")).read())
+            hr = DLPolyHistoryReader(fn)
+            self.assertEqual(hr[1]["step"], frames[1]["step"])
+            self.assertEqual(len(hr), len(frames))
+            self.assertArraysEqual(hr[-1]["pos"], frames[-1]["pos"])
+            # the frame counter starts at one in dlpoly
+            hr = DLPolyHistoryReader(fn, sub=slice(2, None))
+            self.assertEqual(len(hr.frame_offsets), len(frames))
+            self.assertEqual(len(hr), len(frames)-1)
+            self.assertEqual(next(hr)["step"], frames[1]["step"])
+
+    def test_history_reader_out(self):
+        fn = pkg_resources.resource_filename("molmod", "data/test/dlpoly_HISTORY")
+        frames = list(DLPolyHistoryReader(fn))
+        out = {"pos": np.zeros((3, 3)), "frc": np.zeros((3, 3)), "cell": np.zeros((3, 3))}
+        for frame, frame_check in zip(DLPolyHistoryReader(fn, out=out), frames):
+            self.assertIs(frame["pos"], out["pos"])
+            self.assertIs(frame["frc"], out["frc"])
+            self.assertIs(frame["cell"], out["cell"])
+            for key in "pos", "vel", "frc", "cell", "masses", "charges":
+                self.assertArraysEqual(frame[key], frame_check[key])
+            self.assertEqual(frame["symbols"], frame_check["symbols"])
+        hr = DLPolyHistoryReader(fn, out={"pos": np.zeros((2, 3))})
+        self.assertRaises(TypeError, next, hr)
+
+    def test_history_reader_error(self):
+        fn = pkg_resources.resource_filename("molmod", "data/test/dlpoly_HISTORY")
+        with tmpdir(__name__, 'test_history_reader_error') as dn:
+            lines = open(fn).readlines()
+            lines[11] = "  1.4925E+00  1.3242E+00  x.9260E+00\n"
+            with open("%s/HISTORY" % dn, "w") as f:
+                f.writelines(lines)
+            hr = DLPolyHistoryReader("%s/HISTORY" % dn)
+            with self.assertRaises(FileFormatError) as cm:
+                next(hr)
+            self.assertIn("2'th atom", str(cm.exception))
+
     def test_output_reader(self):
         outr = DLPolyOutputReader(pkg_resources.resource_filename("molmod", "data/test/dlpoly_OUTPUT"), skip_equi_period=False)
         row = next(outr)
@@ -69,3 +111,22 @@ class DLPolyTestCase(BaseTestCase):
         self.assertAlmostEqual(row[-1]/(1000*atm), 5.0151E+01)
         row = next(outr)
         self.assertAlmostEqual(row[0], 50)
+
+    def test_output_reader_random_access(self):
+        fn = pkg_resources.resource_filename("molmod", "data/test/dlpoly_OUTPUT")
+        rows = list(DLPolyOutputReader(fn, skip_equi_period=False))
+        self.assertEqual(len(rows), 17)
+        self.assertEqual(rows[-1][0], 15000)
+        outr = DLPolyOutputReader(fn, skip_equi_period=False)
+        self.assertEqual(len(outr.frame_offsets), 17)
+        self.assertEqual(len(outr), 17)
+        self.assertEqual(outr[5], rows[5])
+        self.assertEqual(next(outr), rows[6])
+        self.assertEqual(outr[-1], rows[-1])
+        outr = DLPolyOutputReader(fn, sub=slice(2, 10, 3), skip_equi_period=False)
+        self.assertEqual(len(outr.frame_offsets), 17)
+        self.assertEqual(list(outr), rows[1:9:3])
+        # the equilibration period is skipped when a frame is read
+        outr = DLPolyOutputReader(fn)
+        self.assertEqual(len(outr.frame_offsets), 17)
+        self.assertEqual(outr[0], rows[-1])
@@ -25,7 +25,7 @@
 import numpy as np
 import pkg_resources
 
-from molmod.test.common import BaseTestCase
+from molmod.test.common import BaseTestCase, tmpdir
 from molmod.io import *
 from molmod import *
 
@@ -68,3 +68,55 @@ class FCHKTestCase(BaseTestCase):
 
         fchk = FCHKFile(pkg_resources.resource_filename("molmod", "data/test/1TOH.b3lyp.trim.fchk"), ignore_errors=True, field_labels=["Virial Ratio"])
         self.assertAlmostEqual(fchk.fields["Virial Ratio"], 2.002408027154329)
+
+    def test_lazy_fields(self):
+        filename = pkg_resources.resource_filename("molmod", "data/test/1TOH.b3lyp.fchk")
+        fchk = FCHKFile(filename)
+        # Only the fields needed for the molecule are read when loading.
+        self.assertNotIn("Total SCF Density", fchk.fields._values)
+        self.assertIn("Total SCF Density", fchk.fields)
+        self.assertNotIn("Total SCF Density", fchk.fields._values)
+        # Compare all arrays with a straightforward word-by-word conversion.
+        with open(filename) as f:
+            lines = f.readlines()
+        num_arrays = 0
+        for iline, line in enumerate(lines):
+            words = line[43:].split()
+            if len(words) == 3 and words[1] == "N=" and words[0] in "IR":
+                label = line[:43].strip()
+                datatype = int if words[0] == "I" else float
+                length = int(words[2])
+                values = []
+                for other in lines[iline+1:]:
+                    if len(values) == length:
+                        break
+                    values.extend(datatype(word) for word in other.split())
+                value = fchk.fields[label]
+                self.assertEqual(value.dtype, np.dtype(datatype))
+                self.assertEqual(value.shape, (length,))
+                self.assertTrue((value == np.array(values)).all())
+                num_arrays += 1
+        self.assertGreater(num_arrays, 30)
+        self.assertIn("Total SCF Density", fchk.fields._values)
+
+    def test_lazy_fields_error(self):
+        with open(pkg_resources.resource_filename("molmod", "data/test/1TOH.b3lyp.fchk")) as f:
+            lines = f.readlines()
+        iline = lines.index("Nuclear charges                            R   N=           9\n")
+        lines[iline+1] = lines[iline+1].replace("8.00000000E+00", "8.000000xxE+00", 1)
+        with tmpdir(__name__, 'test_lazy_fields_error') as dn:
+            fn_fchk = '%s/broken.fchk' % dn
+            with open(fn_fchk, 'w') as f:
+                f.writelines(lines)
+            fchk = FCHKFile(fn_fchk)
+            # A membership test does not read the array.
+            self.assertIn("Nuclear charges", fchk.fields)
+            self.assertNotIn("Nuclear charges", fchk.fields._values)
+            # A field that can not be read is reported as a missing field.
+            self.assertIsNone(fchk.fields.get("Nuclear charges"))
+            self.assertNotIn("Nuclear charges", fchk.fields)
+            self.assertRaises(KeyError, fchk.fields.__getitem__, "Nuclear charges")
+            fchk = FCHKFile(fn_fchk, ignore_errors=True)
+            charges = fchk.fields["Nuclear charges"]
+            self.assertEqual(np.isnan(charges).sum(), 1)
+            self.assertEqual(charges[-1], 1.0)
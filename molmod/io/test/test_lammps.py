@@ -24,9 +24,10 @@
 
 from __future__ import division
 
+import numpy as np
 import pkg_resources
 
-from molmod.test.common import BaseTestCase
+from molmod.test.common import BaseTestCase, tmpdir
 from molmod.io import *
 from molmod import *
 
@@ -52,3 +53,50 @@ class LAMMPSTestCase(BaseTestCase):
 
         ldr = LAMMPSDumpReader(pkg_resources.resource_filename("molmod", "data/test/lammps_dump.txt"), [angstrom]*3 + [angstrom/femtosecond]*3, sub=slice(1,5,2))
         self.assertEqual(len(list(ldr)), 2)
+
+    def test_parallel_frames(self):
+        fn = pkg_resources.resource_filename("molmod", "data/test/lammps_dump.txt")
+        units = [angstrom]*3 + [angstrom/femtosecond]*3
+        for sub in slice(None), slice(1, None, 2):
+            expected = list(LAMMPSDumpReader(fn, units, sub=sub))
+            frames = list(parallel_frames(LAMMPSDumpReader, fn, workers=2, sub=sub, chunksize=2, units=units))
+            self.assertEqual(len(frames), len(expected))
+            for fields, fields_check in zip(frames, expected):
+                self.assertEqual(fields[0], fields_check[0])
+                for array, array_check in zip(fields[1:], fields_check[1:]):
+                    self.assertArraysEqual(array, array_check)
+
+    def test_dump_reader_columns(self):
+        with tmpdir(__name__, 'test_dump_reader_columns') as dn:
+            fn = "%s/dump.txt" % dn
+            with open(fn, "w") as f:
+                f.write("ITEM: TIMESTEP\n10\nITEM: NUMBER OF ATOMS\n3\n")
+                f.write("ITEM: BOX BOUNDS pp pp ff\n0.0 10.0\n-1.0 4.0\n2.0 5.0\n")
+                f.write("ITEM: ATOMS id type x y z\n3 1 0.3 0.4 0.5\n1 2 0.1 0.2 0.3\n2 1 0.2 0.3 0.4\n")
+                f.write("ITEM: TIMESTEP\n20\nITEM: NUMBER OF ATOMS\n2\n")
+                f.write("ITEM: BOX BOUNDS xy xz yz pp pp pp\n-1.0 11.0 1.0\n0.0 6.0 -2.0\n0.0 3.0 0.5\n")
+                f.write("ITEM: ATOMS type z id x y\n1 0.5 2 0.1 0.2\n2 0.6 1 0.7 0.8\n")
+                # an incomplete frame at the end
+                f.write("ITEM: TIMESTEP\n30\nITEM: NUMBER OF ATOMS\n2\n")
+                f.write("ITEM: BOX BOUNDS pp pp pp\n0.0 10.0\n0.0 10.0\n0.0 10.0\n")
+                f.write("ITEM: ATOMS id type x y z\n1 1 0.1 0.2 0.3\n")
+            ldr = LAMMPSDumpReader(fn, [1.0, angstrom], columns=["type", "x"], sort=True, box=True)
+            frames = list(ldr)
+            self.assertEqual(len(frames), 2)
+            step, unit_cell, types, x = frames[0]
+            self.assertEqual(step, 10)
+            self.assertArraysEqual(types, np.array([2.0, 1.0, 1.0]))
+            self.assertArraysAlmostEqual(x/angstrom, np.array([0.1, 0.2, 0.3]))
+            self.assertArraysAlmostEqual(unit_cell.matrix/angstrom, np.diag([10.0, 5.0, 3.0]))
+            self.assertArraysEqual(unit_cell.active, np.array([True, True, False]))
+            step, unit_cell, types, x = frames[1]
+            self.assertEqual(step, 20)
+            self.assertArraysEqual(types, np.array([2.0, 1.0]))
+            self.assertArraysAlmostEqual(x/angstrom, np.array([0.7, 0.1]))
+            self.assertArraysAlmostEqual(unit_cell.matrix/angstrom, np.array([
+                [9.0, 1.0, -2.0], [0.0, 5.5, 0.5], [0.0, 0.0, 3.0]]))
+            # without names, the first column is the id
+            ldr = LAMMPSDumpReader(fn, [1.0, angstrom], sub=slice(1, 2))
+            step, types, x = next(ldr)
+            self.assertArraysAlmostEqual(types, np.array([0.5, 0.6]))
+            self.assertRaises(FileFormatError, next, LAMMPSDumpReader(fn, [1.0], columns=["vx"]))
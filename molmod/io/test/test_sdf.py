@@ -24,10 +24,13 @@
 
 from __future__ import division
 
+from builtins import range
+import os
 import unittest
 
 import pkg_resources
 
+from molmod.test.common import tmpdir
 from molmod.io import *
 from molmod import *
 
@@ -74,3 +77,95 @@ class SDFTestCase(unittest.TestCase):
         self.assertAlmostEqual(mol.coordinates[13,0]/angstrom, 12.6002)
         self.assert_((mol.formal_charges[:12]==-1).all())
         self.assert_((mol.formal_charges[12:]==0).all())
+
+    def check_batches(self, filenames, size, workers):
+        molecules = []
+        with tmpdir(__name__, 'check_batches') as dn:
+            fn_sdf = os.path.join(dn, 'all.sdf')
+            with open(fn_sdf, 'w') as fout:
+                for filename in filenames:
+                    fn = pkg_resources.resource_filename("molmod", "data/test/%s" % filename)
+                    molecules.extend(SDFReader(fn))
+                    with open(fn) as fin:
+                        # Drop the empty line after the last record.
+                        fout.write(fin.read().rstrip() + '\n')
+            batches = list(SDFReader(fn_sdf).iter_batches(size, workers))
+        self.assertEqual([len(batch) for batch in batches[:-1]], [size]*(len(batches)-1))
+        self.assertEqual(sum(len(batch) for batch in batches), len(molecules))
+        counter = 0
+        for batch in batches:
+            self.assertEqual(batch.atom_offsets[-1], len(batch.numbers))
+            self.assertEqual(batch.bond_offsets[-1], len(batch.bonds))
+            for i in range(len(batch)):
+                mol = molecules[counter]
+                begin, end = batch.atom_offsets[i:i+2]
+                self.assertEqual(batch.titles[i], mol.title)
+                self.assert_((batch.numbers[begin:end] == mol.numbers).all())
+                self.assert_((batch.coordinates[begin:end] == mol.coordinates).all())
+                self.assert_((batch.formal_charges[begin:end] == mol.formal_charges).all())
+                bonds = batch.bonds[batch.bond_offsets[i]:batch.bond_offsets[i+1]]
+                self.assert_((bonds >= begin).all() and (bonds < end).all())
+                self.assertEqual(set(frozenset(bond - begin) for bond in bonds), set(mol.graph.edges))
+                other = batch.get_molecule(i)
+                self.assertEqual(other.graph.edges, mol.graph.edges)
+                self.assert_((other.graph.orders == mol.graph.orders).all())
+                counter += 1
+
+    def test_batches(self):
+        filenames = ["example.sdf", "CID_22898828.sdf", "SID_31646545.sdf", "SID_55127927.sdf"]
+        self.check_batches(filenames, 2, 1)
+        self.check_batches(filenames, 3, 1)
+        self.check_batches(filenames, 100, 1)
+
+    def test_batches_workers(self):
+        filenames = ["example.sdf", "CID_22898828.sdf", "SID_31646545.sdf", "SID_55127927.sdf"]
+        self.check_batches(filenames, 2, 2)
+
+    def test_next_buffered(self):
+        filenames = ["example.sdf", "CID_22898828.sdf", "SID_31646545.sdf", "SID_55127927.sdf"]
+        with tmpdir(__name__, 'test_next_buffered') as dn:
+            fn_sdf = os.path.join(dn, 'all.sdf')
+            titles = []
+            with open(fn_sdf, 'w') as fout:
+                for filename in filenames:
+                    fn = pkg_resources.resource_filename("molmod", "data/test/%s" % filename)
+                    titles.extend(mol.title for mol in SDFReader(fn))
+                    with open(fn) as fin:
+                        text = fin.read().rstrip() + '\n'
+                    fout.write(text)
+                # a record with an invalid atom count, followed by a valid one
+                fout.write(text.replace(text.split('\n')[3], 'xx', 1))
+                fout.write(text)
+            # Mix the iterator protocol with iter_batches.
+            sdf_reader = SDFReader(fn_sdf)
+            sdf_reader.next_size = 3
+            self.assertEqual(next(sdf_reader).title, titles[0])
+            batch = next(sdf_reader.iter_batches(100))
+            self.assertEqual(batch.titles, titles[1:3])
+            self.assertEqual(next(sdf_reader).title, titles[3])
+            # All molecules before the faulty record are returned first.
+            sdf_reader = SDFReader(fn_sdf)
+            sdf_reader.next_size = 3
+            for title in titles:
+                self.assertEqual(next(sdf_reader).title, title)
+            self.assertRaises(FileFormatError, next, sdf_reader)
+            self.assertEqual(next(sdf_reader).title, titles[-1])
+            self.assertRaises(StopIteration, next, sdf_reader)
+
+    def test_index_out_of_range(self):
+        with open(pkg_resources.resource_filename("molmod", "data/test/example.sdf")) as f:
+            text = f.read()
+        # The first record has 16 atoms.
+        texts = [
+            text.replace("\n  5 16  1  0", "\n  5 18  1  0", 1),
+            text.replace("\n  5 16  1  0", "\n  5  0  1  0", 1),
+            text.replace("\nM  END\n", "\nM  CHG  1  18  -1\nM  END\n", 1),
+        ]
+        with tmpdir(__name__, 'test_index_out_of_range') as dn:
+            fn_sdf = os.path.join(dn, 'broken.sdf')
+            for broken in texts:
+                self.assertNotEqual(broken, text)
+                with open(fn_sdf, 'w') as f:
+                    f.write(broken)
+                self.assertRaises(FileFormatError, next, SDFReader(fn_sdf).iter_batches(100))
+                self.assertRaises(FileFormatError, next, SDFReader(fn_sdf))
@@ -24,6 +24,7 @@
 
 from __future__ import division
 
+import os
 import unittest
 
 import pkg_resources
@@ -92,6 +93,107 @@ class XYZTestCase(BaseTestCase):
             self.assertAlmostEqual(xf.geometries[0,0,0]/angstrom, -0.0914980466)
             self.assertAlmostEqual(xf.geometries[0,2,2]/angstrom, -0.7649930856)
 
+    def test_random_access(self):
+        xr1 = XYZReader(pkg_resources.resource_filename("molmod", "data/test/water.xyz"))
+        title, coordinates = next(xr1)
+        with tmpdir(__name__, 'test_random_access') as dn:
+            fn = "%s/test.xyz" % dn
+            xw = XYZWriter(fn, xr1.symbols)
+            for i in range(10):
+                xw.dump("frame %i" % i, coordinates + i)
+            del xw
+            # also store the offsets of this small file in a sidecar file
+            XYZReader.sidecar_min_size = 0
+            try:
+                xr2 = XYZReader(fn)
+                # the length is only known once the frames are indexed
+                self.assertRaises(TypeError, len, xr2)
+                self.assertEqual(len(xr2.frame_offsets), 10)
+                self.assertEqual(len(xr2), 10)
+                self.assert_(os.path.isfile(fn + ".offsets.npz"))
+                title, coordinates2 = xr2[7]
+                self.assertEqual(title, "frame 7")
+                self.assertArraysAlmostEqual(coordinates2, coordinates + 7)
+                self.assertEqual(next(xr2)[0], "frame 8")
+                self.assertEqual(xr2[-1][0], "frame 9")
+                self.assertRaises(StopIteration, next, xr2)
+                # the sidecar file is used for slicing
+                xr3 = XYZReader(fn, slice(1, 8, 3))
+                self.assertEqual(len(xr3), 3)
+                self.assertEqual(xr3[1][0], "frame 4")
+                self.assertEqual([title for title, coordinates in XYZReader(fn, slice(1, 8, 3))],
+                                 ["frame 1", "frame 4", "frame 7"])
+                # the sidecar file is updated when the file changes
+                xw = XYZWriter(open(fn, "a"), xr1.symbols)
+                xw.dump("frame 10", coordinates)
+                xw._f.close()
+                xr4 = XYZReader(fn, slice(8, None))
+                self.assertEqual([title for title, coordinates in xr4], ["frame 8", "frame 9", "frame 10"])
+                self.assertRaises(TypeError, len, xr4)
+                self.assertEqual(len(xr4.frame_offsets), 11)
+                self.assertEqual(len(xr4), 3)
+                self.assertEqual(len(XYZReader(fn)), 11)
+            finally:
+                del XYZReader.sidecar_min_size
+
+    def test_parallel_frames(self):
+        xr = XYZReader(pkg_resources.resource_filename("molmod", "data/test/thf.xyz"))
+        title, coordinates = next(xr)
+        with tmpdir(__name__, 'test_parallel_frames') as dn:
+            fn = "%s/test.xyz" % dn
+            xw = XYZWriter(fn, xr.symbols)
+            for i in range(23):
+                xw.dump("frame %i" % i, coordinates + i)
+            del xw
+            # an incomplete last frame
+            with open(fn, "a") as f:
+                f.write("%i\nframe 23\nC 0.0 0.0 0.0\n" % len(xr.symbols))
+            for sub in slice(None), slice(3, 20, 4):
+                expected = list(XYZReader(fn, sub))
+                frames = list(parallel_frames(XYZReader, fn, workers=3, sub=sub, chunksize=2))
+                self.assertEqual(len(frames), len(expected))
+                for (title, coordinates2), (title_check, coordinates_check) in zip(frames, expected):
+                    self.assertEqual(title, title_check)
+                    self.assertArraysEqual(coordinates2, coordinates_check)
+            frames = list(parallel_frames(XYZReader, fn, workers=2, file_unit=1.0))
+            self.assertEqual(len(frames), 23)
+            self.assertAlmostEqual(frames[1][1][0, 0], (coordinates[0, 0] + 1)/angstrom, 5)
+
+    def test_fast_path(self):
+        # Compare with a plain line-by-line parser, for binary and text files.
+        fns = [pkg_resources.resource_filename("molmod", "data/test/%s.xyz" % name)
+               for name in ["water", "thf", "tpa", "funny", "probes"]]
+        with tmpdir(__name__, 'test_fast_path') as dn:
+            # a trajectory with Windows newlines, extra columns and a truncated last frame
+            fn = "%s/test.xyz" % dn
+            with open(fn, "w") as f:
+                for i in range(5):
+                    f.write("2\r\nframe %i\r\nC 1 2.5e-1 %i 7\r\nH -0.5 1E2 0.001 x\r\n" % (i, i))
+                f.write("2\r\nframe 5\r\nC 1 2 3\r\nH 1 2")
+            fns.append(fn)
+            for fn in fns:
+                expected = []
+                with open(fn) as f:
+                    while True:
+                        try:
+                            size = int(f.readline())
+                        except ValueError:
+                            break
+                        title = f.readline()[:-1]
+                        rows = [f.readline().split()[1:4] for i in range(size)]
+                        if any(len(row) != 3 for row in rows):
+                            break
+                        coordinates = np.array(rows, float)*angstrom
+                        expected.append((title, coordinates))
+                for xr in XYZReader(fn), XYZReader(open(fn)):
+                    frames = list(xr)
+                    self.assertEqual(len(frames), len(expected))
+                    for (title, coordinates), (title_check, coordinates_check) in zip(frames, expected):
+                        self.assertEqual(title, title_check)
+                        self.assertArraysEqual(coordinates, coordinates_check)
+            self.assertEqual(frames[-1][0], "frame 4")
+            self.assertEqual(XYZReader(fn).symbols, ("C", "H"))
+
     def test_probes(self):
         xyz = XYZFile(pkg_resources.resource_filename("molmod", "data/test/probes.xyz"))
         self.assertEqual(xyz.numbers[-1], 0)
@@ -31,7 +31,7 @@ from __future__ import division
 from builtins import range
 import numpy as np
 
-from molmod.io.common import SlicedReader, FileFormatError
+from molmod.io.common import SlicedReader, FileFormatError, skip_lines
 from molmod.periodic import periodic
 from molmod.molecules import Molecule
 from molmod.units import angstrom
@@ -50,6 +50,14 @@ class XYZReader(SlicedReader):
                  print title
     """
 
+    # Binary files can be read in blocks of several lines, see _read_table.
+    _file_mode = "rb"
+
+    # The columns with the Cartesian coordinates.
+    _columns = np.array([1, 2, 3])
+
+    _binary_options = ("file_unit",)
+
     def __init__(self, f, sub=slice(None), file_unit=angstrom):
         """Initialize an XYZ reader
 
@@ -100,29 +108,46 @@ class XYZReader(SlicedReader):
         """Read a frame from the XYZ file"""
 
         size = self.read_size()
-        title = self._f.readline()[:-1]
+        title = self._readline()[:-1]
+        if self.symbols is None:
+            coordinates = self._parse_lines([self._f.readline() for counter in range(size)])
+        else:
+            coordinates = self._read_table(size, self._columns)
+            if isinstance(coordinates, list):
+                # Let the slow code figure out what is wrong.
+                coordinates = self._parse_lines(coordinates)
+        coordinates *= self.file_unit
+        return title, coordinates
+
+    def _parse_lines(self, lines):
+        """Convert the atom lines of a frame to coordinates, line by line
+
+           When the symbols are not known yet, they are also read.
+        """
         if self.symbols is None:
             symbols = []
-        coordinates = np.zeros((size, 3), float)
-        for counter in range(size):
-            line = self._f.readline()
+        coordinates = np.zeros((len(lines), 3), float)
+        for counter, line in enumerate(lines):
             if len(line) == 0:
                 raise StopIteration
             words = line.split()
             if len(words) < 4:
                 raise StopIteration
             if self.symbols is None:
-                symbols.append(words[0])
+                symbols.append(words[0] if isinstance(words[0], str) else words[0].decode())
             try:
                 coordinates[counter, 0] = float(words[1])
                 coordinates[counter, 1] = float(words[2])
                 coordinates[counter, 2] = float(words[3])
             except ValueError:
                 raise StopIteration
-        coordinates *= self.file_unit
         if self.symbols is None:
             self.symbols = symbols
-        return title, coordinates
+        return coordinates
+
+    def _get_frame_arrays(self, frame):
+        """Return a dictionary with the arrays of a frame, see SlicedReader"""
+        return {"pos": frame[1]}
 
     def _skip_frame(self):
         """Skip a single frame from the trajectory"""
@@ -132,6 +157,18 @@ class XYZReader(SlicedReader):
             if len(line) == 0:
                 raise StopIteration
 
+    def _scan_frame_offsets(self, f):
+        """Iterate over the byte offsets of all frames, see SlicedReader"""
+        while True:
+            offset = f.tell()
+            try:
+                size = int(f.readline())
+            except ValueError:
+                return
+            if skip_lines(f, size+1) < size+1:
+                return
+            yield offset
+
     def get_first_molecule(self):
         """Get the first molecule from the trajectory
 
@@ -26,6 +26,9 @@
 from __future__ import division
 
 from builtins import range
+from itertools import islice
+import multiprocessing
+
 import numpy as np
 
 from molmod.graphs import cached, Graph, CustomPattern
@@ -107,86 +110,206 @@ class MolecularGraph(Graph):
         """
         from molmod.bonds import bonds
 
-        unit_cell = molecule.unit_cell
-        pair_search = PairSearchIntra(
-            molecule.coordinates,
-            bonds.max_length*bonds.bond_tolerance*scaling,
-            unit_cell
-        )
-
-        orders = []
-        lengths = []
-        edges = []
-
-        for i0, i1, delta, distance in pair_search:
-            bond_order = bonds.bonded(molecule.numbers[i0], molecule.numbers[i1], distance/scaling)
-            if bond_order is not None:
-                if do_orders:
-                    orders.append(bond_order)
-                lengths.append(distance)
-                edges.append((i0,i1))
-
-        if do_orders:
-            result = cls(edges, molecule.numbers, orders, symbols=molecule.symbols)
+        # Eliminate most candidate pairs with the (Z, Z) threshold table before
+        # the bond types are assigned.
+        numbers = molecule.numbers
+        size = len(bonds.threshold_table)
+        known = (numbers > 0) & (numbers < size)
+        if known.any():
+            pair_search = PairSearchIntra(
+                molecule.coordinates,
+                bonds.max_length*bonds.bond_tolerance*scaling,
+                molecule.unit_cell
+            )
+            pairs, deltas, distances = pair_search.arrays()
+            numbers0 = numbers[pairs[:, 0]]
+            numbers1 = numbers[pairs[:, 1]]
+            mask = known[pairs[:, 0]] & known[pairs[:, 1]]
+            mask[mask] = distances[mask] < bonds.threshold_table[numbers0[mask], numbers1[mask]]*scaling
+            pairs = pairs[mask]
+            deltas = deltas[mask]
+            distances = distances[mask]
+            bond_types = bonds.bonded_array(numbers0[mask], numbers1[mask], distances/scaling)
+            mask = bond_types > 0
+            pairs = pairs[mask]
+            deltas = deltas[mask]
+            distances = distances[mask]
+            bond_types = bond_types[mask]
         else:
-            result = cls(edges, molecule.numbers, symbols=molecule.symbols)
+            pairs = np.zeros((0, 2), int)
+            deltas = np.zeros((0, 3), float)
+            distances = np.zeros(0, float)
+            bond_types = np.zeros(0, int)
 
         # run a check on all neighbors. if two bonds point in a direction that
-        # differs only by 45 deg. the longest of the two is discarded. the
-        # double loop over the neighbors is done such that the longest bonds
-        # are eliminated first
-        slated_for_removal = set([])
-        threshold = 0.5**0.5
-        for c, ns in result.neighbors.items():
-            lengths_ns = []
-            for n in ns:
-                delta = molecule.coordinates[n] - molecule.coordinates[c]
-                if unit_cell is not None:
-                    delta = unit_cell.shortest_vector(delta)
-                length = np.linalg.norm(delta)
-                lengths_ns.append([length, delta, n])
-            lengths_ns.sort(reverse=True, key=(lambda r: r[0]))
-            for i0, (length0, delta0, n0) in enumerate(lengths_ns):
-                for i1, (length1, delta1, n1) in enumerate(lengths_ns[:i0]):
-                    if length1 == 0.0:
-                        continue
-                    cosine = np.dot(delta0, delta1)/length0/length1
-                    if cosine > threshold:
-                        # length1 > length0
-                        slated_for_removal.add((c,n1))
-                        lengths_ns[i1][0] = 0.0
-        # construct a mask
-        mask = np.ones(len(edges), bool)
-        for i0, i1 in slated_for_removal:
-            edge_index = result.edge_index.get(frozenset([i0,i1]))
-            if edge_index is None:
-                raise ValueError('Could not find edge that has to be removed: %i %i' % (i0, i1))
-            mask[edge_index] = False
-        # actual removal
-        edges = [edges[i] for i in range(len(edges)) if mask[i]]
+        # differs only by 45 deg. the longest of the two is discarded.
+        mask = np.ones(len(pairs), bool)
+        mask[cls._get_overlapping_bonds(pairs, deltas, distances)] = False
+
         if do_orders:
-            bond_order = [bond_order[i] for i in range(len(bond_order)) if mask[i]]
-            result = cls(edges, molecule.numbers, orders)
+            orders = bond_types[mask].astype(float)
         else:
-            result = cls(edges, molecule.numbers)
+            orders = None
+        result = cls(pairs[mask], molecule.numbers, orders, symbols=molecule.symbols)
+        result.bond_lengths = distances[mask]
+        return result
 
-        lengths = [lengths[i] for i in range(len(lengths)) if mask[i]]
-        result.bond_lengths = np.array(lengths)
+    @staticmethod
+    def _get_overlapping_bonds(pairs, deltas, distances):
+        """Find bonds that point in (nearly) the same direction as a shorter one
 
-        return result
+           Arguments:
+            | ``pairs``  --  array with shape (nbond, 2) with the bonded atoms
+            | ``deltas``  --  array with shape (nbond, 3) with the relative
+                              vectors from the first to the second atom
+            | ``distances``  --  the bond lengths
+
+           For every pair of bonds that share an atom and that make an angle
+           below 45 degrees, the longest of the two is selected. Of two bonds
+           with the same length, the one with the highest index is selected.
+           Returns the indexes of the selected bonds. Bonds with zero length
+           are ignored.
+        """
+        # directed bonds, for each center atom all bonds to its neighbors
+        nbond = len(pairs)
+        centers = np.concatenate([pairs[:, 0], pairs[:, 1]])
+        vectors = np.concatenate([deltas, -deltas])
+        indexes = np.concatenate([np.arange(nbond), np.arange(nbond)])
+        order = centers.argsort(kind='mergesort')
+        centers = centers[order]
+        vectors = vectors[order]
+        indexes = indexes[order]
+
+        # all pairs (a, b) of directed bonds with the same center and a < b
+        last = np.searchsorted(centers, centers, side='right')
+        counts = last - np.arange(len(centers)) - 1
+        a = np.repeat(np.arange(len(centers)), counts)
+        b = np.arange(len(a)) - np.repeat(np.cumsum(counts) - counts, counts) + a + 1
+
+        # select the longest bond of each pair that makes an angle below 45 deg
+        length_a = distances[indexes[a]]
+        length_b = distances[indexes[b]]
+        valid = (length_a > 0) & (length_b > 0)
+        a = a[valid]
+        b = b[valid]
+        length_a = length_a[valid]
+        length_b = length_b[valid]
+        cosines = (vectors[a]*vectors[b]).sum(axis=1)/length_a/length_b
+        close = cosines > 0.5**0.5
+        index_a = indexes[a[close]]
+        index_b = indexes[b[close]]
+        length_a = length_a[close]
+        length_b = length_b[close]
+        longest = np.where(
+            (length_a > length_b) | ((length_a == length_b) & (index_a > index_b)),
+            index_a, index_b
+        )
+        return np.unique(longest)
+
+    @classmethod
+    def iter_from_trajectory(cls, reader, workers=1, numbers=None, unit_cell=None,
+                             get_molecule=None, do_orders=False, scaling=1.0,
+                             changes=False, chunksize=16):
+        """Construct a MolecularGraph for each frame in a trajectory
+
+           Frames are read from the reader in the current process. The graphs
+           are constructed with :meth:`from_geometry`, optionally in a pool of
+           worker processes, and they are yielded in the same order as the
+           frames. Frames are processed in batches of ``workers*chunksize``
+           such that the memory usage does not depend on the trajectory length.
+
+           Argument:
+            | ``reader``  --  An iterator over frames, typically a
+                              :class:`molmod.io.common.SlicedReader` instance.
+
+           Optional arguments:
+            | ``workers``  --  The number of worker processes. When 1, all
+                               graphs are constructed in the current process.
+            | ``numbers``  --  The atom numbers. When not given, the attribute
+                               ``numbers`` of the reader is used.
+            | ``unit_cell``  --  The periodic boundary conditions.
+            | ``get_molecule``  --  A function that converts a frame into a
+                                    Molecule object. The default looks for the
+                                    coordinates in the frame, see
+                                    :func:`_get_frame_coordinates`. This
+                                    function must be given for readers whose
+                                    frames contain no (N, 3) coordinate array,
+                                    e.g. LAMMPSDumpReader without named
+                                    x, y and z columns.
+            | ``do_orders``, ``scaling``  --  See :meth:`from_geometry`.
+            | ``changes``  --  When True, only frames in which the bonds have
+                               changed are reported (see below).
+            | ``chunksize``  --  The number of frames sent to a worker at once.
+
+           By default, the graph of every frame is yielded. When ``changes`` is
+           True, tuples ``(index, graph, added, removed)`` are yielded instead,
+           only for the frames whose edges differ from those of the previous
+           frame. ``index`` is the position of the frame in the reader, while
+           ``added`` and ``removed`` are sets with edges (frozensets) that were
+           added and removed compared to the previous frame. For the first
+           frame, all edges are reported as added.
+        """
+        if get_molecule is None:
+            if numbers is None:
+                numbers = getattr(reader, "numbers", None)
+                if numbers is None:
+                    raise TypeError("The atom numbers must be given when the "
+                        "reader has no attribute numbers. Alternatively, pass "
+                        "a get_molecule function.")
+            from molmod.molecules import Molecule
+            def get_molecule(frame):
+                """Default conversion of a frame to a molecule"""
+                coordinates = _get_frame_coordinates(frame, len(numbers), reader)
+                return Molecule(numbers, coordinates, unit_cell=unit_cell)
+
+        def iter_graphs():
+            """Construct the graphs in batches"""
+            frames = iter(reader)
+            if workers > 1:
+                pool = multiprocessing.Pool(workers)
+            try:
+                while True:
+                    batch = [
+                        (cls, get_molecule(frame), do_orders, scaling)
+                        for frame in islice(frames, workers*chunksize)
+                    ]
+                    if len(batch) == 0:
+                        break
+                    if workers > 1:
+                        results = pool.map(_from_geometry_worker, batch, chunksize)
+                    else:
+                        results = [_from_geometry_worker(args) for args in batch]
+                    for graph, bond_lengths in results:
+                        graph.bond_lengths = bond_lengths
+                        yield graph
+            finally:
+                if workers > 1:
+                    pool.terminate()
+
+        if not changes:
+            for graph in iter_graphs():
+                yield graph
+        else:
+            old_edges = frozenset()
+            for index, graph in enumerate(iter_graphs()):
+                new_edges = frozenset(graph.edges)
+                if new_edges != old_edges:
+                    yield index, graph, new_edges - old_edges, old_edges - new_edges
+                old_edges = new_edges
 
     @classmethod
     def from_blob(cls, s):
         """Construct a molecular graph from the blob representation"""
-        atom_str, edge_str = s.split()
+        atom_str, edge_str = s.split(" ")
         numbers = np.array([int(s) for s in atom_str.split(",")])
         edges = []
         orders = []
-        for s in edge_str.split(","):
+        # a graph without edges has an empty edge_str
+        for s in edge_str.split(",") if len(edge_str) > 0 else []:
             i, j, o = (int(w) for w in s.split("_"))
             edges.append((i, j))
             orders.append(o)
-        return cls(edges, numbers, np.array(orders))
+        return cls(edges, numbers, np.array(orders), num_vertices=len(numbers))
 
     def __init__(self, edges, numbers, orders=None, symbols=None, num_vertices=None):
         """
@@ -345,6 +468,62 @@ class MolecularGraph(Graph):
 
 # basic criteria for molecular patterns
 
+def _get_frame_coordinates(frame, num_atoms, reader=None):
+    """Find the Cartesian coordinates in a frame from a trajectory reader
+
+       Arguments:
+        | ``frame``  --  A frame, as returned by one of the readers in
+                         :mod:`molmod.io`.
+        | ``num_atoms``  --  The number of atoms.
+
+       Optional argument:
+        | ``reader``  --  The reader that returned the frame.
+
+       When the reader implements ``_get_frame_arrays`` (see
+       :class:`molmod.io.common.SlicedReader`), the array ``pos`` is used.
+       Otherwise, the following cases are supported: an array, a dictionary
+       with a key ``pos``, an object with an attribute ``coordinates`` and a
+       tuple or list whose first array with shape (num_atoms, 3) contains the
+       coordinates.
+    """
+    get_frame_arrays = getattr(reader, "_get_frame_arrays", None)
+    if get_frame_arrays is not None:
+        try:
+            coordinates = get_frame_arrays(frame).get("pos")
+        except (NotImplementedError, TypeError):
+            # The reader can not find the arrays in this frame.
+            coordinates = None
+        if coordinates is not None:
+            return coordinates
+    if isinstance(frame, dict):
+        candidates = [frame.get("pos")]
+    elif hasattr(frame, "coordinates"):
+        candidates = [frame.coordinates]
+    elif isinstance(frame, (tuple, list)):
+        candidates = frame
+    else:
+        candidates = [frame]
+    for candidate in candidates:
+        if isinstance(candidate, np.ndarray) and candidate.shape == (num_atoms, 3):
+            return candidate
+    raise TypeError("Could not find coordinates with shape (%i, 3) in the "
+        "frame. For readers that do not store the coordinates in such an "
+        "array (e.g. LAMMPSDumpReader without named x, y and z columns), "
+        "the argument get_molecule of "
+        "iter_from_trajectory must be given." % num_atoms)
+
+
+def _from_geometry_worker(args):
+    """Call MolecularGraph.from_geometry, used by iter_from_trajectory
+
+       The bond lengths are returned separately because they are not pickled
+       together with the graph.
+    """
+    cls, molecule, do_orders, scaling = args
+    graph = cls.from_geometry(molecule, do_orders, scaling)
+    return graph, graph.bond_lengths
+
+
 class HasAtomNumber(object):
     """Criterion for the atom number of a vertex"""
 
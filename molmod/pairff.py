@@ -20,10 +20,23 @@
 # along with this program; if not, see <http://www.gnu.org/licenses/>
 #
 # --
-"""Reference implementations of a few conventional nonbonding force fields
-
-   The main purpose of this implementation is reliability, not speed. These
-   routines can be used to validate an efficient low level implementation.
+"""Implementations of a few conventional nonbonding force fields
+
+   All pair terms are evaluated at once with numpy arrays. The force fields in
+   this module only loop over the different types of terms in the energy
+   expression, never over atom pairs.
+
+   By default, all pairs of atoms interact and the distances are stored in
+   dense NxN arrays. For large (periodic) systems, a force field can be
+   given a :class:`molmod.binning.VerletList`. Only the pairs within the
+   cutoff of the Verlet list then interact and all pairwise quantities are
+   stored in sparse PairArray objects. Example::
+
+     >>> scaling = PairArray.from_graph(graph, [0.0, 0.0, 0.5])
+     >>> strengths = TypePairArray(atom_types, table)
+     >>> ff = DispersionFF(scaling, strengths, coordinates,
+     ...                   VerletList(15.0, 1.0, unit_cell))
+     >>> hessian = ff.hessian_sparse()
 """
 
 
@@ -32,11 +45,141 @@ from __future__ import division
 from builtins import range
 import numpy as np
 
+from molmod.ic_system import CSRMatrix
+
+
 __all__ = [
-    "PairFF", "CoulombFF", "DispersionFF", "PauliFF", "ExpRepFF",
+    "PairArray", "TypePairArray", "PairFF", "CoulombFF", "DispersionFF",
+    "PauliFF", "ExpRepFF",
 ]
 
 
+def _scatter(indexes, values, size):
+    """Sum the rows of values with the same index
+
+       Arguments:
+         indexes  --  an integer array with the destination of each row
+         values  --  an array whose first axis runs over the rows
+         size  --  the number of rows in the result
+
+       Returns an array with shape (size,) + values.shape[1:]
+    """
+    flat = values.reshape(len(indexes), int(np.prod(values.shape[1:])))
+    result = np.zeros((size, flat.shape[1]), float)
+    for column in range(flat.shape[1]):
+        result[:, column] = np.bincount(indexes, flat[:, column], size)
+    return result.reshape((size,) + values.shape[1:])
+
+
+class PairArray(object):
+    """A symmetric or antisymmetric NxN array that only stores a few pairs
+
+       Elements are accessed as in a numpy array, ``a[i, j]``, where i and j
+       are atom indexes or integer arrays with atom indexes. Elements of pairs
+       that are not stored get the default value. Without a default value,
+       accessing such an element raises a KeyError.
+    """
+
+    def __init__(self, size, index1, index2, values, default=None, antisymmetric=False):
+        """
+           Arguments:
+             size  --  the number of rows (and columns) of the array
+             index1, index2  --  integer arrays with the atoms of each pair,
+                                 without duplicate pairs
+             values  --  the elements a[index1, index2], an array whose first
+                         axis runs over the pairs
+
+           Optional arguments:
+             default  --  the value of the elements that are not stored
+             antisymmetric  --  when True, a[j, i] = -a[i, j]. Otherwise,
+                                a[j, i] = a[i, j].
+        """
+        self.size = size
+        self.index1 = np.asarray(index1, int)
+        self.index2 = np.asarray(index2, int)
+        self.values = np.asarray(values, float)
+        self.default = default
+        self.antisymmetric = antisymmetric
+        self._sorted = None
+
+    @classmethod
+    def from_graph(cls, graph, factors):
+        """Construct the scaling factors of a PairFF from a molecular graph
+
+           Arguments:
+             graph  --  a Graph object
+             factors  --  a list of scaling factors. Atoms that are k bonds
+                          apart get the scaling factors[k-1], e.g. [0, 0, 0.5]
+                          excludes 1-2 and 1-3 pairs and halves 1-4 pairs.
+
+           All other pairs get a scaling factor of one.
+        """
+        pairs, distances = graph.distances_within(len(factors))
+        values = np.asarray(factors, float)[distances - 1]
+        return cls(graph.num_vertices, pairs[:, 1], pairs[:, 0], values, 1.0)
+
+    def _get_sorted(self):
+        """Return the keys of the stored pairs and the values, sorted by key"""
+        if self._sorted is None:
+            swap = self.index1 < self.index2
+            keys = np.maximum(self.index1, self.index2)*self.size + \
+                np.minimum(self.index1, self.index2)
+            values = self.values.copy()
+            if self.antisymmetric:
+                values[swap] *= -1
+            order = keys.argsort()
+            self._sorted = keys[order], values[order]
+        return self._sorted
+
+    def __getitem__(self, index):
+        index1, index2 = index
+        # The force fields mostly ask for the stored pairs in the stored order.
+        if index1 is self.index1 and index2 is self.index2:
+            return self.values
+        scalar = np.ndim(index1) == 0 and np.ndim(index2) == 0
+        index1, index2 = np.broadcast_arrays(np.atleast_1d(index1), np.atleast_1d(index2))
+        keys = np.maximum(index1, index2)*self.size + np.minimum(index1, index2)
+        sorted_keys, sorted_values = self._get_sorted()
+        positions = sorted_keys.searchsorted(keys)
+        found = positions < len(sorted_keys)
+        found[found] = sorted_keys[positions[found]] == keys[found]
+        result = np.zeros(keys.shape + self.values.shape[1:], float)
+        result[found] = sorted_values[positions[found]]
+        if not found.all():
+            if self.default is None:
+                missing = (~found).nonzero()[0][0]
+                raise KeyError("The pair (%i, %i) is not stored." % (index1[missing], index2[missing]))
+            result[~found] = self.default
+        if self.antisymmetric:
+            result[index1 < index2] *= -1
+        if scalar:
+            return result[0]
+        return result
+
+
+class TypePairArray(object):
+    """A symmetric NxN array whose elements only depend on the atom types
+
+       The element ``a[i, j]`` is ``table[types[i], types[j]]``. This is a
+       compact replacement for a dense matrix with pair parameters, e.g. the
+       strengths of a DispersionFF, in large systems.
+    """
+
+    def __init__(self, types, table):
+        """
+           Arguments:
+             types  --  an integer array with the type of each atom
+             table  --  a symmetric array with the elements for each pair of
+                        atom types
+        """
+        self.types = np.asarray(types, int)
+        self.table = np.asarray(table, float)
+
+    def __getitem__(self, index):
+        index1, index2 = index
+        return self.table[self.types[index1], self.types[index2]]
+
+
 class PairFF(object):
     """Evaluates the energy, gradient and Hessian of pairwise potential
 
@@ -45,24 +188,43 @@ class PairFF(object):
        In the derived classes one must provide functions that iterate over all
        the corresponding function values, derivatives and second derivatives of
        s and v for a given r_ij.
+
+       When the class attribute ``vectorized`` is True, the yield_pair_*
+       methods also accept arrays of atom indexes. They must then yield arrays
+       whose first axis runs over the atom pairs, or values that broadcast to
+       such arrays. Otherwise, the yield_pair_* methods are called for one
+       pair at a time, and they may yield a different number of terms for
+       each pair.
+
+       With a Verlet list, the attributes distances, deltas and directions are
+       PairArray objects that only contain the pairs within the cutoff and
+       with a non-zero scaling factor. The scaling and the parameters of the
+       derived classes may then also be PairArray or TypePairArray objects.
     """
 
-    def __init__(self, scaling, coordinates=None):
+    vectorized = False
+
+    def __init__(self, scaling, coordinates=None, verlet_list=None):
         """Initialize a pair potential object
 
            Arguments:
              scaling  --  symmetric NxN array with pairwise scaling factors.
                           When an element is set to zero, it will be excluded.
 
-           Optional argument:
+           Optional arguments:
              coordinates  --  the initial Cartesian coordinates of the system,
                               which can be updated with the update_coordinates
                               method
+             verlet_list  --  a VerletList object. When given, only the pairs
+                              within its cutoff interact, using the minimum
+                              image convention when it has a unit cell.
         """
+        self.verlet_list = verlet_list
+        self.scaling = scaling
+        if isinstance(self.scaling, np.ndarray):
+            self.scaling.ravel()[::len(self.scaling)+1] = 0
         if coordinates is not None:
             self.update_coordinates(coordinates)
-        self.scaling = scaling
-        self.scaling.ravel()[::len(self.scaling)+1] = 0
 
     def update_coordinates(self, coordinates=None):
         """Update the coordinates (and derived quantities)
@@ -73,20 +235,30 @@ class PairFF(object):
         if coordinates is not None:
             self.coordinates = coordinates
         self.numc = len(self.coordinates)
-        self.distances = np.zeros((self.numc, self.numc), float)
-        self.deltas = np.zeros((self.numc, self.numc, 3), float)
-        self.directions = np.zeros((self.numc, self.numc, 3), float)
-        self.dirouters = np.zeros((self.numc, self.numc, 3, 3), float)
-        for index1, coordinate1 in enumerate(self.coordinates):
-            for index2, coordinate2 in enumerate(self.coordinates):
-                delta = coordinate1 - coordinate2
-                self.deltas[index1, index2] = delta
-                distance = np.linalg.norm(delta)
-                self.distances[index1, index2] = distance
-                if index1 != index2:
-                    tmp = delta/distance
-                    self.directions[index1, index2] = tmp
-                    self.dirouters[index1, index2] = np.outer(tmp, tmp)
+        if self.verlet_list is not None:
+            self._update_pairs()
+            return
+        self.deltas = self.coordinates[:, np.newaxis] - self.coordinates
+        self.distances = np.sqrt((self.deltas**2).sum(axis=2))
+        # avoid a division by zero on the diagonal, where the deltas are zero
+        denominators = self.distances.copy()
+        denominators.ravel()[::self.numc+1] = 1
+        self.directions = self.deltas/denominators[:, :, np.newaxis]
+
+    def _update_pairs(self):
+        """Update the interacting pairs and their geometry with the Verlet list"""
+        pairs, deltas, distances = self.verlet_list.update(self.coordinates)
+        mask = self.scaling[pairs[:, 0], pairs[:, 1]] > 0
+        self.pairs = pairs[mask, 0], pairs[mask, 1]
+        # The Verlet list returns relative vectors from the first to the
+        # second atom, i.e. the opposite of self.deltas.
+        deltas = -deltas[mask]
+        distances = distances[mask]
+        self.deltas = PairArray(self.numc, self.pairs[0], self.pairs[1], deltas, antisymmetric=True)
+        self.distances = PairArray(self.numc, self.pairs[0], self.pairs[1], distances)
+        self.directions = PairArray(
+            self.numc, self.pairs[0], self.pairs[1],
+            deltas/distances[:, np.newaxis], antisymmetric=True)
 
     def yield_pair_energies(self, index1, index2):
         """Yields pairs ((s(r_ij), v(bar{r}_ij))"""
@@ -100,75 +272,158 @@ class PairFF(object):
         """Yields pairs ((s''(r_ij), grad_i (x) grad_i v(bar{r}_ij))"""
         raise NotImplementedError
 
+    def _get_pair_terms(self, index1, index2, deriv):
+        """Collect the terms of the yield_pair_* methods for arrays of pairs
+
+           Arguments:
+             index1, index2  --  integer arrays with the atoms of each pair
+             deriv  --  0, 1 or 2: the highest order of the derivatives
+
+           Returns a list with for each term a tuple with (s, v) pairs of
+           arrays, one for each order of the derivatives.
+        """
+        methods = [
+            self.yield_pair_energies, self.yield_pair_gradients,
+            self.yield_pair_hessians
+        ][:deriv+1]
+        if self.vectorized:
+            return list(zip(*[method(index1, index2) for method in methods]))
+        rows = [
+            list(zip(*[method(i1, i2) for method in methods]))
+            for i1, i2 in zip(index1, index2)
+        ]
+        # Pairs may yield different numbers of terms. The k-th term of the
+        # pairs that have one is stored at their position in the arrays. The
+        # other positions remain zero and therefore do not contribute.
+        npair = len(rows)
+        nterm = max([len(row) for row in rows] + [0])
+        result = []
+        for k in range(nterm):
+            selected = [i for i, row in enumerate(rows) if len(row) > k]
+            term = [rows[i][k] for i in selected]
+            orders = []
+            for order in range(deriv+1):
+                s_values = np.array([row[order][0] for row in term], float)
+                v_values = np.array([row[order][1] for row in term], float)
+                s = np.zeros(npair, float)
+                v = np.zeros((npair,) + v_values.shape[1:], float)
+                s[selected] = s_values
+                v[selected] = v_values
+                orders.append((s, v))
+            result.append(tuple(orders))
+        return result
+
+    def _compute_pairs(self, index1, index2, deriv):
+        """Compute the scaled energy and its derivatives for arrays of pairs
+
+           Arguments:
+             index1, index2  --  integer arrays with the atoms of each pair
+             deriv  --  0, 1 or 2: the highest order of the derivatives
+
+           Returns a list with the energies, the gradients towards the first
+           atom and the Hessian blocks of the first atom of each pair, with
+           shapes (npair,), (npair, 3) and (npair, 3, 3), respectively. The
+           list only contains the first deriv+1 items.
+        """
+        npair = len(index1)
+        scaling = self.scaling[index1, index2]
+        energies = np.zeros(npair, float)
+        result = [energies]
+        if npair == 0:
+            return [energies, np.zeros((0, 3), float), np.zeros((0, 3, 3), float)][:deriv+1]
+        if deriv > 0:
+            directions = self.directions[index1, index2]
+            gradients = np.zeros((npair, 3), float)
+            result.append(gradients)
+        if deriv > 1:
+            d_1 = 1/self.distances[index1, index2]
+            dirouters = directions[:, :, np.newaxis]*directions[:, np.newaxis, :]
+            hessians = np.zeros((npair, 3, 3), float)
+            result.append(hessians)
+        for orders in self._get_pair_terms(index1, index2, deriv):
+            se, ve = [np.asarray(x, float) for x in orders[0]]
+            energies += se*ve
+            if deriv > 0:
+                sg, vg = [np.asarray(x, float) for x in orders[1]]
+                gradients += (sg*ve)[..., np.newaxis]*directions
+                gradients += se[..., np.newaxis]*vg
+            if deriv > 1:
+                sh, vh = [np.asarray(x, float) for x in orders[2]]
+                tmp = sg*ve*d_1
+                hessians += (sh*ve - tmp)[:, np.newaxis, np.newaxis]*dirouters
+                hessians += tmp[:, np.newaxis, np.newaxis]*np.identity(3, float)
+                hessians += sg[..., np.newaxis, np.newaxis]*(
+                    directions[:, :, np.newaxis]*vg[..., np.newaxis, :] +
+                    vg[..., :, np.newaxis]*directions[:, np.newaxis, :]
+                )
+                hessians += se[..., np.newaxis, np.newaxis]*vh
+        for array in result:
+            array *= scaling.reshape((npair,) + (1,)*(array.ndim - 1))
+        return result
+
+    def _get_pairs(self):
+        """Return the atom indexes of all pairs with a non-zero scaling
+
+           Each pair only occurs once, with the largest index first.
+        """
+        if self.verlet_list is not None:
+            return self.pairs
+        return np.nonzero(np.tril(self.scaling > 0, -1))
+
+    def _get_partners(self, index1):
+        """Return arrays with all pairs of one atom with a non-zero scaling"""
+        if self.verlet_list is not None:
+            first, second = self.pairs
+            index2 = np.concatenate([second[first == index1], first[second == index1]])
+        else:
+            index2 = (self.scaling[index1] > 0).nonzero()[0]
+        return np.zeros(len(index2), int) + index1, index2
+
     def energy(self):
         """Compute the energy of the system"""
-        result = 0.0
-        for index1 in range(self.numc):
-            for index2 in range(index1):
-                if self.scaling[index1, index2] > 0:
-                    for se, ve in self.yield_pair_energies(index1, index2):
-                        result += se*ve*self.scaling[index1, index2]
-        return result
+        index1, index2 = self._get_pairs()
+        return self._compute_pairs(index1, index2, 0)[0].sum()
 
     def gradient_component(self, index1):
         """Compute the gradient of the energy for one atom"""
-        result = np.zeros(3, float)
-        for index2 in range(self.numc):
-            if self.scaling[index1, index2] > 0:
-                for (se, ve), (sg, vg) in zip(self.yield_pair_energies(index1, index2), self.yield_pair_gradients(index1, index2)):
-                    result += (sg*self.directions[index1, index2]*ve + se*vg)*self.scaling[index1, index2]
-        return result
+        index1, index2 = self._get_partners(index1)
+        return self._compute_pairs(index1, index2, 1)[1].sum(axis=0)
 
     def gradient(self):
         """Compute the gradient of the energy for all atoms"""
-        result = np.zeros((self.numc, 3), float)
-        for index1 in range(self.numc):
-            result[index1] = self.gradient_component(index1)
-        return result
+        index1, index2 = self._get_pairs()
+        gradients = self._compute_pairs(index1, index2, 1)[1]
+        return _scatter(index1, gradients, self.numc) - _scatter(index2, gradients, self.numc)
 
     def hessian_component(self, index1, index2):
         """Compute the hessian of the energy for one atom pair"""
-        result = np.zeros((3, 3), float)
+        partners1, partners2 = self._get_partners(index1)
         if index1 == index2:
-            for index3 in range(self.numc):
-                if self.scaling[index1, index3] > 0:
-                    d_1 = 1/self.distances[index1, index3]
-                    for (se, ve), (sg, vg), (sh, vh) in zip(
-                        self.yield_pair_energies(index1, index3),
-                        self.yield_pair_gradients(index1, index3),
-                        self.yield_pair_hessians(index1, index3)
-                    ):
-                        result += (
-                            +sh*self.dirouters[index1, index3]*ve
-                            +sg*(np.identity(3, float) - self.dirouters[index1, index3])*ve*d_1
-                            +sg*np.outer(self.directions[index1, index3],  vg)
-                            +sg*np.outer(vg, self.directions[index1, index3])
-                            +se*vh
-                        )*self.scaling[index1, index3]
-        elif self.scaling[index1, index2] > 0:
-            d_1 = 1/self.distances[index1, index2]
-            for (se, ve), (sg, vg), (sh, vh) in zip(
-                self.yield_pair_energies(index1, index2),
-                self.yield_pair_gradients(index1, index2),
-                self.yield_pair_hessians(index1, index2)
-            ):
-                result -= (
-                    +sh*self.dirouters[index1, index2]*ve
-                    +sg*(np.identity(3, float) - self.dirouters[index1, index2])*ve*d_1
-                    +sg*np.outer(self.directions[index1, index2],  vg)
-                    +sg*np.outer(vg, self.directions[index1, index2])
-                    +se*vh
-                )*self.scaling[index1, index2]
-        return result
+            return self._compute_pairs(partners1, partners2, 2)[2].sum(axis=0)
+        mask = partners2 == index2
+        return -self._compute_pairs(partners1[mask], partners2[mask], 2)[2].sum(axis=0)
 
     def hessian(self):
         """Compute the hessian of the energy"""
+        index1, index2 = self._get_pairs()
+        hessians = self._compute_pairs(index1, index2, 2)[2]
         result = np.zeros((self.numc, 3, self.numc, 3), float)
-        for index1 in range(self.numc):
-            for index2 in range(self.numc):
-                result[index1, :, index2, :] = self.hessian_component(index1, index2)
+        atoms = np.arange(self.numc)
+        result[atoms, :, atoms, :] = _scatter(index1, hessians, self.numc) + \
+            _scatter(index2, hessians, self.numc)
+        result[index1, :, index2, :] = -hessians
+        result[index2, :, index1, :] = -hessians.transpose(0, 2, 1)
         return result
 
+    def hessian_sparse(self):
+        """Compute the hessian of the energy as a 3N x 3N CSRMatrix"""
+        index1, index2 = self._get_pairs()
+        hessians = self._compute_pairs(index1, index2, 2)[2]
+        rows = np.concatenate([index1, index2, index1, index2])
+        cols = np.concatenate([index1, index2, index2, index1])
+        blocks = np.concatenate([hessians, hessians, -hessians, -hessians.transpose(0, 2, 1)])
+        return CSRMatrix.from_blocks((self.numc, self.numc), rows, cols, blocks)
+
     def gradient_flat(self):
         """Return the gradient a 3N array"""
         return self.gradient().ravel()
@@ -179,9 +434,15 @@ class PairFF(object):
 
 
 class CoulombFF(PairFF):
-    """Computes the electrostatic interactions using charges and point dipoles"""
+    """Computes the electrostatic interactions using charges and point dipoles
+
+       The methods that compute the electrostatic potential and field at the
+       atoms only work without a Verlet list.
+    """
 
-    def __init__(self, scaling, charges=None, dipoles=None, coordinates=None):
+    vectorized = True
+
+    def __init__(self, scaling, charges=None, dipoles=None, coordinates=None, verlet_list=None):
         """Initialize a CoulombFF object
 
            Arguments:
@@ -194,8 +455,9 @@ class CoulombFF(PairFF):
              coordinates  --  the initial Cartesian coordinates of the system,
                               which can be updated with the update_coordinates
                               method
+             verlet_list  --  a VerletList object, see PairFF
         """
-        PairFF.__init__(self, scaling, coordinates)
+        PairFF.__init__(self, scaling, coordinates, verlet_list)
         self.charges = charges
         self.dipoles = dipoles
 
@@ -212,11 +474,11 @@ class CoulombFF(PairFF):
             delta = self.deltas[index1, index2]
             p1 = self.dipoles[index1]
             p2 = self.dipoles[index2]
-            yield d_3*np.dot(p1, p2), 1
-            yield -3*d_5, np.dot(p1, delta)*np.dot(delta, p2)
+            yield d_3*(p1*p2).sum(axis=-1), 1
+            yield -3*d_5, (p1*delta).sum(axis=-1)*(delta*p2).sum(axis=-1)
             if self.charges is not None:
-                yield c1*d_3, np.dot(p2, delta)
-                yield c2*d_3, np.dot(p1, -delta)
+                yield c1*d_3, (p2*delta).sum(axis=-1)
+                yield c2*d_3, -(p1*delta).sum(axis=-1)
 
     def yield_pair_gradients(self, index1, index2):
         """Yields pairs ((s'(r_ij), grad_i v(bar{r}_ij))"""
@@ -231,8 +493,11 @@ class CoulombFF(PairFF):
             delta = self.deltas[index1, index2]
             p1 = self.dipoles[index1]
             p2 = self.dipoles[index2]
-            yield -3*d_4*np.dot(p1, p2), np.zeros(3)
-            yield 15*d_6, p1*np.dot(p2, delta) + p2*np.dot(p1, delta)
+            yield -3*d_4*(p1*p2).sum(axis=-1), np.zeros(3)
+            yield 15*d_6, (
+                p1*(p2*delta).sum(axis=-1)[..., np.newaxis] +
+                p2*(p1*delta).sum(axis=-1)[..., np.newaxis]
+            )
             if self.charges is not None:
                 yield -3*c1*d_4, p2
                 yield -3*c2*d_4, -p1
@@ -250,8 +515,11 @@ class CoulombFF(PairFF):
             d_7 = d_1**7
             p1 = self.dipoles[index1]
             p2 = self.dipoles[index2]
-            yield 12*d_5*np.dot(p1, p2), np.zeros((3, 3))
-            yield -90*d_7, np.outer(p1, p2) + np.outer(p2, p1)
+            yield 12*d_5*(p1*p2).sum(axis=-1), np.zeros((3, 3))
+            yield -90*d_7, (
+                p1[..., :, np.newaxis]*p2[..., np.newaxis, :] +
+                p2[..., :, np.newaxis]*p1[..., np.newaxis, :]
+            )
             if self.charges is not None:
                 yield 12*c1*d_5, np.zeros((3, 3))
                 yield 12*c2*d_5, np.zeros((3, 3))
@@ -324,7 +592,9 @@ class CoulombFF(PairFF):
 class DispersionFF(PairFF):
     """Computes the London dispersion interaction"""
 
-    def __init__(self, scaling, strengths, coordinates=None):
+    vectorized = True
+
+    def __init__(self, scaling, strengths, coordinates=None, verlet_list=None):
         """Initialize a DispersionFF object
 
            Arguments:
@@ -337,8 +607,9 @@ class DispersionFF(PairFF):
              coordinates  --  the initial Cartesian coordinates of the system,
                               which can be updated with the update_coordinates
                               method
+             verlet_list  --  a VerletList object, see PairFF
         """
-        PairFF.__init__(self, scaling, coordinates)
+        PairFF.__init__(self, scaling, coordinates, verlet_list)
         self.strengths = strengths
 
     def yield_pair_energies(self, index1, index2):
@@ -363,7 +634,9 @@ class DispersionFF(PairFF):
 class PauliFF(PairFF):
     """Computes the Pauli repulsion interaction"""
 
-    def __init__(self, scaling, strengths, coordinates=None):
+    vectorized = True
+
+    def __init__(self, scaling, strengths, coordinates=None, verlet_list=None):
         """Initialize a PauliFF
 
            Arguments:
@@ -376,8 +649,9 @@ class PauliFF(PairFF):
              coordinates  --  the initial Cartesian coordinates of the system,
                               which can be updated with the update_coordinates
                               method
+             verlet_list  --  a VerletList object, see PairFF
         """
-        PairFF.__init__(self, scaling, coordinates)
+        PairFF.__init__(self, scaling, coordinates, verlet_list)
         self.strengths = strengths
 
     def yield_pair_energies(self, index1, index2):
@@ -402,7 +676,9 @@ class PauliFF(PairFF):
 class ExpRepFF(PairFF):
     """Computes the exponential repulsion interaction"""
 
-    def __init__(self, scaling, As, Bs, coordinates=None):
+    vectorized = True
+
+    def __init__(self, scaling, As, Bs, coordinates=None, verlet_list=None):
         """Initialize a ExpRepFF
 
            Arguments:
@@ -417,8 +693,9 @@ class ExpRepFF(PairFF):
              coordinates  --  the initial Cartesian coordinates of the system,
                               which can be updated with the update_coordinates
                               method
+             verlet_list  --  a VerletList object, see PairFF
         """
-        PairFF.__init__(self, scaling, coordinates)
+        PairFF.__init__(self, scaling, coordinates, verlet_list)
         self.As = As
         self.Bs = Bs
 
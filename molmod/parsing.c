@@ -0,0 +1,248 @@
+// MolMod is a collection of molecular modelling tools for python.
+// Copyright (C) 2007 - 2019 Toon Verstraelen <Toon.Verstraelen@UGent.be>, Center
+// for Molecular Modeling (CMM), Ghent University, Ghent, Belgium; all rights
+// reserved unless otherwise stated.
+//
+// This file is part of MolMod.
+//
+// MolMod is free software; you can redistribute it and/or
+// modify it under the terms of the GNU General Public License
+// as published by the Free Software Foundation; either version 3
+// of the License, or (at your option) any later version.
+//
+// MolMod is distributed in the hope that it will be useful,
+// but WITHOUT ANY WARRANTY; without even the implied warranty of
+// MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+// GNU General Public License for more details.
+//
+// You should have received a copy of the GNU General Public License
+// along with this program; if not, see <http://www.gnu.org/licenses/>
+//
+// --
+
+
+
+#include <stdlib.h>
+#include <string.h>
+#include "parsing.h"
+
+
+static int parsing_is_space(char c) {
+  return (c == ' ') || (c == '\t') || (c == '\r') || (c == '\v') || (c == '\f');
+}
+
+
+static const double parsing_powers[] = {
+  1e0, 1e1, 1e2, 1e3, 1e4, 1e5, 1e6, 1e7, 1e8, 1e9, 1e10, 1e11, 1e12, 1e13, 1e14,
+  1e15, 1e16, 1e17, 1e18, 1e19, 1e20, 1e21, 1e22
+};
+
+
+static int parsing_double(const char* begin, const char* end, double* out) {
+  // Convert the word from begin to end into a double. Plain decimal numbers
+  // whose significant digits fit exactly in a double (at most 2^53) are
+  // converted with a single exact multiplication or division, which gives
+  // the correctly rounded result.
+  // Everything else is left to strtod. The return value is zero when the
+  // word is not a number.
+  const char* pos = begin;
+  unsigned long long mantissa = 0;
+  int ndigit = 0;
+  int any_digit = 0;
+  int exponent = 0;
+  int exponent_sign = 1;
+  int explicit_exponent = 0;
+  int negative = 0;
+  char* conv_end;
+
+  if ((pos < end) && ((*pos == '-') || (*pos == '+'))) {
+    negative = (*pos == '-');
+    pos++;
+  }
+  while ((pos < end) && (*pos == '0')) {
+    any_digit = 1;
+    pos++;
+  }
+  while ((pos < end) && (*pos >= '0') && (*pos <= '9')) {
+    any_digit = 1;
+    mantissa = 10*mantissa + (*pos - '0');
+    ndigit++;
+    pos++;
+  }
+  if ((pos < end) && (*pos == '.')) {
+    pos++;
+    if (mantissa == 0) {
+      // Leading zeros of the fraction are not significant.
+      while ((pos < end) && (*pos == '0')) {
+        any_digit = 1;
+        exponent--;
+        pos++;
+      }
+    }
+    while ((pos < end) && (*pos >= '0') && (*pos <= '9')) {
+      any_digit = 1;
+      mantissa = 10*mantissa + (*pos - '0');
+      ndigit++;
+      exponent--;
+      pos++;
+    }
+  }
+  if ((pos < end) && ((*pos == 'e') || (*pos == 'E'))) {
+    pos++;
+    if ((pos < end) && ((*pos == '-') || (*pos == '+'))) {
+      if (*pos == '-') exponent_sign = -1;
+      pos++;
+    }
+    while ((pos < end) && (*pos >= '0') && (*pos <= '9') && (explicit_exponent < 1000)) {
+      explicit_exponent = 10*explicit_exponent + (*pos - '0');
+      pos++;
+    }
+    exponent += exponent_sign*explicit_exponent;
+  }
+  if (any_digit && (pos == end) && (ndigit <= 19) && (mantissa <= (1ULL << 53)) && (exponent >= -22) && (exponent <= 22) &&
+      (*(pos - 1) >= '0') && (*(pos - 1) <= '9')) {
+    *out = (double)mantissa;
+    if (exponent < 0) {
+      *out /= parsing_powers[-exponent];
+    } else {
+      *out *= parsing_powers[exponent];
+    }
+    if (negative) *out = -*out;
+    return 1;
+  }
+  // Anything else, e.g. long mantissas, large exponents or special values.
+  *out = strtod(begin, &conv_end);
+  return conv_end == end;
+}
+
+
+static const char* parsing_skip_lines(const char* pos, const char* end, size_t nline) {
+  // Return the position after nline newlines, or NULL if the data ends
+  // before that.
+  size_t iline;
+  for (iline=0; iline<nline; iline++) {
+    pos = memchr(pos, '\n', end - pos);
+    if (pos == NULL) return NULL;
+    pos++;
+  }
+  return pos;
+}
+
+
+long parsing_table(const char* data, size_t size, size_t nrow, size_t nskip, size_t nsel,
+                   long* columns, double* out, long* first_words) {
+  // Parse nrow lines of whitespace-separated words, separated by nskip
+  // other lines. The words in the (increasing) column indexes are
+  // converted to doubles and stored in out, which has nrow*nsel elements.
+  // Trailing words are ignored. When first_words is not NULL, the offsets
+  // of the beginning and the end of the first word of each row are stored
+  // in it (nrow*2 elements). The number of bytes consumed is returned, or
+  // -1 when a line has too few words, when a selected word is not a number
+  // or when the data ends before the newline of the last line.
+  const char* pos = data;
+  const char* end = data + size;
+  const char* word_end;
+  size_t irow, isel;
+  long icol;
+
+  for (irow=0; irow<nrow; irow++) {
+    if (irow > 0) {
+      pos = parsing_skip_lines(pos, end, nskip);
+      if (pos == NULL) return -1;
+    }
+    icol = 0;
+    isel = 0;
+    while ((isel < nsel) || ((icol == 0) && (first_words != NULL))) {
+      // Go to the beginning of the next word.
+      while ((pos < end) && parsing_is_space(*pos)) pos++;
+      if ((pos == end) || (*pos == '\n')) return -1;
+      // Find the end of the word.
+      word_end = pos;
+      while ((word_end < end) && (*word_end != '\n') && !parsing_is_space(*word_end)) word_end++;
+      if ((icol == 0) && (first_words != NULL)) {
+        first_words[2*irow] = pos - data;
+        first_words[2*irow+1] = word_end - data;
+      }
+      if ((isel < nsel) && (icol == columns[isel])) {
+        // The word is followed by a whitespace or a newline, unless it is
+        // at the end of the data. In that case strtod could read past the
+        // end of the data.
+        if (word_end == end) return -1;
+        if (!parsing_double(pos, word_end, out)) return -1;
+        out++;
+        isel++;
+      }
+      pos = word_end;
+      icol++;
+    }
+    // Skip the remainder of the line.
+    pos = parsing_skip_lines(pos, end, 1);
+    if (pos == NULL) return -1;
+  }
+  return pos - data;
+}
+
+
+long parsing_fixed(const char* data, size_t size, size_t nrecord, size_t nline, size_t nskip,
+                   size_t nfield, size_t width, double* out) {
+  // Parse nrecord groups of nline lines, separated by nskip other lines.
+  // Each line consists of nfield fields of width characters, except for
+  // the last field, which runs to the end of the line. All fields are
+  // converted to doubles and stored in out, which has
+  // nrecord*nline*nfield elements. The number of bytes consumed is
+  // returned, or -1 when a field is not a number or when the data ends
+  // before the newline of the last line.
+  const char* pos = data;
+  const char* end = data + size;
+  const char* line_end;
+  const char* field_begin;
+  const char* field_end;
+  size_t irecord, iline, ifield;
+
+  for (irecord=0; irecord<nrecord; irecord++) {
+    if (irecord > 0) {
+      pos = parsing_skip_lines(pos, end, nskip);
+      if (pos == NULL) return -1;
+    }
+    for (iline=0; iline<nline; iline++) {
+      line_end = memchr(pos, '\n', end - pos);
+      if (line_end == NULL) return -1;
+      for (ifield=0; ifield<nfield; ifield++) {
+        field_begin = pos + ifield*width;
+        field_end = (ifield + 1 == nfield) ? line_end : field_begin + width;
+        if (field_end > line_end) return -1;
+        // Strip whitespace on both sides.
+        while ((field_begin < field_end) && parsing_is_space(*field_begin)) field_begin++;
+        while ((field_end > field_begin) && parsing_is_space(*(field_end - 1))) field_end--;
+        if (field_begin == field_end) return -1;
+        if (!parsing_double(field_begin, field_end, out)) return -1;
+        out++;
+      }
+      pos = line_end + 1;
+    }
+  }
+  return pos - data;
+}
+
+
+long parsing_numbers(const char* data, size_t size, size_t count, double* out) {
+  // Convert the first count words to doubles, irrespective of the line
+  // breaks, and store them in out. The number of bytes consumed is
+  // returned, or -1 when a word is not a number or when there are not
+  // enough words. The last word must be followed by a whitespace.
+  const char* pos = data;
+  const char* end = data + size;
+  const char* word_end;
+  size_t icount;
+
+  for (icount=0; icount<count; icount++) {
+    while ((pos < end) && (parsing_is_space(*pos) || (*pos == '\n'))) pos++;
+    word_end = pos;
+    while ((word_end < end) && (*word_end != '\n') && !parsing_is_space(*word_end)) word_end++;
+    if ((pos == word_end) || (word_end == end)) return -1;
+    if (!parsing_double(pos, word_end, out)) return -1;
+    out++;
+    pos = word_end;
+  }
+  return pos - data;
+}
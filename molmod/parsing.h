@@ -0,0 +1,38 @@
+// MolMod is a collection of molecular modelling tools for python.
+// Copyright (C) 2007 - 2019 Toon Verstraelen <Toon.Verstraelen@UGent.be>, Center
+// for Molecular Modeling (CMM), Ghent University, Ghent, Belgium; all rights
+// reserved unless otherwise stated.
+//
+// This file is part of MolMod.
+//
+// MolMod is free software; you can redistribute it and/or
+// modify it under the terms of the GNU General Public License
+// as published by the Free Software Foundation; either version 3
+// of the License, or (at your option) any later version.
+//
+// MolMod is distributed in the hope that it will be useful,
+// but WITHOUT ANY WARRANTY; without even the implied warranty of
+// MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+// GNU General Public License for more details.
+//
+// You should have received a copy of the GNU General Public License
+// along with this program; if not, see <http://www.gnu.org/licenses/>
+//
+// --
+
+
+
+#ifndef MOLMOD_PARSING_H_
+#define MOLMOD_PARSING_H_
+
+
+#include <stddef.h>
+
+long parsing_table(const char* data, size_t size, size_t nrow, size_t nskip, size_t nsel,
+                   long* columns, double* out, long* first_words);
+long parsing_fixed(const char* data, size_t size, size_t nrecord, size_t nline, size_t nskip,
+                   size_t nfield, size_t width, double* out);
+long parsing_numbers(const char* data, size_t size, size_t count, double* out);
+
+
+#endif  // MOLMOD_PARSING_H_
@@ -341,12 +341,11 @@ def check_nonbond(molecule, thresholds):
     """
 
     # check that no atoms overlap
-    for atom1 in range(molecule.graph.num_vertices):
-        for atom2 in range(atom1):
-            if molecule.graph.distances[atom1, atom2] > 2:
-                distance = np.linalg.norm(molecule.coordinates[atom1] - molecule.coordinates[atom2])
-                if distance < thresholds[frozenset([molecule.numbers[atom1], molecule.numbers[atom2]])]:
-                    return False
+    pairs, graph_distances = molecule.graph.distances_within()
+    for atom1, atom2 in pairs[graph_distances > 2]:
+        distance = np.linalg.norm(molecule.coordinates[atom1] - molecule.coordinates[atom2])
+        if distance < thresholds[frozenset([molecule.numbers[atom1], molecule.numbers[atom2]])]:
+            return False
     return True
 
 
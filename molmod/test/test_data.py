@@ -26,8 +26,11 @@ from __future__ import division
 
 import unittest
 
+import numpy as np
+
 from molmod import *
 from molmod.periodic import periodic
+from molmod.bonds import bonds
 from molmod.isotopes import ame2003, nubtab03
 
 
@@ -61,3 +64,15 @@ class DataTestCase(unittest.TestCase):
 
     def test_nubtab03(self):
         self.assertAlmostEqual(nubtab03.abundances[1][1], 99.9885)
+
+    def test_bonded_array(self):
+        numbers1 = np.random.randint(0, 100, 1000)
+        numbers2 = np.random.randint(0, 100, 1000)
+        distances = np.random.uniform(0.5, 6.0, 1000)
+        result = bonds.bonded_array(numbers1, numbers2, distances)
+        for n1, n2, distance, bond_type in zip(numbers1, numbers2, distances, result):
+            expected = bonds.bonded(n1, n2, distance)
+            if expected is None:
+                self.assertEqual(bond_type, 0)
+            else:
+                self.assertEqual(bond_type, expected)
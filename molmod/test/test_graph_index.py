@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# MolMod is a collection of molecular modelling tools for python.
+# Copyright (C) 2007 - 2019 Toon Verstraelen <Toon.Verstraelen@UGent.be>, Center
+# for Molecular Modeling (CMM), Ghent University, Ghent, Belgium; all rights
+# reserved unless otherwise stated.
+#
+# This file is part of MolMod.
+#
+# MolMod is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# MolMod is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+
+
+import os
+import unittest
+
+import numpy as np
+import pkg_resources
+
+from molmod import *
+from molmod.graph_index import GraphIndex
+
+from molmod.test.common import tmpdir
+
+
+__all__ = ["GraphIndexTestCase"]
+
+
+class GraphIndexTestCase(unittest.TestCase):
+    def iter_graphs(self):
+        fns = [
+          "water.xyz", "cyclopentane.xyz", "ethene.xyz", "tea.xyz",
+          "butane.xyz", "octane.xyz", "SID_55127927.sdf", "SID_56274343.sdf",
+          "SID_40363570.sdf", "SID_40363571.sdf",
+        ]
+        for fn in fns:
+            molecule = Molecule.from_file(pkg_resources.resource_filename("molmod", "data/test/" + fn))
+            if molecule.graph is None:
+                molecule.set_default_graph()
+            yield molecule.graph
+
+    def test_add_contains(self):
+        index = GraphIndex()
+        graphs = list(self.iter_graphs())
+        for graph in graphs:
+            self.assertFalse(index.contains(graph))
+            row, added = index.add(graph)
+            self.assert_(added)
+            self.assert_(index.contains(graph))
+            self.assertNotEqual(index[row].full_match(graph), None)
+        self.assertEqual(len(index), len(graphs))
+        # permuted graphs are duplicates
+        for row, graph in enumerate(graphs):
+            permutation = np.random.permutation(graph.num_vertices)
+            other = graph.get_subgraph(permutation, normalize=True)
+            other = MolecularGraph(other.edges, graph.numbers[permutation], graph.orders[other._old_edge_indexes])
+            self.assertEqual(index.add(other), (row+1, False))
+            isomorphs = index.find_isomorphs(other)
+            self.assertEqual(len(isomorphs), 1)
+            self.assertEqual(isomorphs[0][0], row+1)
+        self.assertEqual(len(index), len(graphs))
+
+    def test_fingerprint_collisions(self):
+        # These two graphs have the same fingerprint, but are not isomorphic.
+        index = GraphIndex()
+        graphs = list(self.iter_graphs())[-2:]
+        self.assertEqual(graphs[0].fingerprint.tobytes(), graphs[1].fingerprint.tobytes())
+        result = index.add_many(graphs + graphs)
+        self.assertEqual(result, [(1, True), (2, True), (1, False), (2, False)])
+        self.assertEqual(index.contains_many(graphs), [True, True])
+
+    def test_no_edges(self):
+        index = GraphIndex()
+        graph = MolecularGraph([], np.array([18]), num_vertices=1)
+        self.assertEqual(index.add(graph), (1, True))
+        self.assert_(index.contains(graph))
+        self.assertEqual(index[1].numbers.tolist(), [18])
+
+    def test_file(self):
+        graphs = list(self.iter_graphs())
+        with tmpdir(__name__, 'test_file') as dn:
+            fn = os.path.join(dn, 'index.db')
+            with GraphIndex(fn) as index:
+                index.add_many(graphs[:5])
+            with GraphIndex(fn) as index:
+                self.assertEqual(len(index), 5)
+                self.assertEqual(index.contains_many(graphs), [True]*5 + [False]*5)
@@ -297,6 +297,35 @@ class GraphTestCase(unittest.TestCase):
         self.assertEqual(expecting.shape,graph.distances.shape)
         self.assert_((expecting==graph.distances).all())
 
+    def test_distances_within(self):
+        for case in self.iter_cases():
+            g = case.graph
+            # An independent reference computed with the Floyd-Warshall
+            # algorithm. (g.distances is derived from distances_within.)
+            reference = np.zeros((g.num_vertices, g.num_vertices), float) + np.inf
+            reference.ravel()[::g.num_vertices+1] = 0
+            for i, j in g.edges:
+                reference[i, j] = 1
+                reference[j, i] = 1
+            for k in range(g.num_vertices):
+                reference = np.minimum(reference, reference[:, k, None] + reference[k])
+            self.assert_((g.distances == np.where(np.isinf(reference), 0, reference)).all())
+            for max_depth in None, 0, 1, 3:
+                pairs, distances = g.distances_within(max_depth)
+                mask = np.triu(~np.isinf(reference), 1)
+                if max_depth is not None:
+                    mask &= reference <= max_depth
+                i, j = mask.nonzero()
+                self.assert_((pairs[:,0] == i).all())
+                self.assert_((pairs[:,1] == j).all())
+                self.assert_((distances == reference[i,j]).all())
+
+    def test_max_distance(self):
+        for case in self.iter_cases():
+            g = case.graph
+            self.assertEqual(g.max_distance, g.distances.max())
+            self.assert_((g.eccentricities == g.distances.max(axis=1)).all())
+
     def test_neighbors(self):
         for case in self.iter_cases():
             g = case.graph
@@ -307,6 +336,29 @@ class GraphTestCase(unittest.TestCase):
                     self.assert_(frozenset([central,neighbor]) in g.edges)
             self.assertEqual(counter, len(g.edges)*2)
 
+    def test_csr(self):
+        for case in self.iter_cases():
+            g = case.graph
+            self.assertEqual(g.indptr[-1], len(g.indices))
+            for vertex in range(g.num_vertices):
+                neighbors = g.get_neighbors(vertex)
+                self.assert_((np.diff(neighbors) > 0).all())
+                self.assertEqual(frozenset(neighbors.tolist()), g.neighbors[vertex])
+
+    def test_get_edge_index(self):
+        for case in self.iter_cases():
+            g = case.graph
+            for index, (i, j) in enumerate(g.edge_array):
+                self.assertEqual(g.get_edge_index(i, j), index)
+                self.assertEqual(g.get_edge_index(j, i), index)
+                self.assertEqual(g.edge_index[frozenset([i, j])], index)
+            self.assert_((g.get_edge_indexes(g.edge_array[:, ::-1]) == np.arange(g.num_edges)).all())
+            non_edges = (g.distances > 1).nonzero()
+            for i, j in list(zip(*non_edges))[:10]:
+                self.assertEqual(g.get_edge_index(i, j), None)
+            pairs = np.array(non_edges).T
+            self.assert_((g.get_edge_indexes(pairs) == -1).all())
+
     def test_central_vertices(self):
         for case in self.iter_cases():
             g = case.graph
@@ -332,6 +384,33 @@ class GraphTestCase(unittest.TestCase):
             for i in range(g0.num_vertices):
                 self.assert_((g0.vertex_fingerprints[i]==g1.vertex_fingerprints[permutation[i]]).all())
 
+    def test_fingerprints_components(self):
+        for case in self.iter_cases():
+            g0 = case.graph
+            # a disjoint copy of the graph and an isolated vertex
+            n = g0.num_vertices
+            g1 = Graph(tuple(g0.edges) + tuple((i+n, j+n) for i, j in g0.edges), 2*n+1)
+            self.assert_((g1.vertex_fingerprints[:n] == g0.vertex_fingerprints).all())
+            self.assert_((g1.vertex_fingerprints[n:2*n] == g0.vertex_fingerprints).all())
+            self.assertNotEqual(g1.full_match(g1), None)
+
+    def test_fingerprints_sha1(self):
+        for case in self.iter_cases():
+            g0 = case.graph
+            permutation = np.random.permutation(g0.num_vertices)
+            new_edges = tuple((permutation[i], permutation[j]) for i,j in g0.edges)
+            g1 = Graph(new_edges, g0.num_vertices)
+            fps0 = g0.get_vertex_fingerprints([""]*g0.num_vertices, [""]*g0.num_edges, method="sha1")
+            fps1 = g1.get_vertex_fingerprints([""]*g1.num_vertices, [""]*g1.num_edges, method="sha1")
+            self.assertEqual(fps0.shape, (g0.num_vertices, 20))
+            self.assert_((fps0 == fps1[permutation]).all())
+            # the partition into equivalent vertices is the same for both methods
+            for i in range(g0.num_vertices):
+                same_wl = (g0.vertex_fingerprints == g0.vertex_fingerprints[i]).all(axis=1)
+                same_sha1 = (fps0 == fps0[i]).all(axis=1)
+                self.assert_((same_wl == same_sha1).all())
+        self.assertRaises(ValueError, g0.get_vertex_fingerprints, [], [], method="foo")
+
     def test_symmetries(self):
         cases = self.iter_cases()
         for case in cases:
@@ -654,6 +733,24 @@ class GraphTestCase(unittest.TestCase):
         for bs in collection.values():
             self.assertEqual(len(bs), 3)
 
+    def test_pruned_backend(self):
+        def get_matches(pattern, graph, backend):
+            result = set([])
+            for match in GraphSearch(pattern, backend=backend)(graph):
+                result.add((frozenset(match.forward.items()), getattr(match, "ring_vertices", None)))
+            return result
+        for case in self.iter_cases():
+            patterns = [RingPattern(10)]
+            if len(case.graph.independent_vertices) == 1:
+                patterns.append(CustomPattern(case.graph))
+                patterns.append(EqualPattern(case.graph))
+            for pattern in patterns:
+                self.assertEqual(
+                    get_matches(pattern, case.graph, "combine"),
+                    get_matches(pattern, case.graph, "pruned"),
+                )
+        self.assertRaises(ValueError, GraphSearch, RingPattern(10), backend="foo")
+
     def test_rings_zeolite(self):
         cases = [
             ("opt_5ring10T.xyz", (10, 10, 12)),
@@ -25,6 +25,7 @@
 from __future__ import division
 
 from builtins import range
+from nose.tools import assert_raises
 import numpy as np
 import pkg_resources
 
@@ -249,3 +250,127 @@ def test_opbend_ethene():
         ]
         assert abs(ic.opbend_cos([c[0], c[5], c[4], c[3]])[0] - np.cos(angle)) < 1e-5
         assert abs(ic.opbend_angle([c[0], c[5], c[4], c[3]])[0] - angle) < 1e-5
+
+
+def check_batch_ic(icfn, icfn_batch, iterp):
+    rs = np.array(list(iterp()), float)
+    for deriv in 0, 1, 2:
+        results = icfn_batch(rs, deriv)
+        assert len(results) == deriv + 1
+        for i in range(len(rs)):
+            expected = icfn(rs[i], deriv)
+            for result, single in zip(results, expected):
+                # The batch must reproduce the single results exactly.
+                assert (result[i] == single).all()
+    # The same through an index array.
+    coordinates = rs.reshape(-1, 3)
+    indexes = np.arange(len(coordinates)).reshape(rs.shape[:2])[::-1]
+    results = icfn_batch(coordinates, 2, indexes=indexes)
+    for i in range(len(rs)):
+        expected = icfn(rs[::-1][i], 2)
+        for result, single in zip(results, expected):
+            assert (result[i] == single).all()
+
+
+def test_batch_bond():
+    check_batch_ic(ic.bond_length, ic.bond_length_batch, iter_bonds)
+
+
+def test_batch_bend():
+    check_batch_ic(ic.bend_cos, ic.bend_cos_batch, iter_bends)
+    check_batch_ic(ic.bend_angle, ic.bend_angle_batch, iter_bends)
+
+
+def test_batch_dihed():
+    check_batch_ic(ic.dihed_cos, ic.dihed_cos_batch, iter_diheds)
+    check_batch_ic(ic.dihed_angle, ic.dihed_angle_batch, iter_diheds)
+    # Includes dihedrals with a cosine of -1 and +1.
+    check_batch_ic(ic.dihed_angle, ic.dihed_angle_batch, iter_diheds_special)
+
+
+def test_batch_opbend():
+    check_batch_ic(ic.opbend_dist, ic.opbend_dist_batch, iter_diheds)
+    check_batch_ic(ic.opbend_cos, ic.opbend_cos_batch, iter_diheds)
+    check_batch_ic(ic.opbend_angle, ic.opbend_angle_batch, iter_diheds)
+    check_batch_ic(ic.opbend_mcos, ic.opbend_mcos_batch, iter_diheds)
+    check_batch_ic(ic.opbend_mangle, ic.opbend_mangle_batch, iter_diheds)
+
+
+def test_batch_errors():
+    with assert_raises(TypeError):
+        ic.bond_length_batch(np.zeros((5, 3, 3)))
+    with assert_raises(ValueError):
+        ic.bond_length_batch(np.zeros((5, 2, 3)), 3)
+
+
+def test_batch_empty():
+    v, d, dd = ic.dihed_angle_batch(np.zeros((0, 4, 3)), 2)
+    assert v.shape == (0,)
+    assert d.shape == (0, 4, 3)
+    assert dd.shape == (0, 4, 3, 4, 3)
+
+
+def test_degenerate():
+    collinear = np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0], [2.0, 0.0, 0.0], [3.0, 0.0, 1.0]])
+    for deriv in 0, 1, 2:
+        with assert_raises(FloatingPointError):
+            ic.dihed_angle(collinear, deriv)
+        with assert_raises(FloatingPointError):
+            ic.dihed_cos(collinear, deriv)
+        with assert_raises(FloatingPointError):
+            ic.bend_angle(np.array([[1.0, 0.0, 0.0], [1.0, 0.0, 0.0], [0.0, 0.0, 1.0]]), deriv)
+        with assert_raises(FloatingPointError):
+            ic.opbend_angle(collinear, deriv)
+        # A single degenerate set spoils the whole batch.
+        rs = np.array([collinear, collinear + [[0.0, 0.5, 0.0], [0.0, 0.0, 0.0], [0.0, 0.0, 0.0], [0.0, 0.0, 0.0]]])
+        with assert_raises(FloatingPointError):
+            ic.dihed_angle_batch(rs[::-1], deriv)
+        ic.dihed_angle_batch(rs[1:], deriv)
+
+
+def py_bend_cos(rs, deriv):
+    """Reference implementation with the Scalar and Vector3 classes"""
+    r0, r1, r2 = [ic.Vector3(9, deriv, rs[i], (3*i, 3*i+1, 3*i+2)) for i in range(3)]
+    r0 -= r1
+    r2 -= r1
+    r0 /= r0.norm()
+    r2 /= r2.norm()
+    return ic.dot(r0, r2).results()
+
+
+def py_opbend_dist(rs, deriv):
+    """Reference implementation with the Scalar and Vector3 classes"""
+    r0, r1, r2, r3 = [ic.Vector3(12, deriv, rs[i], (3*i, 3*i+1, 3*i+2)) for i in range(4)]
+    r1 -= r0
+    r2 -= r0
+    r3 -= r0
+    n = ic.cross(r1, r2)
+    n /= n.norm()
+    return ic.dot(r3, n).results()
+
+
+def check_python_engine(icfn, py_icfn, iterp):
+    # The compiled code and the pure python classes must agree.
+    for rs in iterp():
+        for deriv in 0, 1, 2:
+            results = icfn(rs, deriv)
+            expected = py_icfn(rs, deriv)
+            for result, reference in zip(results, expected):
+                result = np.asarray(result).ravel()
+                reference = np.asarray(reference).ravel()
+                assert abs(result - reference).max() < 1e-12*max(1, abs(reference).max())
+
+
+def test_python_engine_bend_cos():
+    check_python_engine(ic.bend_cos, py_bend_cos, iter_bends)
+
+
+def test_python_engine_opbend_dist():
+    check_python_engine(ic.opbend_dist, py_opbend_dist, iter_diheds)
+
+
+def test_slots():
+    with assert_raises(AttributeError):
+        ic.Scalar(3).foo = 1
+    with assert_raises(AttributeError):
+        ic.Vector3(3).foo = 1
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+# MolMod is a collection of molecular modelling tools for python.
+# Copyright (C) 2007 - 2019 Toon Verstraelen <Toon.Verstraelen@UGent.be>, Center
+# for Molecular Modeling (CMM), Ghent University, Ghent, Belgium; all rights
+# reserved unless otherwise stated.
+#
+# This file is part of MolMod.
+#
+# MolMod is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# MolMod is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+
+
+from __future__ import division
+
+from builtins import range
+from nose.tools import assert_raises
+import numpy as np
+import pkg_resources
+
+import molmod.ic as ic
+from molmod import *
+
+
+def load_molecule(fn):
+    molecule = Molecule.from_file(pkg_resources.resource_filename("molmod", "data/test/" + fn))
+    molecule.set_default_graph()
+    return molecule
+
+
+def test_csr_matrix():
+    rows = [0, 2, 2, 0, 3, 2]
+    cols = [1, 0, 3, 1, 3, 0]
+    values = [1.0, 2.0, 3.0, 4.0, 5.0, 6.0]
+    matrix = CSRMatrix.from_coo((5, 4), rows, cols, values)
+    dense = np.zeros((5, 4))
+    np.add.at(dense, (rows, cols), values)
+    assert matrix.nnz == 4
+    assert (matrix.toarray() == dense).all()
+    assert (matrix.T.toarray() == dense.T).all()
+    x = np.random.normal(0, 1, 4)
+    assert abs(matrix.dot(x) - dense.dot(x)).max() < 1e-14
+    y = np.random.normal(0, 1, (5, 3))
+    assert abs(matrix.tdot(y) - dense.T.dot(y)).max() < 1e-14
+    with assert_raises(TypeError):
+        matrix.dot(y)
+
+
+def test_csr_matrix_from_blocks():
+    rows = np.array([2, 0, 2, 3, 0])
+    cols = np.array([1, 2, 1, 0, 0])
+    blocks = np.random.normal(0, 1, (5, 2, 3))
+    matrix = CSRMatrix.from_blocks((5, 3), rows, cols, blocks)
+    dense = np.zeros((5, 2, 3, 3))
+    for row, col, block in zip(rows, cols, blocks):
+        dense[row, :, col, :] += block
+    dense = dense.reshape(10, 9)
+    assert matrix.shape == (10, 9)
+    assert matrix.nnz == 4*6
+    assert abs(matrix.toarray() - dense).max() < 1e-14
+    coo_rows, coo_cols = dense.nonzero()
+    reference = CSRMatrix.from_coo(dense.shape, coo_rows, coo_cols, dense[coo_rows, coo_cols])
+    assert (matrix.indptr == reference.indptr).all()
+    assert (matrix.indices == reference.indices).all()
+    empty = CSRMatrix.from_blocks((2, 2), [], [], np.zeros((0, 3, 3)))
+    assert empty.shape == (6, 6)
+    assert (empty.toarray() == 0).all()
+
+
+def test_from_graph_water():
+    molecule = load_molecule("water.xyz")
+    ics = InternalCoordinates.from_graph(molecule.graph)
+    assert ics.size == 3
+    labels = list(ics.iter_labels())
+    assert [name for name, indexes in labels] == ["bond_length", "bond_length", "bend_angle"]
+    assert labels[2][1][1] == 0
+    ics = InternalCoordinates.from_graph(molecule.graph, bends=False)
+    assert ics.size == 2
+
+
+def test_from_graph_ethene():
+    molecule = load_molecule("ethene.xyz")
+    ics = InternalCoordinates.from_graph(molecule.graph)
+    sizes = dict((name, len(indexes)) for name, fn_batch, indexes in ics.terms)
+    assert sizes == {"bond_length": 5, "bend_angle": 6, "dihed_angle": 4, "opbend_angle": 2}
+
+
+def test_errors():
+    with assert_raises(ValueError):
+        InternalCoordinates(3, [("foo", [[0, 1]])])
+    with assert_raises(ValueError):
+        InternalCoordinates(3, [("bond_length", [[0, 3]])])
+    ics = InternalCoordinates(3, [("bond_length", [[0, 1]])])
+    with assert_raises(TypeError):
+        ics.compute(np.zeros((4, 3)))
+    with assert_raises(ValueError):
+        ics.compute(np.zeros((3, 3)), 3)
+
+
+def check_bmatrix(molecule):
+    ics = InternalCoordinates.from_graph(molecule.graph)
+    values, bmatrix, bderiv = ics.compute(molecule.coordinates, 2)
+    assert bmatrix.shape == (ics.size, molecule.size*3)
+    assert bderiv.shape == (ics.size, (molecule.size*3)**2)
+    bdense = bmatrix.toarray()
+    for i, (name, indexes) in enumerate(ics.iter_labels()):
+        indexes = list(indexes)
+        value, gradient, hessian = getattr(ic, name)(molecule.coordinates[indexes], 2)
+        assert value == values[i]
+        expected = np.zeros((molecule.size, 3))
+        expected[indexes] = gradient
+        assert (bdense[i] == expected.ravel()).all()
+        row = slice(bderiv.indptr[i], bderiv.indptr[i+1])
+        expected = np.zeros((molecule.size, 3, molecule.size, 3))
+        expected[np.ix_(indexes, range(3), indexes, range(3))] = hessian
+        actual = np.zeros(expected.size)
+        actual[bderiv.indices[row]] = bderiv.data[row]
+        assert (actual == expected.ravel()).all()
+
+
+def test_bmatrix_tpa():
+    check_bmatrix(load_molecule("tpa.xyz"))
+
+
+def test_bmatrix_ethene():
+    check_bmatrix(load_molecule("ethene.xyz"))
+
+
+def test_hessian_to_cartesian_tpa():
+    # Compare with finite differences of the Cartesian gradient of a
+    # quadratic function of the internal coordinates.
+    molecule = load_molecule("tpa.xyz")
+    ics = InternalCoordinates.from_graph(molecule.graph)
+    values0, bmatrix, bderiv = ics.compute(molecule.coordinates, 2)
+    periodic = np.array([name == "dihed_angle" for name, indexes in ics.iter_labels()])
+    gradient_ic = np.random.normal(0, 1, ics.size)
+    hessian_ic = np.random.normal(0, 1, (ics.size, ics.size))
+    hessian_ic += hessian_ic.T
+
+    def fn_gradient(x):
+        values, bmatrix = ics.compute(x.reshape(-1, 3), 1)
+        delta = values - values0
+        delta[periodic] = (delta[periodic] + np.pi) % (2*np.pi) - np.pi
+        return ics.gradient_to_cartesian(gradient_ic + hessian_ic.dot(delta), bmatrix).ravel()
+
+    hessian = ics.hessian_to_cartesian(hessian_ic, gradient_ic, bmatrix, bderiv)
+    x0 = molecule.coordinates.ravel()
+    eps = 1e-6
+    for i in range(0, len(x0), 7):
+        dx = np.zeros(len(x0))
+        dx[i] = eps
+        column = (fn_gradient(x0 + dx) - fn_gradient(x0 - dx))/(2*eps)
+        assert abs(column - hessian[:, i]).max() < 1e-6*abs(hessian).max()
+
+
+def test_roundtrip_water():
+    # For non-redundant internal coordinates, the transformations to Cartesian
+    # coordinates can be inverted.
+    molecule = load_molecule("water.xyz")
+    ics = InternalCoordinates.from_graph(molecule.graph)
+    values, bmatrix, bderiv = ics.compute(molecule.coordinates, 2)
+    gradient_ic = np.array([0.1, -0.2, 0.3])
+    hessian_ic = np.array([[1.0, 0.4, 0.1], [0.4, 2.0, -0.2], [0.1, -0.2, 3.0]])
+    gradient = ics.gradient_to_cartesian(gradient_ic, bmatrix)
+    assert gradient.shape == (3, 3)
+    assert abs(ics.gradient_to_internal(gradient, bmatrix) - gradient_ic).max() < 1e-10
+    hessian = ics.hessian_to_cartesian(hessian_ic, gradient_ic, bmatrix, bderiv)
+    assert hessian.shape == (9, 9)
+    assert abs(hessian - hessian.T).max() < 1e-10
+    hessian_ic_bis = ics.hessian_to_internal(hessian, gradient_ic, bmatrix, bderiv)
+    assert abs(hessian_ic_bis - hessian_ic).max() < 1e-8
+
+
+def test_gradient_to_internal_redundant():
+    molecule = load_molecule("tpa.xyz")
+    ics = InternalCoordinates.from_graph(molecule.graph)
+    values, bmatrix = ics.compute(molecule.coordinates, 1)
+    gradient = np.random.normal(0, 1, (molecule.size, 3))
+    gradient_ic = ics.gradient_to_internal(gradient, bmatrix)
+    # The part of the gradient in the range of B^T is reproduced.
+    error = bmatrix.dot(ics.gradient_to_cartesian(gradient_ic, bmatrix).ravel()) - \
+        bmatrix.dot(gradient.ravel())
+    assert abs(error).max() < 1e-8*abs(bmatrix.dot(gradient.ravel())).max()
+
+
+def test_solve_gram_not_converged():
+    molecule = load_molecule("tpa.xyz")
+    ics = InternalCoordinates.from_graph(molecule.graph)
+    values, bmatrix = ics.compute(molecule.coordinates, 1)
+    rhs = bmatrix.dot(np.random.normal(0, 1, 3*molecule.size))
+    with assert_raises(RuntimeError):
+        ics._solve_gram(bmatrix, rhs, maxiter=2)
+    x = ics._solve_gram(bmatrix, rhs)
+    assert abs(bmatrix.dot(bmatrix.tdot(x)) - rhs).max() < 1e-8*abs(rhs).max()
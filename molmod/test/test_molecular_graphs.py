@@ -30,6 +30,9 @@ from nose.plugins.skip import SkipTest
 import pkg_resources
 
 from molmod import *
+from molmod.io import XYZReader, XYZWriter, LAMMPSDumpReader
+from molmod.test.common import tmpdir
+from molmod.bonds import bonds
 
 
 __all__ = ["MolecularGraphTestCase"]
@@ -339,6 +342,24 @@ class MolecularGraphTestCase(unittest.TestCase):
 
             self.verify_graph_search(molecule.graph, expected_results, test_results, iter_alternatives)
 
+    def test_pruned_backend(self):
+        molecule = self.load_molecule("precursor.xyz")
+        patterns = [
+            DihedralAnglePattern([CriteriaSet(tag="all")]),
+            OutOfPlanePattern([CriteriaSet(tag="all")]),
+            NRingPattern(10, [CriteriaSet(tag="all")], strong=True),
+        ]
+        for pattern in patterns:
+            results = []
+            for backend in "combine", "pruned":
+                graph_search = GraphSearch(pattern, backend=backend)
+                results.append(set(
+                    tuple(match.get_destination(index) for index in range(len(match)))
+                    for match in graph_search(molecule.graph)
+                ))
+            self.assert_(len(results[0]) > 0)
+            self.assertEqual(results[0], results[1])
+
     # test other molecular graph stuff
 
     def test_multiply(self):
@@ -364,6 +385,83 @@ class MolecularGraphTestCase(unittest.TestCase):
             self.assertEqual(check.orders.shape,check_orders.shape)
             self.assert_((check.orders==check_orders).all())
 
+    def test_from_geometry_orders(self):
+        for molecule in self.iter_molecules(allow_multi=True):
+            graph = MolecularGraph.from_geometry(molecule, do_orders=True)
+            self.assertEqual(graph.edges, MolecularGraph.from_geometry(molecule).edges)
+            self.assertEqual(graph.symbols, molecule.symbols)
+            for (i, j), order, length in zip(graph.edges, graph.orders, graph.bond_lengths):
+                self.assertEqual(order, bonds.bonded(molecule.numbers[i], molecule.numbers[j], length))
+
+    def test_iter_from_trajectory(self):
+        from io import StringIO
+        molecule = self.load_molecule("butane.xyz")
+        f = StringIO()
+        writer = XYZWriter(f, molecule.symbols)
+        # stretch the first bond a little further in each frame
+        i0, i1 = molecule.graph.edges[0]
+        direction = molecule.coordinates[i1] - molecule.coordinates[i0]
+        frames = []
+        for i in range(6):
+            coordinates = molecule.coordinates.copy()
+            coordinates[i1] += 0.3*i*direction
+            writer.dump("frame %i" % i, coordinates)
+            frames.append(molecule.copy_with(coordinates=coordinates))
+        for workers in 1, 2:
+            f.seek(0)
+            graphs = list(MolecularGraph.iter_from_trajectory(XYZReader(f), workers, chunksize=2))
+            self.assertEqual(len(graphs), len(frames))
+            for graph, frame in zip(graphs, frames):
+                expected = MolecularGraph.from_geometry(frame)
+                self.assertEqual(graph.edges, expected.edges)
+                self.assert_((graph.numbers == molecule.numbers).all())
+                self.assert_(abs(graph.bond_lengths - expected.bond_lengths).max() < 1e-10)
+            f.seek(0)
+            changes = list(MolecularGraph.iter_from_trajectory(
+                XYZReader(f), workers, changes=True, chunksize=2))
+            self.assertEqual(changes[0][0], 0)
+            self.assertEqual(changes[0][2], frozenset(molecule.graph.edges))
+            self.assertEqual(len(changes[0][3]), 0)
+            self.assertEqual(len(changes), 2)
+            index, graph, added, removed = changes[1]
+            self.assertEqual(removed, frozenset([frozenset([i0, i1])]))
+            self.assertEqual(graph.edges, graphs[index].edges)
+
+    def test_iter_from_trajectory_lammps(self):
+        fn = pkg_resources.resource_filename("molmod", "data/test/lammps_dump.txt")
+        units = [angstrom]*3 + [angstrom/femtosecond]*3
+        numbers = np.ones(26, int)
+        # The frames of a LAMMPS dump file contain no (N, 3) coordinate array.
+        graphs = MolecularGraph.iter_from_trajectory(LAMMPSDumpReader(fn, units), numbers=numbers)
+        with self.assertRaises(TypeError) as cm:
+            next(graphs)
+        self.assertIn("get_molecule", str(cm.exception))
+        graphs = MolecularGraph.iter_from_trajectory(LAMMPSDumpReader(fn, units))
+        with self.assertRaises(TypeError) as cm:
+            next(graphs)
+        self.assertIn("get_molecule", str(cm.exception))
+        # It works when the conversion to a molecule is given.
+        def get_molecule(frame):
+            return Molecule(numbers, np.array(frame[1:4]).T)
+        graphs = list(MolecularGraph.iter_from_trajectory(
+            LAMMPSDumpReader(fn, units), get_molecule=get_molecule))
+        frames = list(LAMMPSDumpReader(fn, units))
+        self.assertEqual(len(graphs), len(frames))
+        for graph, frame in zip(graphs, frames):
+            expected = MolecularGraph.from_geometry(get_molecule(frame))
+            self.assertEqual(graph.edges, expected.edges)
+        # With named columns, the reader finds the coordinates.
+        with open(fn) as f:
+            text = f.read().replace("ITEM: ATOMS\n", "ITEM: ATOMS id x y z vx vy vz\n")
+        with tmpdir(__name__, 'test_iter_from_trajectory_lammps') as dn:
+            fn_named = "%s/dump.txt" % dn
+            with open(fn_named, "w") as f:
+                f.write(text)
+            columns = ["x", "y", "z", "vx", "vy", "vz"]
+            graphs2 = list(MolecularGraph.iter_from_trajectory(
+                LAMMPSDumpReader(fn_named, units, columns=columns), numbers=numbers))
+        self.assertEqual([graph.edges for graph in graphs2], [graph.edges for graph in graphs])
+
     def test_fingerprints(self):
         for mol in self.iter_molecules():
             g0 = mol.graph
@@ -33,7 +33,7 @@ from molmod.test.common import BaseTestCase
 from molmod import *
 
 
-__all__ = ["PairFFTestCase", "CoulombFFTestCase"]
+__all__ = ["PairFFTestCase", "CoulombFFTestCase", "SparsePairFFTestCase"]
 
 
 class Debug1FF(PairFF):
@@ -80,6 +80,27 @@ class Debug4FF(PairFF):
         yield 2, np.array([[2, 0, 0], [0, 0, 0], [0, 0, 0]], float)
 
 
+class Debug5FF(Debug1FF):
+    # An extra term only for the pairs with the last atom.
+    def yield_pair_energies(self, index1, index2):
+        for result in Debug1FF.yield_pair_energies(self, index1, index2):
+            yield result
+        if index1 == 2 or index2 == 2:
+            yield 1, sum((self.coordinates[index1] - self.coordinates[index2])**2)
+
+    def yield_pair_gradients(self, index1, index2):
+        for result in Debug1FF.yield_pair_gradients(self, index1, index2):
+            yield result
+        if index1 == 2 or index2 == 2:
+            yield 0, 2*(self.coordinates[index1] - self.coordinates[index2])
+
+    def yield_pair_hessians(self, index1, index2):
+        for result in Debug1FF.yield_pair_hessians(self, index1, index2):
+            yield result
+        if index1 == 2 or index2 == 2:
+            yield 0, 2*np.identity(3, float)
+
+
 class PairFFTestCase(unittest.TestCase):
     def make_coulombff(self, do_charges, do_dipoles):
         coordinates = np.array([
@@ -245,6 +266,51 @@ class PairFFTestCase(unittest.TestCase):
     def test_debug4ff(self):
         self.check_ff(self.make_debug4ff())
 
+    def test_debug5ff(self):
+        # The pairs yield a different number of terms.
+        ff = self.make_debug1ff()
+        ff = Debug5FF(ff.scaling, ff.coordinates)
+        expected = 0.0
+        for atom1 in range(ff.numc):
+            for atom2 in range(atom1):
+                for s, v in ff.yield_pair_energies(atom1, atom2):
+                    expected += ff.scaling[atom1, atom2]*s*v
+        self.assertAlmostEqual(ff.energy(), expected, 12)
+        self.check_ff(ff)
+
+    def check_vectorized(self, ff):
+        # compare with the evaluation of one pair at a time
+        energy = ff.energy()
+        gradient = ff.gradient()
+        hessian = ff.hessian()
+        ff.vectorized = False
+        self.assertAlmostEqual(energy, ff.energy(), 12)
+        self.assertTrue(abs(gradient - ff.gradient()).max() < 1e-12)
+        self.assertTrue(abs(hessian - ff.hessian()).max() < 1e-12)
+        for atom1 in range(ff.numc):
+            self.assertTrue(abs(gradient[atom1] - ff.gradient_component(atom1)).max() < 1e-12)
+            for atom2 in range(ff.numc):
+                self.assertTrue(abs(hessian[atom1, :, atom2] - ff.hessian_component(atom1, atom2)).max() < 1e-12)
+
+    def test_vectorized_coulombff(self):
+        self.check_vectorized(self.make_coulombff(do_charges=True,  do_dipoles=True))
+
+    def test_vectorized_dispersionff(self):
+        self.check_vectorized(self.make_dispersionff())
+
+    def test_vectorized_pauliff(self):
+        self.check_vectorized(self.make_pauliff())
+
+    def test_vectorized_exprepff(self):
+        self.check_vectorized(self.make_exprepff())
+
+    def test_no_pairs(self):
+        ff = self.make_dispersionff()
+        ff.scaling[:] = 0
+        self.assertEqual(ff.energy(), 0.0)
+        self.assertTrue((ff.gradient() == 0).all())
+        self.assertTrue((ff.hessian() == 0).all())
+
     def check_ff(self, ff):
         coordinates = ff.coordinates
         numc = len(coordinates)
@@ -533,3 +599,118 @@ class CoulombFFTestCase(BaseTestCase):
         ff2 = CoulombFF(scaling, charges=charges, dipoles=dipoles, coordinates=coordinates)
         self.assertArraysAlmostEqual(ff1.gradient()[0], -ff1.efield()[0])
         self.assertArraysAlmostEqual(ff1.gradient()[0], -ff2.efield_point(point))
+
+
+class SparsePairFFTestCase(BaseTestCase):
+    def test_pair_array(self):
+        values = np.array([[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]])
+        a = PairArray(4, np.array([2, 1]), np.array([0, 3]), values, antisymmetric=True)
+        self.assertArraysAlmostEqual(a[2, 0], values[0])
+        self.assertArraysAlmostEqual(a[0, 2], -values[0])
+        self.assertArraysAlmostEqual(a[[3, 1, 2], [1, 3, 0]], np.array([-values[1], values[1], values[0]]))
+        self.assertTrue(a[a.index1, a.index2] is a.values)
+        self.assertRaises(KeyError, a.__getitem__, (1, 2))
+        s = PairArray(4, [2], [0], [0.5], default=1.0)
+        self.assertEqual(s[0, 2], 0.5)
+        self.assertEqual(s[1, 2], 1.0)
+        self.assertArraysAlmostEqual(s[np.array([3, 2]), np.array([1, 0])], np.array([1.0, 0.5]))
+
+    def test_pair_array_from_graph(self):
+        graph = Graph([(0, 1), (1, 2), (2, 3), (3, 4)])
+        scaling = PairArray.from_graph(graph, [0.0, 0.2, 0.5])
+        self.assertEqual(scaling[1, 0], 0.0)
+        self.assertEqual(scaling[0, 2], 0.2)
+        self.assertEqual(scaling[3, 0], 0.5)
+        self.assertEqual(scaling[0, 4], 1.0)
+
+    def test_type_pair_array(self):
+        table = np.array([[1.0, 2.0], [2.0, 3.0]])
+        a = TypePairArray([0, 1, 1], table)
+        self.assertEqual(a[0, 2], 2.0)
+        self.assertArraysAlmostEqual(a[np.array([1, 0]), np.array([2, 0])], np.array([3.0, 1.0]))
+
+    def make_exprepff(self, sparse, unit_cell=None, cutoff=20.0):
+        coordinates = np.array([
+            [ 0.5, 2.5, 0.1],
+            [-1.2, 0.4, 0.3],
+            [ 0.3, 0.9, 0.7],
+            [ 1.1, 0.2, -0.5],
+            [-0.4, 1.6, 1.2],
+        ], float)
+        types = np.array([0, 1, 1, 2, 0])
+        As = np.array([[0.3, 0.5, 0.8], [0.5, 0.2, 0.4], [0.8, 0.4, 0.6]])
+        Bs = np.array([[0.5, 0.6, 0.7], [0.6, 0.8, 0.9], [0.7, 0.9, 1.0]])
+        graph = Graph([(0, 1), (1, 2), (2, 3)], 5)
+        if sparse:
+            scaling = PairArray.from_graph(graph, [0.0, 0.5])
+            return ExpRepFF(
+                scaling, TypePairArray(types, As), TypePairArray(types, Bs),
+                coordinates, VerletList(cutoff, 0.5, unit_cell))
+        else:
+            scaling = np.ones((5, 5), float)
+            pairs, distances = graph.distances_within(2)
+            scaling[pairs[:, 0], pairs[:, 1]] = np.array([0.0, 0.5])[distances - 1]
+            scaling[pairs[:, 1], pairs[:, 0]] = np.array([0.0, 0.5])[distances - 1]
+            return ExpRepFF(
+                scaling, As[types][:, types], Bs[types][:, types], coordinates)
+
+    def test_sparse_dense(self):
+        ff1 = self.make_exprepff(False)
+        ff2 = self.make_exprepff(True)
+        self.assertAlmostEqual(ff1.energy(), ff2.energy(), 12)
+        self.assertArraysAlmostEqual(ff1.gradient(), ff2.gradient(), 1e-12, doabs=True)
+        self.assertArraysAlmostEqual(ff1.hessian(), ff2.hessian(), 1e-12, doabs=True)
+        self.assertArraysAlmostEqual(ff1.hessian_flat(), ff2.hessian_sparse().toarray(), 1e-12, doabs=True)
+        self.assertArraysAlmostEqual(ff1.hessian_flat(), ff1.hessian_sparse().toarray(), 1e-12, doabs=True)
+        for atom1 in range(5):
+            self.assertArraysAlmostEqual(ff1.gradient_component(atom1), ff2.gradient_component(atom1), 1e-12, doabs=True)
+            for atom2 in range(5):
+                self.assertArraysAlmostEqual(
+                    ff1.hessian_component(atom1, atom2),
+                    ff2.hessian_component(atom1, atom2), 1e-12, doabs=True)
+
+    def check_derivatives(self, ff):
+        coordinates = ff.coordinates.copy()
+        gradient = ff.gradient()
+        hessian = ff.hessian_sparse().toarray()
+        eps = 1e-6
+        for index in range(coordinates.size):
+            tmp = coordinates.copy()
+            tmp.flat[index] += 0.5*eps
+            ff.update_coordinates(tmp)
+            energy_plus = ff.energy()
+            gradient_plus = ff.gradient_flat()
+            tmp.flat[index] -= eps
+            ff.update_coordinates(tmp)
+            energy_min = ff.energy()
+            gradient_min = ff.gradient_flat()
+            self.assertAlmostEqual(gradient.flat[index], (energy_plus - energy_min)/eps, 6)
+            self.assertArraysAlmostEqual(hessian[index], (gradient_plus - gradient_min)/eps, 1e-6, doabs=True)
+        ff.update_coordinates(coordinates)
+
+    def test_sparse_derivatives(self):
+        self.check_derivatives(self.make_exprepff(True, cutoff=2.0))
+
+    def test_sparse_cutoff(self):
+        ff = self.make_exprepff(True, cutoff=2.0)
+        self.assertEqual(set(zip(*ff.pairs)), set([(2, 0), (4, 0), (4, 1), (4, 2)]))
+
+    def test_sparse_periodic(self):
+        unit_cell = UnitCell(np.identity(3, float)*3.0)
+        ff = self.make_exprepff(True, unit_cell, 1.4)
+        coordinates = ff.coordinates
+        pairs = set(zip(*ff.pairs))
+        energy = 0.0
+        for index1 in range(5):
+            for index2 in range(index1):
+                delta = unit_cell.shortest_vector(coordinates[index1] - coordinates[index2])
+                distance = np.linalg.norm(delta)
+                if distance < 1.4 and ff.scaling[index1, index2] > 0:
+                    self.assertTrue((index1, index2) in pairs)
+                    self.assertArraysAlmostEqual(ff.deltas[index1, index2], delta, 1e-12, doabs=True)
+                    A = ff.As[index1, index2]
+                    B = ff.Bs[index1, index2]
+                    energy += A*np.exp(-B*distance)*ff.scaling[index1, index2]
+        self.assertEqual(len(pairs), 3)
+        self.assertAlmostEqual(ff.energy(), energy, 12)
+        self.check_derivatives(ff)
@@ -84,12 +84,13 @@ setup(
     zip_safe=False,
     ext_modules=[Extension(
         "molmod.ext",
-        sources=["molmod/ext.pyx", "molmod/common.c", "molmod/ff.c",
-                 "molmod/graphs.c", "molmod/similarity.c", "molmod/molecules.c",
-                 "molmod/unit_cells.c"],
-        depends=["molmod/common.h", "molmod/ff.h", "molmod/ff.pxd", "molmod/graphs.h",
-                 "molmod/graphs.pxd", "molmod/similarity.h", "molmod/similarity.pxd",
-                 "molmod/molecules.h", "molmod/molecules.pxd", "molmod/unit_cells.h",
+        sources=["molmod/ext.pyx", "molmod/binning.c", "molmod/common.c", "molmod/ff.c",
+                 "molmod/graphs.c", "molmod/ic.c", "molmod/similarity.c", "molmod/molecules.c",
+                 "molmod/parsing.c", "molmod/unit_cells.c"],
+        depends=["molmod/binning.h", "molmod/binning.pxd", "molmod/common.h", "molmod/ff.h", "molmod/ff.pxd", "molmod/graphs.h",
+                 "molmod/graphs.pxd", "molmod/ic.h", "molmod/ic.pxd", "molmod/similarity.h", "molmod/similarity.pxd",
+                 "molmod/molecules.h", "molmod/molecules.pxd", "molmod/parsing.h",
+                 "molmod/parsing.pxd", "molmod/unit_cells.h",
                  "molmod/unit_cells.pxd"],
         include_dirs=[np.get_include()],
     )],